@@ -80,6 +80,10 @@ else:
         "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
     }
 
+# Optional in-memory bitmap index for speech searches (see speechdb/bitmap.py);
+#   each worker holds a copy, rebuilt when the data changes
+SPEECH_BITMAP_INDEX = os.getenv('DICES_BITMAP_INDEX', 'False').lower() in ('true', '1', 'yes')
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -104,6 +108,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'speechdb.generation.GenerationMiddleware',
 ]
 
 ROOT_URLCONF = 'dices.urls'
@@ -194,7 +199,7 @@ if not DEBUG:
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticatedOrReadOnly'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'speechdb.pagination.APIPagination',
     'PAGE_SIZE': 200,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_SCHEMA_CLASS': 'speechdb.schema.PublicReadAutoSchema',
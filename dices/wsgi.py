@@ -15,3 +15,9 @@ load_dotenv(verbose=True)
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dices.settings')
 
 application = get_wsgi_application()
+
+# load the optional speech bitmap index before the first request
+from django.conf import settings
+if settings.SPEECH_BITMAP_INDEX:
+    from speechdb.bitmap import get_index
+    get_index()
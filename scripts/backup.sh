@@ -15,7 +15,7 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 PROJECT_DIR="$(dirname "$SCRIPT_DIR")"
 BACKUP_DIR="${PROJECT_DIR}/backups"
 LOG_FILE="/var/log/dices_backup.log"
-KEEP_BACKUPS=30  # Keep last 30 backups
+KEEP_BACKUPS=30  # Keep last 30 backups (chunks they share are stored once)
 
 # Email notification (optional - set to your email)
 NOTIFY_EMAIL=""
@@ -65,16 +65,18 @@ log "Running backup command"
 python manage.py backup_db \
     --backup-dir="$BACKUP_DIR" \
     --format=pg_dump \
+    --chunked \
     --keep-last=$KEEP_BACKUPS
 
 # Check if backup was created
-LATEST_BACKUP=$(ls -t "$BACKUP_DIR"/dices_db_*.sql.gz 2>/dev/null | head -1)
+LATEST_BACKUP=$(ls -t "$BACKUP_DIR"/dices_db_*.manifest.json 2>/dev/null | head -1)
 if [ -n "$LATEST_BACKUP" ]; then
-    BACKUP_SIZE=$(du -h "$LATEST_BACKUP" | cut -f1)
-    log "Backup completed successfully: $(basename "$LATEST_BACKUP") ($BACKUP_SIZE)"
+    STORE_SIZE=$(du -sh "$BACKUP_DIR/chunks" | cut -f1)
+    log "Backup completed successfully: $(basename "$LATEST_BACKUP") (chunk store $STORE_SIZE)"
 
-    # Verify backup integrity (quick check)
-    if gunzip -t "$LATEST_BACKUP" 2>/dev/null; then
+    # Verify backup integrity: every chunk present, and the whole matching
+    #   its checksum
+    if python manage.py backup_db --backup-dir="$BACKUP_DIR" --verify "$LATEST_BACKUP" >/dev/null 2>&1; then
         log "Backup integrity verified"
     else
         log "WARNING: Backup integrity check failed!"
@@ -91,11 +93,14 @@ fi
 # Optional: Copy to off-site storage
 # Uncomment and configure for your storage solution
 
+# (copy the manifests and the chunks/ directory; chunks already copied
+#   never change, so sync tools only send the new ones)
+
 # AWS S3 example:
-# aws s3 cp "$LATEST_BACKUP" s3://your-bucket/dices-backups/
+# aws s3 sync "$BACKUP_DIR" s3://your-bucket/dices-backups/
 
 # rsync to another server example:
-# rsync -avz "$LATEST_BACKUP" user@backup-server:/backups/dices/
+# rsync -avz "$BACKUP_DIR"/ user@backup-server:/backups/dices/
 
 log "Backup process completed"
 
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class SpeechdbConfig(AppConfig):
     name = 'speechdb'
+
+    def ready(self):
+        from . import signals
+        signals.connect()
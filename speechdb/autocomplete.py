@@ -0,0 +1,111 @@
+'''In-memory prefix index for the search form's name dropdowns
+
+    Rather than rendering every character, instance, author and title into
+    each search page, the dropdowns (forms.AutocompleteSelectMultiple) ask
+    the autocomplete view for suggestions as the user types. Suggestions
+    come from a prefix trie per field, over the same values the form
+    fields validate against.
+
+    Keys are normalized so that a search need not match the stored
+    spelling: accents and case are dropped, Greek script is transliterated,
+    and the usual Greek and Latin transliterations are folded together
+    ("Akhilleus", "Achilleus" and "Ἀχιλλεύς" are the same key). Every word
+    of a value is indexed, so "pall" finds "Athena Pallas".
+
+    Tries are built on first use, one field at a time, and dropped when the
+    data generation (Metadata.get_generation) moves on.
+'''
+
+import re
+import unicodedata
+
+from .generation import GenerationCache
+from .forms import get_char_name_choices, get_inst_name_choices, get_author_name_choices, get_work_title_choices
+
+# field -> the choices it suggests from
+SOURCES = {
+    "char_name": get_char_name_choices,
+    "inst_name": get_inst_name_choices,
+    "author_name": get_author_name_choices,
+    "work_title": get_work_title_choices,
+}
+
+GREEK = {
+    "α": "a", "β": "b", "γ": "g", "δ": "d", "ε": "e", "ζ": "z", "η": "e",
+    "θ": "th", "ι": "i", "κ": "k", "λ": "l", "μ": "m", "ν": "n", "ξ": "x",
+    "ο": "o", "π": "p", "ρ": "r", "σ": "s", "ς": "s", "τ": "t", "υ": "y",
+    "φ": "ph", "χ": "ch", "ψ": "ps", "ω": "o",
+}
+
+# spellings that differ between Greek-style and Latin-style transliteration
+FOLDS = {"k": "c", "j": "i", "v": "u", "y": "u", "ai": "ae", "oi": "oe", "ei": "i", "ou": "u"}
+FOLD_PATTERN = re.compile("|".join(sorted(FOLDS, key=len, reverse=True)))
+
+
+def normalize(text):
+    '''search key for a name or a typed prefix'''
+    decomposed = unicodedata.normalize("NFD", text.casefold())
+    plain = "".join(GREEK.get(c, c) for c in decomposed if not unicodedata.combining(c))
+    folded = FOLD_PATTERN.sub(lambda m: FOLDS[m.group()], plain)
+    return " ".join(re.findall(r"\w+", folded))
+
+
+class PrefixTrie:
+    '''values by normalized key prefix
+
+        Each node keeps the values reachable below it, in insertion order,
+        so a lookup is a walk down the prefix and no traversal.
+    '''
+
+    def __init__(self, values=()):
+        self.root = {}
+        self.values = []
+        self.keys = []
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        index = len(self.values)
+        key = normalize(value)
+        self.values.append(value)
+        self.keys.append(key)
+
+        # the whole key, and from the start of each later word
+        starts = [0] + [m.end() for m in re.finditer(" ", key)]
+        for start in starts:
+            node = self.root
+            for char in key[start:]:
+                node = node.setdefault(char, {})
+                found = node.setdefault("", [])
+                if not found or found[-1] != index:
+                    found.append(index)
+
+    def search(self, prefix):
+        '''values with a word starting with prefix: those whose first
+            word does come first, then alphabetical by key
+        '''
+        key = normalize(prefix)
+        if not key:
+            return list(self.values)
+
+        node = self.root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return []
+        found = node[""]
+        return [self.values[i] for i in sorted(found, key=lambda i: (not self.keys[i].startswith(key), self.keys[i]))]
+
+
+_tries = GenerationCache()
+
+
+def get_trie(field):
+    '''the prefix trie for one field's values'''
+    return _tries.get(field, lambda: PrefixTrie(value for value, label in SOURCES[field]()))
+
+
+def suggest(field, prefix, offset=0, limit=30):
+    '''(values, more) for one page of suggestions'''
+    found = get_trie(field).search(prefix)
+    return found[offset:offset + limit], len(found) > offset + limit
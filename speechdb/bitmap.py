@@ -0,0 +1,342 @@
+'''In-memory bitmap index for faceted speech search
+
+    The speech search space is small and low-cardinality, so each worker
+    can hold a bitset per (search parameter, value): bit i is set when the
+    i-th speech, in list order (query.SPEECH_KEYSET), has that value. A search
+    is then a handful of AND/OR operations, and the database is only asked
+    for the rows of the page being shown.
+
+    Bitsets are plain Python ints, which are packed, arbitrary-length and
+    have C-speed bitwise operators. Values of high-cardinality parameters
+    (ids, names) are kept as sorted position arrays instead, and turned
+    into bitsets only when searched for.
+
+    Speaker and addressee conditions are indexed per speech ("has some
+    speaker with ..."). Several conditions on one role must hold for the
+    same participant, so when a search combines them, speeches with more
+    than one participant in that role are re-checked against their rows.
+
+    Enabled by settings.SPEECH_BITMAP_INDEX. The index is rebuilt whenever
+    the data generation in Metadata moves on.
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .models import Speech, SpeechTag, SpeechSearchRow
+from .generation import GenerationCache, current_generation
+from .query import SEARCH_ROW_PARAMS, SPEECH_KEYSET
+
+# parameters with more distinct values than this keep position arrays
+BITMAP_MAX_VALUES = 256
+
+# list order of speeches, and so of bit positions
+KEYSET = SPEECH_KEYSET
+
+ROLES = ("spkr", "addr")
+
+
+def _key(value):
+    '''normalized index key for a stored or searched value'''
+    if value.__class__ is str:
+        return value
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+
+def _bool_key(value):
+    return str(value).lower()
+
+
+# search parameter -> keys of a speech values() record
+SPEECH_KEYS = {
+    "cluster_id": lambda s: (s["cluster_id"],),
+    "cluster_pubid": lambda s: (s["cluster__public_id"],),
+    "type": lambda s: (s["type"],),
+    "part": lambda s: (s["part"],),
+    "n_parts": lambda s: (s["cluster_size"],),
+    "level": lambda s: (s["level"],),
+    "work_id": lambda s: (s["work_id"],),
+    "work_pubid": lambda s: (s["work__public_id"],),
+    "work_title": lambda s: (s["work__title"],),
+    "work_lang": lambda s: (s["work__lang"],),
+    "author_id": lambda s: (s["work__author_id"],),
+    "author_pubid": lambda s: (s["work__author__public_id"],),
+    "author_name": lambda s: (s["work__author__name"],),
+}
+
+# participant attribute -> keys of a SpeechSearchRow values() record;
+#   mirrors query.SEARCH_ROW_LOOKUPS
+PARTICIPANT_KEYS = {
+    "char_id": lambda r: (r["char_id"],),
+    "char_pubid": lambda r: (r["char_pubid"],),
+    "char_name": lambda r: (r["char_name"],),
+    "char_being": lambda r: (r["char_being"],),
+    "char_gender": lambda r: (r["char_gender"],),
+    "char_number": lambda r: (r["char_number"],),
+    "char_manto": lambda r: (r["char_manto"],),
+    "char_wd": lambda r: (r["char_wd"],),
+    "char_tt": lambda r: (r["char_tt"],),
+    "inst_id": lambda r: (r["inst_id"],),
+    "inst_pubid": lambda r: (r["inst_pubid"],),
+    "inst_name": lambda r: (r["inst_name"],) + ((r["inst_display"],) if r["inst_anon"] else ()),
+    "inst_being": lambda r: (r["inst_being"],),
+    "inst_gender": lambda r: (r["inst_gender"],),
+    "inst_number": lambda r: (r["inst_number"],),
+    "inst_anon": lambda r: (r["inst_anon"],),
+    "inst_disguised": lambda r: (r["inst_disguise"] != "",),
+    "inst_changed": lambda r: (r["inst_changed"],),
+}
+
+# participant attributes searched with "True"/"False"
+BOOLEAN_ATTRS = {"inst_anon", "inst_disguised"}
+
+
+def members(bits):
+    '''positions of the set bits, lowest first'''
+    digits = bin(bits)[:1:-1]
+    i = digits.find("1")
+    while i >= 0:
+        yield i
+        i = digits.find("1", i + 1)
+
+
+def from_positions(positions, size):
+    '''bitset with the given positions set'''
+    if not positions:
+        return 0
+    digits = bytearray(b"0") * size
+    for pos in positions:
+        digits[size - 1 - pos] = 49  # "1"
+    return int(digits, 2)
+
+
+class Facet:
+    '''value -> speeches for one search parameter'''
+
+    def __init__(self, positions, size):
+        self.size = size
+        if len(positions) > BITMAP_MAX_VALUES:
+            self.bitmaps = None
+            self.positions = {k: array("I", sorted(v)) for k, v in positions.items()}
+        else:
+            self.bitmaps = {k: from_positions(v, size) for k, v in positions.items()}
+            self.positions = None
+
+    def union(self, keys):
+        '''bitset of speeches having any of the keys'''
+        if self.bitmaps is not None:
+            bits = 0
+            for key in keys:
+                bits |= self.bitmaps.get(key, 0)
+            return bits
+        found = []
+        for key in keys:
+            found.extend(self.positions.get(key, ()))
+        return from_positions(found, self.size)
+
+    def keys(self):
+        return (self.positions if self.bitmaps is None else self.bitmaps).keys()
+
+    def counts_within(self, bits):
+        '''value -> number of speeches in bits having it'''
+        if self.bitmaps is not None:
+            return {key: (bits & bitmap).bit_count() for key, bitmap in self.bitmaps.items()}
+        digits = bin(bits)[:1:-1]
+        n = len(digits)
+        return {key: sum(1 for pos in positions if pos < n and digits[pos] == "1")
+                for key, positions in self.positions.items()}
+
+
+class SpeechBitmapIndex:
+    '''bitsets over all speeches, in list order'''
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.ids = []
+        self.keys = []
+        self.all = 0
+        self.facets = {}
+
+        # per role: speeches with more than one participant, and those
+        #   participants' keys, for re-checking multi-condition searches
+        self.multi = {}
+        self.rows = {}
+
+    @classmethod
+    def build(cls, generation=None):
+        if generation is None:
+            generation = current_generation()
+        index = cls(generation)
+        index._load()
+        return index
+
+    def _load(self):
+        speeches = list(
+            Speech.objects.order_by(*KEYSET)
+            .values(
+                *KEYSET, "work_id", "cluster_id", "cluster__public_id", "type",
+                "part", "level", "cluster_size", "work__public_id", "work__title",
+                "work__lang", "work__author_id", "work__author__public_id",
+                "work__author__name",
+            )
+        )
+        size = len(speeches)
+        self.ids = [s["id"] for s in speeches]
+        self.keys = [tuple(s[k] for k in KEYSET) for s in speeches]
+        self.all = (1 << size) - 1
+        position = {speech_id: pos for pos, speech_id in enumerate(self.ids)}
+
+        collected = {name: {} for name in SPEECH_KEYS}
+        for pos, s in enumerate(speeches):
+            for name, keys_of in SPEECH_KEYS.items():
+                for key in keys_of(s):
+                    if key is not None:
+                        collected[name].setdefault(_key(key), []).append(pos)
+
+        collected["tags"] = {}
+        for speech_id, tag_type in SpeechTag.objects.values_list("speech_id", "type"):
+            collected["tags"].setdefault(_key(tag_type), set()).add(position[speech_id])
+
+        # participants, grouped by role and speech
+        participants = {role: {} for role in ROLES}
+        columns = [f.attname for f in SpeechSearchRow._meta.concrete_fields
+                   if f.attname.startswith(("inst_", "char_"))]
+        for row in SpeechSearchRow.objects.values("speech_id", "role", *columns):
+            pos = position.get(row["speech_id"])
+            if pos is not None:
+                participants[row["role"]].setdefault(pos, []).append(row)
+
+        for role in ROLES:
+            facets = {attr: collected.setdefault(f"{role}_{attr}", {}) for attr in PARTICIPANT_KEYS}
+            multi = {}
+            for pos, rows in participants[role].items():
+                for row in rows:
+                    for attr, keys_of in PARTICIPANT_KEYS.items():
+                        for key in keys_of(row):
+                            if key is not None:
+                                facets[attr].setdefault(_key(key), set()).add(pos)
+                if len(rows) > 1:
+                    multi[pos] = [self._row_keys(row) for row in rows]
+            self.multi[role] = from_positions(list(multi), size)
+            self.rows[role] = multi
+
+        self.facets = {name: Facet(positions, size) for name, positions in collected.items()}
+
+    @staticmethod
+    def _row_keys(row):
+        return {attr: frozenset(_key(k) for k in keys_of(row) if k is not None)
+                for attr, keys_of in PARTICIPANT_KEYS.items()}
+
+    #
+    # searching
+    #
+
+    def match(self, params):
+        '''bitset of speeches matching validated search params
+
+            Returns None if some parameter can't be answered from the
+            index, in which case the caller should query the database.
+        '''
+        bits = self.all
+        groups = {}
+
+        for name, values in params.items():
+            if name not in SEARCH_ROW_PARAMS:
+                # not a speech search parameter; the database ignores it too
+                continue
+            if name not in self.facets:
+                return None
+
+            role, _, attr = name.partition("_")
+            if role in ROLES and attr in PARTICIPANT_KEYS:
+                keys = {_bool_key(v) if attr in BOOLEAN_ATTRS else _key(v) for v in values}
+                groups.setdefault(role, []).append((attr, keys))
+                bits &= self.facets[name].union(keys)
+            else:
+                bits &= self.facets[name].union({_key(v) for v in values})
+
+        # several conditions on one role must hold for the same participant
+        for role, terms in groups.items():
+            if len(terms) > 1:
+                bits = self._recheck(bits, role, terms)
+
+        return bits
+
+    def _recheck(self, bits, role, terms):
+        '''drop speeches where no single participant satisfies every term'''
+        failed = []
+        for pos in members(bits & self.multi[role]):
+            if not any(all(row[attr] & keys for attr, keys in terms) for row in self.rows[role][pos]):
+                failed.append(pos)
+        if failed:
+            bits &= ~from_positions(failed, len(self.ids))
+        return bits
+
+    def count(self, bits):
+        return bits.bit_count()
+
+    def facet_counts(self, params, names):
+        '''result counts per value of each named parameter
+
+            Each value is counted as if it were the only one searched for
+            that parameter, alongside all the other params. Returns None if
+            the params can't be answered from the index.
+        '''
+        counts = {}
+        for name in names:
+            others = {k: v for k, v in params.items() if k != name}
+            base = self.match(others)
+            if base is None:
+                return None
+
+            facet = self.facets[name]
+            role, _, attr = name.partition("_")
+            if role in ROLES and any(k.startswith(f"{role}_") for k in others):
+                # the value must hold for the same participant as the
+                #   other conditions on this role; re-check each one
+                counts[name] = {key: self.match({**others, name: [key]}).bit_count()
+                                for key in facet.keys()}
+            else:
+                counts[name] = facet.counts_within(base)
+        return counts
+
+    def page(self, bits, after=None, before=None, size=100):
+        '''one page of ids from a result bitset, by keyset cursor
+
+            Returns (ids, has_next, has_previous).
+        '''
+        if before is not None:
+            end = bisect_left(self.keys, tuple(before))
+            digits = bin(bits & ((1 << end) - 1))[2:]
+            top = len(digits) - 1
+            found = []
+            i = digits.find("1")
+            while i >= 0 and len(found) <= size:
+                found.append(top - i)
+                i = digits.find("1", i + 1)
+            has_previous = len(found) > size
+            positions = found[:size][::-1]
+            has_next = True
+        else:
+            start = bisect_right(self.keys, tuple(after)) if after is not None else 0
+            positions = []
+            for i in members(bits >> start):
+                positions.append(start + i)
+                if len(positions) > size:
+                    break
+            has_next = len(positions) > size
+            positions = positions[:size]
+            has_previous = after is not None
+
+        return [self.ids[pos] for pos in positions], has_next, has_previous
+
+
+_index = GenerationCache()
+
+
+def get_index():
+    '''the current index, rebuilt if the data generation has moved on'''
+    generation = current_generation()
+    return _index.get("index", lambda: SpeechBitmapIndex.build(generation), generation)
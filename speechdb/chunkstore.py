@@ -0,0 +1,165 @@
+'''Content-addressed chunk store for database backups
+
+    A backup's byte stream (a pg_dump script, a jsonl fixture) is cut into
+    chunks, each stored once, gzipped, under the SHA-256 of its contents;
+    the backup itself is a manifest listing its chunks in order. Chunk
+    boundaries are content-defined: the stream is cut after any line whose
+    checksum has its low bits clear, subject to a minimum and maximum
+    size. A record inserted, edited or deleted moves only the boundaries
+    near it, so consecutive backups of a mostly unchanged database share
+    nearly all their chunks, and keeping a month of nightly backups costs
+    little more than one.
+
+    Chunks no manifest refers to any longer are removed by prune().
+'''
+
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from pathlib import Path
+
+# a line ends a chunk when its crc32 has these low bits clear: about one
+#   line in 256
+BOUNDARY_MASK = 0xff
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+# writes buffered before splitting into lines
+BLOCK_SIZE = 64 * 1024
+
+
+class ChunkStore:
+    '''gzipped chunks under root, by SHA-256'''
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, digest):
+        return self.root / digest[:2] / f"{digest}.gz"
+
+    def put(self, data):
+        '''store a chunk unless present; returns (digest, path if new)'''
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if path.exists():
+            return digest, None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(partial, 'wb') as f:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=f, compresslevel=6, mtime=0) as z:
+                z.write(data)
+        os.replace(partial, path)
+        return digest, path
+
+    def get(self, digest):
+        '''a chunk's bytes, checked against its digest'''
+        with gzip.open(self.path(digest), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"chunk {digest} is corrupt")
+        return data
+
+    def read(self, manifest):
+        '''the bytes of a backup, chunk by chunk, checking the whole'''
+        sha256 = hashlib.sha256()
+        for digest, size in manifest['chunks']:
+            data = self.get(digest)
+            sha256.update(data)
+            yield data
+        if sha256.hexdigest() != manifest['sha256']:
+            raise ValueError("backup does not match its manifest")
+
+    def prune(self, manifests):
+        '''delete chunks none of the manifests use; returns the count'''
+        used = {digest for manifest in manifests for digest, size in manifest['chunks']}
+        removed = 0
+        for path in self.root.glob('*/*.gz'):
+            if path.name[:-len('.gz')] not in used:
+                path.unlink()
+                removed += 1
+        return removed
+
+
+class ChunkWriter:
+    '''file-like sink cutting what is written to it into chunks in a store
+
+        Takes text or bytes. After close(), `chunks`, `sha256` and `size`
+        describe the stream for its manifest, and `new_paths` lists the
+        chunks the store didn't already hold.
+    '''
+
+    def __init__(self, store):
+        self.store = store
+        self.chunks = []
+        self.new_paths = []
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._lines = []
+        self._length = 0
+        self._pending = b''
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, data):
+        # serializers write in many small pieces; cut a block at a time
+        self._buffer.append(data.encode() if isinstance(data, str) else data)
+        self._buffered += len(data)
+        if self._buffered >= BLOCK_SIZE:
+            self._split()
+        return len(data)
+
+    def _split(self):
+        data = b''.join(self._buffer)
+        self._buffer, self._buffered = [], 0
+        self._sha256.update(data)
+        self.size += len(data)
+
+        lines = (self._pending + data).split(b'\n')
+        self._pending = lines.pop()
+        for line in lines:
+            line += b'\n'
+            self._lines.append(line)
+            self._length += len(line)
+            if self._length >= MAX_CHUNK_SIZE or (
+                    self._length >= MIN_CHUNK_SIZE and not zlib.crc32(line) & BOUNDARY_MASK):
+                self._cut()
+        if len(self._pending) >= MAX_CHUNK_SIZE:
+            # a very long line
+            self._lines.append(self._pending)
+            self._pending = b''
+            self._cut()
+
+    def flush(self):
+        pass
+
+    def _cut(self):
+        data = b''.join(self._lines)
+        self._lines, self._length = [], 0
+        if data:
+            digest, path = self.store.put(data)
+            self.chunks.append([digest, len(data)])
+            if path is not None:
+                self.new_paths.append(path)
+
+    def close(self):
+        self._split()
+        self._lines.append(self._pending)
+        self._pending = b''
+        self._cut()
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+
+def read_manifest(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(path, manifest):
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
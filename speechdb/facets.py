@@ -0,0 +1,160 @@
+'''Facet counts for the speech search sidebar
+
+    Next to each option of a sidebar filter we show how many speeches the
+    current search would return with that option selected (and only that
+    option, for this filter). Counts come from the bitmap index when it is
+    enabled, or else from the database: the filters not in the search are
+    counted together, in one UNION ALL of grouped aggregates, and each
+    filter that is, over the search without it. Counts are cached by
+    normalized search params and data generation, so the unfiltered counts
+    are computed once per generation and shared by every single-filter
+    search.
+'''
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, CharField, Count, Exists, F, OuterRef, Value, When
+
+from .models import Speech, SpeechTag, SpeechSearchRow
+from .generation import current_generation
+from .query import SEARCH_ROW_PARAMS, compile_speech_filters, participant_row_filters
+from .results import cache_key
+
+ROLES = ("spkr", "addr")
+
+# participant facets -> SpeechSearchRow column
+PARTICIPANT_FACETS = {
+    "char_name": "char_name",
+    "char_gender": "char_gender",
+    "char_being": "char_being",
+    "inst_name": None,  # name, or display name if anonymous; see below
+    "inst_gender": "inst_gender",
+    "inst_being": "inst_being",
+    "inst_number": "inst_number",
+    "inst_changed": "inst_changed",
+    "inst_anon": "inst_anon",
+}
+
+# speech facets -> Speech lookup
+SPEECH_FACETS = {
+    "type": "type",
+    "work_lang": "work__lang",
+    "author_name": "work__author__name",
+    "work_title": "work__title",
+}
+
+FACETS = [f"{role}_{attr}" for role in ROLES for attr in PARTICIPANT_FACETS] + list(SPEECH_FACETS) + ["tags"]
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _value(value):
+    '''facet value as it appears among form choices'''
+    return str(value)
+
+
+def facet_counts(params, generation=None):
+    '''{param: {form value: count}} for each sidebar facet'''
+    if generation is None:
+        generation = current_generation()
+    key = cache_key("facets", params, generation, names=SEARCH_ROW_PARAMS)
+    counts = cache.get(key)
+    if counts is None:
+        if settings.SPEECH_BITMAP_INDEX:
+            counts = _bitmap_counts(params)
+        if counts is None:
+            counts = _database_counts(params, generation)
+        cache.set(key, counts, CACHE_TIMEOUT)
+    return counts
+
+
+def _bitmap_counts(params):
+    from .bitmap import get_index, BOOLEAN_ATTRS
+
+    counts = get_index().facet_counts(params, FACETS)
+    if counts is None:
+        return None
+    # the index keys booleans in lower case; forms offer "True"/"False"
+    for name in counts:
+        if name.partition("_")[2] in BOOLEAN_ATTRS:
+            counts[name] = {key.capitalize(): n for key, n in counts[name].items()}
+    return counts
+
+
+def _matching(params):
+    '''subquery of ids of speeches matching params'''
+    return Speech.objects.filter(*compile_speech_filters(params)).values("pk")
+
+
+def _database_counts(params, generation):
+    counts = _grouped_counts(params, [name for name in FACETS if name not in params])
+    for name in FACETS:
+        if name in params:
+            # a filter's own selection doesn't narrow its options
+            others = {k: v for k, v in params.items() if k != name}
+            if others:
+                counts[name] = _grouped_counts(others, [name])[name]
+            else:
+                counts[name] = facet_counts(others, generation)[name]
+    return counts
+
+
+def _grouped_counts(params, names):
+    '''{facet: {form value: count}} over the speeches matching params, for
+        the given facets, from one query
+    '''
+    counts = {name: {} for name in names}
+    arms = [arm for name in names for arm in _arms(name, params)]
+    if not arms:
+        return counts
+    for name, value, n in arms[0].union(*arms[1:], all=True):
+        if value is not None:
+            value = _value(value)
+            counts[name][value] = counts[name].get(value, 0) + n
+    return counts
+
+
+def _arms(name, params):
+    '''grouped (facet, value, count) querysets whose rows, summed by
+        value, give the counts for one facet
+    '''
+    speeches = _matching(params)
+    role, _, attr = name.partition("_")
+
+    if name in SPEECH_FACETS:
+        return [_grouped(Speech.objects.filter(pk__in=speeches), name, SPEECH_FACETS[name], Count("pk"))]
+    if name == "tags":
+        return [_grouped(SpeechTag.objects.filter(speech__in=speeches), name, "type",
+                         Count("speech", distinct=True))]
+
+    # the value must hold for the same participant as any other
+    #   conditions on this role
+    participants = SpeechSearchRow.objects.filter(
+        *participant_row_filters(params, role),
+        role=role, speech__in=speeches,
+    )
+    n = Count("speech", distinct=True)
+    if attr != "inst_name":
+        return [_grouped(participants, name, PARTICIPANT_FACETS[attr], n)]
+
+    # anonymous instances match on both name and display name: count a
+    #   display name only for speeches not already counted under it
+    counted = participants.filter(speech=OuterRef("speech"), inst_name=OuterRef("inst_display"))
+    displayed = participants.filter(inst_anon=True).exclude(Exists(counted))
+    return [_grouped(participants, name, "inst_name", n), _grouped(displayed, name, "inst_display", n)]
+
+
+def _grouped(queryset, name, column, n):
+    '''(facet name, value, n) rows of queryset grouped by column, with
+        values as text so that facets of any type can share one UNION
+    '''
+    value = F(column)
+    if isinstance(queryset.model._meta.get_field(column.partition("__")[0]), BooleanField):
+        value = Case(When(**{column: True}, then=Value("True")), default=Value("False"))
+    return (
+        queryset.order_by()
+        .annotate(facet_name=Value(name, output_field=CharField()),
+                  facet_value=value)
+        .values_list("facet_name", "facet_value")
+        .annotate(n=n)
+    )
@@ -1,30 +1,98 @@
 from django import forms
+from django.urls import reverse
 from django.db.models import Max
-from .models import CharacterInstance, Character, Author, Work, Speech, SpeechTag
+from .models import CharacterInstance, Character, Author, Work, Speech, SpeechTag, parse_locus
+from .generation import GenerationCache
 
-# attribute lists for the drop downs
+# registry of values the forms draw from the database, kept for the life
+#   of the worker and emptied when the data generation moves on
+_registry = GenerationCache()
+
+def _registered(name, build):
+    '''a registry value, building it on first use in this generation'''
+    return _registry.get(name, build)
+
+def _name_choices(names):
+    return [(name, name) for name in names]
+
+# attribute lists for the drop downs; fields get their own copy
 def get_char_name_choices():
-    return [(c.name, c.name) for c in Character.objects.all()]
+    return list(_registered("char_name", lambda: _name_choices(
+        Character.objects.order_by("name").values_list("name", flat=True).distinct())))
 
 def get_inst_name_choices():
-    names = set()
-    for inst in CharacterInstance.objects.all():
-        names.add(inst.display if inst.anon else inst.name)
-    return [(name, name) for name in sorted(names)]
+    def build():
+        names = set(CharacterInstance.objects.filter(anon=False).values_list("name", flat=True).distinct())
+        names.update(CharacterInstance.objects.filter(anon=True).values_list("display", flat=True).distinct())
+        return _name_choices(sorted(names))
+    return list(_registered("inst_name", build))
 
 def get_author_name_choices():
-    return [(a.name, a.name) for a in Author.objects.all()]
+    return list(_registered("author_name", lambda: _name_choices(
+        Author.objects.order_by("name").values_list("name", flat=True).distinct())))
 
 def get_work_title_choices():
-    return [(title, title) for title in sorted(set(w.title for w in Work.objects.all()))]
+    return list(_registered("work_title", lambda: _name_choices(
+        Work.objects.order_by("title").values_list("title", flat=True).distinct())))
+
+def get_max_part():
+    return _registered("max_part", lambda: Speech.objects.aggregate(Max("part"))["part__max"] or 1)
     
 def get_work_lang_choices():
     return [("", "any")] + Work.Language.choices
 
+def show_facet_counts(form, counts):
+    '''append result counts (see facets.py) to the labels of a form's choices'''
+    for name, field in form.fields.items():
+        field_counts = counts.get(form.add_prefix(name))
+        if field_counts is None:
+            continue
+        field.choices = [
+            (value, label if value == "" else f"{label} ({field_counts.get(str(value), 0)})")
+            for value, label in field.choices
+        ]
+
 #
 # form classes
 #
 
+class AutocompleteSelectMultiple(forms.SelectMultiple):
+    '''a tagging-select whose options load as the user types
+        - source names the suggestions to ask for; see autocomplete.py
+        - only the selected options are rendered into the page
+    '''
+
+    def __init__(self, source, attrs=None):
+        super().__init__(attrs={"class": "form-select tagging-select", **(attrs or {})})
+        self.source = source
+
+    def get_context(self, name, value, attrs):
+        attrs = {
+            **(attrs or {}),
+            "data-ajax--url": reverse("app:autocomplete", args=[self.source]),
+            "data-ajax--delay": "150",
+        }
+        return super().get_context(name, value, attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        selected = {str(v) for v in value}
+        choices = self.choices
+        self.choices = [(k, label) for k, label in choices if str(k) in selected]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+
+class LocusField(forms.CharField):
+    '''a line reference such as "9.100" or "526b"; see models.parse_locus'''
+    
+    def validate(self, value):
+        super().validate(value)
+        if value not in self.empty_values and parse_locus(value) is None:
+            raise forms.ValidationError("Enter a line reference such as 9.100", code="invalid")
+
+
 class PrefixedForm(forms.Form):
     def add_prefix(self, field_name):
         # Use '_' instead of '-'
@@ -52,7 +120,7 @@ class CharacterForm(PrefixedForm):
             label = "Name", 
             choices = get_char_name_choices(),
             required = False,
-            widget = forms.SelectMultiple(attrs={"class": "form-select tagging-select"}),
+            widget = AutocompleteSelectMultiple("char_name"),
         )
         self.fields["char_gender"] = forms.MultipleChoiceField(
             label = "Gender", 
@@ -77,7 +145,7 @@ class InstanceForm(PrefixedForm):
             label = "Name", 
             choices = get_inst_name_choices(),
             required = False,
-            widget = forms.SelectMultiple(attrs={"class": "form-select tagging-select"}),
+            widget = AutocompleteSelectMultiple("inst_name"),
         )
         self.fields["inst_gender"] = forms.MultipleChoiceField(
             label = "Gender", 
@@ -142,13 +210,13 @@ class TextForm(forms.Form):
             label = "Author", 
             choices = get_author_name_choices(),
             required = False,
-            widget = forms.SelectMultiple(attrs={"class": "form-select tagging-select"}),
+            widget = AutocompleteSelectMultiple("author_name"),
         )
         self.fields["work_title"] = forms.MultipleChoiceField(
             label = "Work Title", 
             choices = get_work_title_choices(),
             required = False,
-            widget = forms.SelectMultiple(attrs={"class": "form-select tagging-select"}),
+            widget = AutocompleteSelectMultiple("work_title"),
         )
 
 
@@ -157,7 +225,7 @@ class SpeechForm(forms.Form):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
-        max_parts = Speech.objects.aggregate(Max("part"))["part__max"] or 1
+        max_parts = get_max_part()
         
         self.fields["type"] = forms.MultipleChoiceField(
             label = "Speech Type",
@@ -187,6 +255,32 @@ class SpeechForm(forms.Form):
             widget = forms.NumberInput(attrs={"class": "form-control form-control-sm"}),
         )
         self.fields['n_parts'].inline = True        
+        self.fields["n_lines_min"] = forms.IntegerField(
+            label = "Lines, at least",
+            required = False,
+            min_value = 1,
+            widget = forms.NumberInput(attrs={"class": "form-control form-control-sm"}),
+        )
+        self.fields['n_lines_min'].inline = True
+        self.fields["n_lines_max"] = forms.IntegerField(
+            label = "Lines, at most",
+            required = False,
+            min_value = 1,
+            widget = forms.NumberInput(attrs={"class": "form-control form-control-sm"}),
+        )
+        self.fields['n_lines_max'].inline = True
+        self.fields["from"] = LocusField(
+            label = "From line",
+            required = False,
+            widget = forms.TextInput(attrs={"class": "form-control form-control-sm", "placeholder": "e.g. 9.1"}),
+        )
+        self.fields['from'].inline = True
+        self.fields["to"] = LocusField(
+            label = "To line",
+            required = False,
+            widget = forms.TextInput(attrs={"class": "form-control form-control-sm", "placeholder": "e.g. 9.713"}),
+        )
+        self.fields['to'].inline = True
         self.fields["level"] = forms.IntegerField(
             label = "Embedded level",
             required = False,
@@ -194,6 +288,12 @@ class SpeechForm(forms.Form):
             widget = forms.NumberInput(attrs={"class": "form-control form-control-sm"}),
         )
         self.fields['level'].inline = True
+        self.fields["root_spkr_name"] = forms.MultipleChoiceField(
+            label = "Embedded in a speech by",
+            choices = get_char_name_choices(),
+            required = False,
+            widget = AutocompleteSelectMultiple("char_name"),
+        )
     
     
 class PagerForm(forms.Form):
@@ -517,8 +617,43 @@ class PagerForm(forms.Form):
             required = False,
             widget = forms.HiddenInput(),
         )
+        self.fields["n_lines_min"] = forms.IntegerField(
+            min_value = 1,
+            required = False,
+            widget = forms.HiddenInput(),
+        )
+        self.fields["n_lines_max"] = forms.IntegerField(
+            min_value = 1,
+            required = False,
+            widget = forms.HiddenInput(),
+        )
+        self.fields["from"] = LocusField(
+            required = False,
+            widget = forms.HiddenInput(),
+        )
+        self.fields["to"] = LocusField(
+            required = False,
+            widget = forms.HiddenInput(),
+        )
+        self.fields["at"] = LocusField(
+            required = False,
+            widget = forms.HiddenInput(),
+        )
         self.fields["level"] = forms.IntegerField(
             min_value = 0,
             required = False,
             widget = forms.HiddenInput(),
+        )
+        self.fields["within_id"] = forms.IntegerField(
+            required = False,
+            widget = forms.HiddenInput(),
+        )
+        self.fields["within_pubid"] = forms.CharField(
+            required = False,
+            widget = forms.HiddenInput(),
+        )
+        self.fields["root_spkr_name"] = forms.MultipleChoiceField(
+            choices = get_char_name_choices(),
+            required = False,
+            widget = forms.MultipleHiddenInput(),
         )
\ No newline at end of file
@@ -0,0 +1,116 @@
+'''The data generation, read once per request, and caches kept per generation
+
+    Metadata.get_generation is a query, and the in-memory indexes, the
+    result, count and facet caches and the page cache all key on it.
+    GenerationMiddleware scopes each request so that the generation is read
+    at most once, however many of them ask; so are the per-work generations
+    (Work.speech_generation) that the interval indexes key on. Outside a
+    request (management commands, the shell, the body of a streamed
+    response) they are read on every call.
+
+    GenerationCache holds values built from the database for the life of
+    the worker, and drops them all once the generation moves on.
+'''
+
+import threading
+from contextvars import ContextVar
+
+from .models import Metadata, Work
+
+# {'generation': value, 'works': {work id: speech generation}} for the
+#   request being served, None outside one
+_request = ContextVar('speechdb_generation', default=None)
+
+
+def current_generation():
+    '''the data generation, read at most once per request'''
+    memo = _request.get()
+    if memo is None:
+        return Metadata.get_generation()
+    if 'generation' not in memo:
+        memo['generation'] = Metadata.get_generation()
+    return memo['generation']
+
+
+def work_generations(work_ids=None):
+    '''{work id: Work.speech_generation} for the given works, or all, each
+        read at most once per request, those not yet read in one query
+    '''
+    memo = _request.get()
+    known = {} if memo is None else memo.setdefault('works', {})
+    if work_ids is None:
+        if memo is None or not memo.get('all_works'):
+            known.clear()
+            known.update(Work.objects.order_by().values_list('id', 'speech_generation'))
+            if memo is not None:
+                memo['all_works'] = True
+        return dict(known)
+
+    work_ids = set(work_ids)
+    missing = work_ids - set(known)
+    if missing and (memo is None or not memo.get('all_works')):
+        known.update(Work.objects.filter(pk__in=missing).order_by().values_list('id', 'speech_generation'))
+    return {work_id: known[work_id] for work_id in work_ids if work_id in known}
+
+
+def forget_generation():
+    '''read the generations afresh on next use, e.g. after a write bumped
+        them
+    '''
+    memo = _request.get()
+    if memo is not None:
+        memo.clear()
+
+
+class GenerationMiddleware:
+    '''read the data generation at most once per request'''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)
+
+
+class GenerationCache:
+    '''values built from the database, by key, emptied when the data
+        generation moves on
+
+        Builds run one at a time, so concurrent requests for a missing
+        value wait for a single build rather than each making their own.
+    '''
+
+    def __init__(self):
+        self._values = {}
+        self._generation = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _lookup(self, key, generation):
+        with self._lock:
+            if generation != self._generation:
+                self._values.clear()
+                self._generation = generation
+            return self._values.get(key)
+
+    def get(self, key, build, generation=None):
+        '''the value for key, calling build() on first use in this
+            generation (by default, the current one)
+        '''
+        if generation is None:
+            generation = current_generation()
+        value = self._lookup(key, generation)
+        if value is None:
+            with self._build_lock:
+                # another thread may have built it meanwhile
+                value = self._lookup(key, generation)
+                if value is None:
+                    value = build()
+                    with self._lock:
+                        if generation == self._generation:
+                            self._values[key] = value
+        return value
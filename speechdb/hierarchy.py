@@ -0,0 +1,106 @@
+'''Maintenance of the speech embedding closure table
+
+    SpeechEmbedding pairs every speech with each speech it is embedded in,
+    however deep, so that a whole subtree or ancestor path of the
+    embedded_in hierarchy is one indexed query. The rows are derived data:
+    rebuild_embeddings() regenerates them from embedded_in, either
+    wholesale (after an ingest) or for the subtrees of a handful of
+    speeches (from the write signals).
+'''
+
+from django.apps import apps as global_apps
+from django.db import transaction
+
+from .search import chunks, insert_rows, BATCH_SIZE
+
+
+def rebuild_embeddings(speech_ids=None, apps=None):
+    '''Regenerate closure rows for the given speeches and everything
+        embedded in them, or for all speeches
+
+        Returns the number of rows written.
+    '''
+    apps = apps or global_apps
+    Speech = apps.get_model('speechdb', 'Speech')
+    SpeechEmbedding = apps.get_model('speechdb', 'SpeechEmbedding')
+
+    with transaction.atomic():
+        if speech_ids is None:
+            # one narrow projection serves every ancestor walk
+            parent = dict(Speech.objects.values_list('id', 'embedded_in_id'))
+            SpeechEmbedding.objects.all().delete()
+            rows = list(_rows(parent, parent))
+            insert_rows(SpeechEmbedding, rows)
+            return len(rows)
+
+        return sum(_relink(pk, Speech, SpeechEmbedding) for pk in set(speech_ids))
+
+
+def _relink(pk, Speech, SpeechEmbedding):
+    '''re-hang one speech's subtree under its current parent
+
+        The rows within the subtree stand; those pairing it with the
+        ancestors it had are dropped, and the new parent's ancestor rows are
+        crossed with the subtree's. Speeches handled one after another each
+        see the rows left by the last, so the order of several doesn't matter.
+    '''
+    found = list(Speech.objects.filter(pk=pk).order_by().values_list('embedded_in_id', flat=True))
+    if not found:
+        return 0
+    parent_id = found[0]
+
+    # {descendant: depth below pk}; a new speech has no rows yet
+    below = dict(SpeechEmbedding.objects.filter(ancestor_id=pk).values_list('descendant_id', 'depth'))
+    rows = [] if pk in below else [dict(ancestor_id=pk, descendant_id=pk, depth=0)]
+    below[pk] = 0
+
+    if parent_id in below:
+        # a careless edit has made a cycle: walk it as the full rebuild does
+        return _rewalk(below, Speech, SpeechEmbedding)
+
+    # a speech's links to ancestors outside the subtree are the deeper ones
+    by_depth = {}
+    for descendant, depth in below.items():
+        by_depth.setdefault(depth, []).append(descendant)
+    for depth, descendants in by_depth.items():
+        for chunk in chunks(descendants, BATCH_SIZE):
+            SpeechEmbedding.objects.filter(descendant_id__in=chunk, depth__gt=depth).delete()
+
+    if parent_id is not None:
+        above = dict(SpeechEmbedding.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth'))
+        # a parent yet to be linked itself is still its own ancestor
+        above.setdefault(parent_id, 0)
+        rows.extend(
+            dict(ancestor_id=ancestor, descendant_id=descendant, depth=up + down + 1)
+            for ancestor, up in above.items()
+            for descendant, down in below.items()
+        )
+
+    insert_rows(SpeechEmbedding, rows)
+    return len(rows)
+
+
+def _rewalk(speech_ids, Speech, SpeechEmbedding):
+    '''regenerate the rows of the given speeches from the parent map'''
+    parent = dict(Speech.objects.values_list('id', 'embedded_in_id'))
+    for chunk in chunks(list(speech_ids), BATCH_SIZE):
+        SpeechEmbedding.objects.filter(descendant_id__in=chunk).delete()
+    rows = list(_rows(speech_ids, parent))
+    insert_rows(SpeechEmbedding, rows)
+    return len(rows)
+
+
+def _rows(speech_ids, parent):
+    '''closure rows for each speech: itself, then its ancestors upward'''
+    for pk in speech_ids:
+        yield dict(ancestor_id=pk, descendant_id=pk, depth=0)
+
+        # stop at a cycle, should a careless edit have made one
+        seen = {pk}
+        depth = 0
+        ancestor = parent.get(pk)
+        while ancestor is not None and ancestor not in seen:
+            depth += 1
+            yield dict(ancestor_id=ancestor, descendant_id=pk, depth=depth)
+            seen.add(ancestor)
+            ancestor = parent.get(ancestor)
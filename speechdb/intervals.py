@@ -0,0 +1,147 @@
+'''Per-work interval index over speech line ranges
+
+    Each speech is an interval of parsed loci (models.parse_locus) within
+    its work. A work's index is a static interval tree: the speeches sorted
+    by first line, read as an implicit balanced binary tree in which every
+    node also holds the greatest last line in its subtree. Enclosing,
+    overlapping and "surrounds this line" queries only descend into
+    subtrees that can hold an answer, so they take O(log n + k) for k
+    results; contained-by queries are a bisected range of first lines.
+
+    Indexes are built lazily, one work at a time, from the stored parsed
+    locus columns (Speech.fi_* and la_*), and kept for the life of the
+    worker. Each is tagged with its work's Work.speech_generation, which
+    the write signals and bulk loaders set whenever that work's speeches
+    change, so an edit to one work only rebuilds that work's index. The
+    generations of all the works a lookup needs are read in one query, and
+    at most once per request (generation.work_generations).
+'''
+
+import threading
+from bisect import bisect_left, bisect_right
+
+from .models import Speech, parse_locus
+from .generation import work_generations
+
+
+class IntervalIndex:
+    '''the speeches of one work as an interval tree
+
+        Results are (fi, la, level, seq, id) tuples, fi and la being parsed
+        loci, in order of first line.
+    '''
+
+    def __init__(self, speeches):
+        '''speeches: (id, fi_book, fi_line, fi_suffix, la_book, la_line,
+            la_suffix, level, seq) records
+        '''
+        items = []
+        for pk, fi_book, fi_line, fi_suffix, la_book, la_line, la_suffix, level, seq in speeches:
+            # unparseable loci can't be placed
+            if fi_line is not None and la_line is not None:
+                items.append(((fi_book, fi_line, fi_suffix), (la_book, la_line, la_suffix), level, seq, pk))
+        items.sort()
+
+        self.items = items
+        self.starts = [item[0] for item in items]
+        self.max_end = [None] * len(items)
+        self._augment(0, len(items))
+
+    def _augment(self, lo, hi):
+        '''fill in max_end for the subtree over items[lo:hi]; returns it'''
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        end = self.items[mid][1]
+        for child in (self._augment(lo, mid), self._augment(mid + 1, hi)):
+            if child is not None and child > end:
+                end = child
+        self.max_end[mid] = end
+        return end
+
+    def _ending_after(self, limit, end):
+        '''items among the first `limit` (by first line) whose last line is
+            at or after `end`, in order
+        '''
+        found = []
+
+        def visit(lo, hi):
+            if lo >= hi or lo >= limit:
+                return
+            mid = (lo + hi) // 2
+            if self.max_end[mid] < end:
+                return
+            visit(lo, mid)
+            if mid < limit and self.items[mid][1] >= end:
+                found.append(self.items[mid])
+            visit(mid + 1, hi)
+
+        visit(0, len(self.items))
+        return found
+
+    def enclosing(self, fi, la):
+        '''speeches whose range contains fi..la'''
+        return self._ending_after(bisect_right(self.starts, fi), la)
+
+    def overlapping(self, fi, la):
+        '''speeches whose range shares a line with fi..la'''
+        return self._ending_after(bisect_right(self.starts, la), fi)
+
+    def contained(self, fi, la):
+        '''speeches lying within fi..la'''
+        lo, hi = bisect_left(self.starts, fi), bisect_right(self.starts, la)
+        return [item for item in self.items[lo:hi] if item[1] <= la]
+
+    def surrounding(self, locus):
+        '''speeches that include the line'''
+        return self.enclosing(locus, locus)
+
+
+_indexes = {}  # work id -> (speech generation, index)
+_lock = threading.Lock()
+
+FIELDS = ('id', 'fi_book', 'fi_line', 'fi_suffix', 'la_book', 'la_line', 'la_suffix', 'level', 'seq')
+
+
+def _build(speeches):
+    '''{work id: interval index} from (work id, *FIELDS) records'''
+    by_work = {}
+    for record in speeches:
+        by_work.setdefault(record[0], []).append(record[1:])
+    return {work_id: IntervalIndex(records) for work_id, records in by_work.items()}
+
+
+def get_index(work_id):
+    '''the interval index of one work's speeches'''
+    return get_indexes([work_id]).get(work_id) or IntervalIndex([])
+
+
+def get_indexes(work_ids=None):
+    '''{work id: interval index} for the given works, or every work,
+        rebuilding any stale or missing in one query
+    '''
+    generations = work_generations(work_ids)
+    cached = dict(_indexes)
+    stale = [work_id for work_id, generation in generations.items()
+             if work_id not in cached or cached[work_id][0] != generation]
+    built = {}
+    if stale:
+        built = _build(Speech.objects.filter(work_id__in=stale).values_list('work_id', *FIELDS))
+
+    with _lock:
+        if work_ids is None:
+            for work_id in list(_indexes):
+                if work_id not in generations:
+                    del _indexes[work_id]
+        for work_id in stale:
+            _indexes[work_id] = (generations[work_id], built.get(work_id) or IntervalIndex([]))
+        return {work_id: _indexes[work_id][1] for work_id in generations}
+
+
+def surrounding(locus, work_ids=None):
+    '''ids of speeches, in the given works or any, that include the line'''
+    key = parse_locus(locus)
+    if key is None:
+        return []
+    indexes = get_indexes(work_ids).values()
+    return [item[-1] for index in indexes for item in index.surrounding(key)]
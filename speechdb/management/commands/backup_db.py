@@ -1,11 +1,121 @@
+import gzip
+import hashlib
 import os
+import re
+import shutil
 import subprocess
+import tempfile
 import time
+from contextlib import contextmanager
 from pathlib import Path
+from django.apps import apps
+from django.core.serializers.jsonl import Serializer as JSONLSerializer
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Prefetch
 from git import Repo, InvalidGitRepositoryError
 
+from speechdb.chunkstore import ChunkStore, ChunkWriter, read_manifest, write_manifest
+
+# pg_dump output read, and serializer output buffered, at a time
+BLOCK_SIZE = 1024 * 1024
+
+# fixture records serialized at a time
+BATCH_SIZE = 2000
+
+BACKUP_NAME = re.compile(r'dices_[a-z]+_(\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d)')
+
+
+class HashingFile:
+    '''file-like sink passing what is written to it on, keeping its SHA-256
+        and size as written (before compression)
+    '''
+
+    def __init__(self, file):
+        self.file = file
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, data):
+        # serializers write in many small pieces; pass them on in blocks
+        self._buffer.append(data.encode() if isinstance(data, str) else data)
+        self._buffered += len(data)
+        if self._buffered >= BLOCK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        data = b''.join(self._buffer)
+        self._buffer, self._buffered = [], 0
+        self._sha256.update(data)
+        self.size += len(data)
+        self.file.write(data)
+
+    def close(self):
+        self.flush()
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+
+class FixtureSerializer(JSONLSerializer):
+    '''jsonl serializer reading M2M ids straight from prefetched objects
+        (the stock one builds a fallback queryset per record and field,
+        even when it isn't used)
+    '''
+
+    def handle_m2m_field(self, obj, field):
+        prefetched = getattr(obj, '_prefetched_objects_cache', {})
+        if field.name not in prefetched or not field.remote_field.through._meta.auto_created:
+            return super().handle_m2m_field(obj, field)
+        self._current[field.name] = [self._value_from_field(related, related._meta.pk) for related in prefetched[field.name]]
+
+
+def dump_fixture(stream):
+    '''write the speechdb tables to stream as a jsonl fixture
+
+        The same records as dumpdata's, but each model is read in chunks
+        with its M2M fields prefetched, rather than with a query per M2M
+        field per record.
+    '''
+    for model in apps.get_app_config('speechdb').get_models():
+        m2m = [
+            Prefetch(field.name, queryset=field.related_model._default_manager.only('pk'))
+            for field in model._meta.many_to_many
+            if field.remote_field.through._meta.auto_created
+        ]
+        objects = model._default_manager.order_by('pk').prefetch_related(*m2m)
+        FixtureSerializer().serialize(objects.iterator(chunk_size=BATCH_SIZE), stream=stream)
+
+
+@contextmanager
+def snapshot():
+    '''one consistent view of the database for the queries run inside
+
+        A transaction: on PostgreSQL a REPEATABLE READ one, whose snapshot
+        is exported for pg_dump to share (yields its id); elsewhere None.
+    '''
+    with transaction.atomic():
+        if connection.vendor != 'postgresql':
+            yield None
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            cursor.execute('SELECT pg_export_snapshot()')
+            yield cursor.fetchone()[0]
+
+
+def table_counts():
+    '''{table: rows} for the speechdb tables, M2M tables included'''
+    return {
+        model._meta.db_table: model._default_manager.count()
+        for model in apps.get_app_config('speechdb').get_models(include_auto_created=True)
+    }
+
 
 class Command(BaseCommand):
     help = 'Create versioned database backups with PostgreSQL dumps and Django JSON fixtures'
@@ -21,7 +131,13 @@ class Command(BaseCommand):
             '--format',
             choices=['pg_dump', 'json', 'both'],
             default='both',
-            help='Backup format: pg_dump (PostgreSQL), json (Django fixture), or both'
+            help='Backup format: pg_dump (PostgreSQL), json (Django jsonl fixture), or both'
+        )
+        parser.add_argument(
+            '--chunked',
+            action='store_true',
+            help='Store backups as content-addressed chunks under BACKUP_DIR/chunks/, '
+                 'shared between backups, instead of one .gz file each'
         )
         parser.add_argument(
             '--git-commit',
@@ -33,9 +149,21 @@ class Command(BaseCommand):
             type=int,
             help='Keep only N most recent backups (auto-cleanup)'
         )
+        parser.add_argument(
+            '--verify',
+            type=str,
+            metavar='MANIFEST',
+            help='Check a backup against its manifest instead of creating one'
+        )
 
     def handle(self, *args, **options):
         backup_dir = Path(options['backup_dir'])
+        store = ChunkStore(backup_dir / 'chunks')
+
+        if options['verify']:
+            self._verify(Path(options['verify']), store)
+            return
+
         backup_dir.mkdir(exist_ok=True)
 
         timestamp = time.strftime('%Y-%m-%d_%H-%M-%S')
@@ -55,67 +183,59 @@ class Command(BaseCommand):
                     )
                 )
             else:
-                pg_backup_file = backup_dir / f"dices_db_{timestamp}.sql"
-                self.stdout.write(f"Creating PostgreSQL dump: {pg_backup_file}")
-
-                try:
-                    # Build pg_dump command
-                    env = os.environ.copy()
-                    if db_config.get('PASSWORD'):
-                        env['PGPASSWORD'] = db_config['PASSWORD']
-
-                    cmd = ['pg_dump']
-                    if db_config.get('HOST'):
-                        cmd.extend(['-h', db_config['HOST']])
-                    if db_config.get('PORT'):
-                        cmd.extend(['-p', str(db_config['PORT'])])
-                    if db_config.get('USER'):
-                        cmd.extend(['-U', db_config['USER']])
-                    cmd.extend([
-                        '-Fp',  # Plain text format
-                        '--no-owner',  # Don't include ownership commands
-                        '--no-acl',  # Don't include ACL commands
-                        '-f', str(pg_backup_file),
-                        db_config['NAME']
-                    ])
-
-                    subprocess.run(cmd, env=env, check=True, capture_output=True)
-                    backups_created.append(pg_backup_file)
-
-                    # Create compressed version
-                    subprocess.run(['gzip', '-k', str(pg_backup_file)], check=True)
-                    backups_created.append(Path(str(pg_backup_file) + '.gz'))
-
-                    self.stdout.write(
-                        self.style.SUCCESS(f"✓ PostgreSQL dump created: {pg_backup_file}.gz")
-                    )
+                self.stdout.write("Creating PostgreSQL dump...")
 
-                except subprocess.CalledProcessError as e:
-                    raise CommandError(f"pg_dump failed: {e.stderr.decode() if e.stderr else str(e)}")
+                # Build pg_dump command
+                env = os.environ.copy()
+                if db_config.get('PASSWORD'):
+                    env['PGPASSWORD'] = db_config['PASSWORD']
 
-        # Django JSON fixture
-        if options['format'] in ['json', 'both']:
-            json_backup_file = backup_dir / f"dices_fixture_{timestamp}.json"
-            self.stdout.write(f"Creating Django JSON fixture: {json_backup_file}")
+                cmd = ['pg_dump']
+                if db_config.get('HOST'):
+                    cmd.extend(['-h', db_config['HOST']])
+                if db_config.get('PORT'):
+                    cmd.extend(['-p', str(db_config['PORT'])])
+                if db_config.get('USER'):
+                    cmd.extend(['-U', db_config['USER']])
+                cmd.extend([
+                    '-Fp',  # Plain text format
+                    '--no-owner',  # Don't include ownership commands
+                    '--no-acl',  # Don't include ACL commands
+                ])
 
-            try:
-                # Use Django's dumpdata command
-                from django.core.management import call_command
-                with open(json_backup_file, 'w') as f:
-                    call_command('dumpdata', 'speechdb', stdout=f, indent=2)
-
-                backups_created.append(json_backup_file)
+                def dump(sink, snapshot):
+                    # stream the script, never holding or storing it whole
+                    with tempfile.TemporaryFile() as errors:
+                        try:
+                            # the data as of the manifest's counts
+                            proc = subprocess.Popen(
+                                [*cmd, f'--snapshot={snapshot}', db_config['NAME']],
+                                env=env, stdout=subprocess.PIPE, stderr=errors)
+                        except OSError as e:
+                            raise CommandError(f"pg_dump failed: {e}")
+                        shutil.copyfileobj(proc.stdout, sink, BLOCK_SIZE)
+                        proc.stdout.close()
+                        if proc.wait():
+                            errors.seek(0)
+                            raise CommandError(f"pg_dump failed: {errors.read().decode()}")
 
-                # Create compressed version
-                subprocess.run(['gzip', '-k', str(json_backup_file)], check=True)
-                backups_created.append(Path(str(json_backup_file) + '.gz'))
+                files = self._backup(backup_dir, store, f"dices_db_{timestamp}", 'sql', dump, options['chunked'])
+                backups_created.extend(files)
+                self.stdout.write(self.style.SUCCESS(f"✓ PostgreSQL dump created: {files[0]}"))
 
-                self.stdout.write(
-                    self.style.SUCCESS(f"✓ JSON fixture created: {json_backup_file}.gz")
-                )
+        # Django JSON fixture
+        if options['format'] in ['json', 'both']:
+            self.stdout.write("Creating Django JSON fixture...")
 
+            # jsonl keeps one record per line, which is what chunk
+            #   boundaries fall between
+            try:
+                files = self._backup(backup_dir, store, f"dices_fixture_{timestamp}", 'jsonl',
+                                     lambda sink, snapshot: dump_fixture(sink), options['chunked'])
             except Exception as e:
                 raise CommandError(f"JSON fixture creation failed: {str(e)}")
+            backups_created.extend(files)
+            self.stdout.write(self.style.SUCCESS(f"✓ JSON fixture created: {files[0]}"))
 
         # Git commit if requested
         if options['git_commit']:
@@ -145,30 +265,106 @@ class Command(BaseCommand):
 
         # Cleanup old backups if requested
         if options['keep_last']:
-            self._cleanup_old_backups(backup_dir, options['keep_last'])
+            self._cleanup_old_backups(backup_dir, store, options['keep_last'])
 
         self.stdout.write(
             self.style.SUCCESS(f"\n✓ Backup complete! {len(backups_created)} files created.")
         )
 
-    def _cleanup_old_backups(self, backup_dir, keep_count):
-        """Remove old backup files, keeping only the N most recent"""
+    def _backup(self, backup_dir, store, name, fmt, dump, chunked):
+        '''Stream one backup into a .gz file or the chunk store, and write
+            its manifest; returns the files created, manifest first
 
-        # Get all backup files sorted by modification time
-        all_backups = sorted(
-            backup_dir.glob('dices_*'),
-            key=lambda p: p.stat().st_mtime,
-            reverse=True
-        )
+            dump(sink, snapshot) writes the data; it and the manifest's
+            counts read the same snapshot (see snapshot()).
+        '''
+        manifest_file = backup_dir / f"{name}.manifest.json"
+        manifest = {
+            'format': fmt,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S %z'),
+        }
+
+        with snapshot() as exported:
+            manifest['counts'] = table_counts()
+            if chunked:
+                sink = ChunkWriter(store)
+                dump(sink, exported)
+                sink.close()
+                manifest['chunks'] = sink.chunks
+                files = sink.new_paths
+                new_bytes = sum(path.stat().st_size for path in files)
+                self.stdout.write(f"  {len(sink.chunks)} chunks, {len(files)} new ({new_bytes} bytes)")
+            else:
+                backup_file = backup_dir / f"{name}.{fmt}.gz"
+                with gzip.open(backup_file, 'wb', compresslevel=6) as f:
+                    sink = HashingFile(f)
+                    dump(sink, exported)
+                    sink.close()
+                manifest['file'] = backup_file.name
+                files = [backup_file]
+
+        manifest['sha256'] = sink.sha256
+        manifest['size'] = sink.size
+        write_manifest(manifest_file, manifest)
+        return [manifest_file, *files]
+
+    def _verify(self, manifest_file, store):
+        """Check a backup's data against its manifest"""
+
+        try:
+            manifest = read_manifest(manifest_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read manifest {manifest_file}: {e}")
+
+        try:
+            if 'chunks' in manifest:
+                size = sum(len(data) for data in store.read(manifest))
+            else:
+                sha256 = hashlib.sha256()
+                size = 0
+                with gzip.open(manifest_file.parent / manifest['file'], 'rb') as f:
+                    while data := f.read(BLOCK_SIZE):
+                        sha256.update(data)
+                        size += len(data)
+                if sha256.hexdigest() != manifest['sha256']:
+                    raise ValueError("backup does not match its manifest")
+        except (OSError, ValueError, EOFError) as e:
+            raise CommandError(f"Backup {manifest_file.name} failed verification: {e}")
+
+        if size != manifest['size']:
+            raise CommandError(f"Backup {manifest_file.name} failed verification: size differs")
+        self.stdout.write(self.style.SUCCESS(f"✓ Backup verified: {manifest_file.name}"))
+
+    def _cleanup_old_backups(self, backup_dir, store, keep_count):
+        """Remove old backups, keeping only the N most recent, and the
+        chunks only they used"""
+
+        # Group backup files by the time they were made
+        backups = {}
+        for path in backup_dir.glob('dices_*'):
+            match = BACKUP_NAME.match(path.name)
+            if match:
+                backups.setdefault(match.group(1), []).append(path)
 
         # Remove old files
         removed_count = 0
-        for old_backup in all_backups[keep_count:]:
-            old_backup.unlink()
+        for stamp in sorted(backups, reverse=True)[keep_count:]:
+            for old_backup in backups.pop(stamp):
+                old_backup.unlink()
+                self.stdout.write(f"Removed old backup: {old_backup.name}")
             removed_count += 1
-            self.stdout.write(f"Removed old backup: {old_backup.name}")
 
         if removed_count > 0:
             self.stdout.write(
                 self.style.SUCCESS(f"✓ Cleaned up {removed_count} old backup(s)")
             )
+
+        if store.root.is_dir():
+            manifests = [
+                read_manifest(path)
+                for paths in backups.values() for path in paths
+                if path.name.endswith('.manifest.json')
+            ]
+            pruned = store.prune(manifests)
+            if pruned:
+                self.stdout.write(self.style.SUCCESS(f"✓ Removed {pruned} unused chunk(s)"))
@@ -0,0 +1,110 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from speechdb.models import Speech, SpeechTag
+from speechdb.query import compile_speech_filters, SPEECH_KEYSET
+
+# speeches on a list page
+PAGE_SIZE = 50
+
+
+class Command(BaseCommand):
+    help = 'Compare join-based, EXISTS-based and search-table speech search plans'
+
+    # Each plan is timed on what the speech list does with it, the first
+    #   page in list order plus the count, as well as on fetching the
+    #   matching ids alone. Fetching ids favours join + distinct, which
+    #   then deduplicates a single column; the page pays for the joins and
+    #   the distinct over whole rows.
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Timed runs per plan (default: 5)'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=3,
+            help='Number of frequent speakers/addressees/tags to search for (default: 3)'
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Print the database query plan for each search'
+        )
+
+    def handle(self, *args, **options):
+        top = options['top']
+
+        # most frequent values make for the widest joins
+        spkr_names = self._top(Speech.objects.filter(spkr__char__isnull=False), 'spkr__char__name', top)
+        addr_names = self._top(Speech.objects.filter(addr__char__isnull=False), 'addr__char__name', top)
+        tags = self._top(SpeechTag.objects.all(), 'type', top)
+
+        cases = [
+            ("speaker", {"spkr_char_name": spkr_names}),
+            ("speaker+addressee", {"spkr_char_name": spkr_names, "addr_char_name": addr_names}),
+            ("speaker+addressee+tags", {"spkr_char_name": spkr_names, "addr_char_name": addr_names, "tags": tags}),
+            ("speaker gender+addressee being+tags", {
+                "spkr_inst_gender": ["female"], "addr_inst_being": ["divine", "mortal"], "tags": tags,
+            }),
+            # broad searches, matching much of the corpus
+            ("tags", {"tags": tags}),
+            ("language+speaker gender", {"work_lang": ["greek"], "spkr_char_gender": ["female"]}),
+            ("participant in either role", {"inst_name": spkr_names[:1]}),
+        ]
+
+        for label, params in cases:
+            self.stdout.write(f"\n{label}: {params}")
+
+            plans = [
+                ("join + distinct", self._queryset(params, mode="join").distinct()),
+                ("exists", self._queryset(params, mode="exists", search_rows=False)),
+                ("in", self._queryset(params, mode="in", search_rows=False)),
+                ("search table", self._queryset(params, mode="in", search_rows=True)),
+            ]
+
+            self.stdout.write(f"  {'':17}{'page + count':>22}{'ids':>22}")
+            base_ids, base_times = None, None
+            for plan, qs in plans:
+                ids, id_time = self._time(lambda: set(qs.values_list('pk', flat=True)), options['repeat'])
+                page, page_time = self._time(lambda: (list(qs[:PAGE_SIZE]), qs.count()), options['repeat'])
+                if base_ids is None:
+                    base_ids, base_times = ids, (page_time, id_time)
+                elif ids != base_ids:
+                    self.stderr.write(self.style.ERROR(
+                        f"  ✗ {plan} disagrees: {len(base_ids)} vs {len(ids)} speeches"))
+
+                timings = "".join(
+                    f"{elapsed * 1000:9.2f} ms {base / elapsed if elapsed else 0:6.2f}x  "
+                    for elapsed, base in zip((page_time, id_time), base_times))
+                self.stdout.write(f"  {plan + ':':17}{timings} ({len(ids)} speeches)")
+
+                if options['explain']:
+                    self.stdout.write(f"  -- {plan} plan --")
+                    self.stdout.write(qs.explain())
+
+    def _top(self, qs, field, n):
+        '''most frequent values of field'''
+        rows = qs.values(field).annotate(n=Count('pk')).order_by('-n')[:n]
+        return [row[field] for row in rows]
+
+    def _queryset(self, params, mode, search_rows=False):
+        '''the speech search as SpeechQueryMixin runs it, minus prefetching'''
+        qs = Speech.objects.all()
+        filters = compile_speech_filters(params, mode=mode, search_rows=search_rows)
+        return qs.filter(*filters).order_by(*SPEECH_KEYSET)
+
+    def _time(self, run, repeat):
+        '''the result of run() and its best-of-n wall time'''
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
@@ -1,22 +1,97 @@
 import csv
 import os
-from django.core.management.base import BaseCommand
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
 from django.apps import apps
+from django.db import connections
+
+# rows fetched from the database at a time
+CHUNK_SIZE = 2000
+
+
+def select_models(labels):
+    '''the models named by app labels or app_label.ModelName labels, each
+        followed by the M2M tables Django created for it
+    '''
+    models = []
+    for label in labels:
+        try:
+            if '.' in label:
+                selected = [apps.get_model(label)]
+            else:
+                selected = list(apps.get_app_config(label).get_models())
+        except (LookupError, ValueError) as e:
+            raise CommandError(f"Unknown model or app: {label} ({e})")
+        for model in selected:
+            models.append(model)
+            models.extend(
+                field.remote_field.through for field in model._meta.many_to_many
+                if field.remote_field.through._meta.auto_created
+            )
+    # once each, in the order named
+    return list(dict.fromkeys(models))
+
+
+def write_table(path, model, chunk_size):
+    '''write one table to path/<model_name>.csv; returns the row count
+
+        Rows are read chunk_size at a time (with a server-side cursor
+        where the database has them) and written as they arrive.
+    '''
+    fields = [field.name for field in model._meta.fields]
+    rows = model._default_manager.order_by('pk').values_list(*fields)
+    count = 0
+    try:
+        with open(os.path.join(path, f"{model._meta.model_name}.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for row in rows.iterator(chunk_size=chunk_size):
+                writer.writerow(row)
+                count += 1
+    finally:
+        # each thread has its own connection
+        connections.close_all()
+    return count
+
 
 class Command(BaseCommand):
     help = 'Export tables as CSV for archive'
-    
+
     def add_arguments(self, parser):
         parser.add_argument('path', type=str)
-    
+        parser.add_argument(
+            '--models',
+            nargs='+',
+            default=['speechdb'],
+            metavar='LABEL',
+            help='Apps (speechdb) or models (speechdb.Speech) to export, with their '
+                 'M2M tables (default: speechdb)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows read from the database at a time (default: {CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Tables written in parallel (default: 4)'
+        )
+
     def handle(self, *args, **options):
         path = options['path']
-        
-        for model in apps.get_models():
-            filename = f"{model._meta.model_name}.csv"
-            with open(os.path.join(path, filename), "w", newline="") as f:
-                writer = csv.writer(f)
-                fields = [field.name for field in model._meta.fields]
-                writer.writerow(fields)
-                for obj in model.objects.values_list(*fields):
-                    writer.writerow(obj)
\ No newline at end of file
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size and --workers must be at least 1")
+        models = select_models(options['models'])
+        os.makedirs(path, exist_ok=True)
+
+        # each worker holds at most a chunk of rows
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            jobs = [
+                (model, executor.submit(write_table, path, model, options['chunk_size']))
+                for model in models
+            ]
+            for model, job in jobs:
+                self.stdout.write(f"{job.result()} {model._meta.label} → {model._meta.model_name}.csv")
@@ -1,8 +1,17 @@
 import csv
+import gzip
+import hashlib
+import io
+import json
 import os
+import shutil
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.db.models import Count
 from git import Repo, InvalidGitRepositoryError
 
@@ -11,6 +20,351 @@ from speechdb.models import (
     Speech, SpeechCluster, SpeechTag, Metadata
 )
 
+# rows fetched, and speeches joined to their participants and tags, at a time
+BATCH_SIZE = 2000
+
+COMPRESS_SUFFIX = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+MANIFEST = 'MANIFEST.sha256'
+
+# incremental export state (see export_table)
+HASHES = 'hashes'
+STATE = 'tables.json'
+DELTA = 'DELTA.jsonl'
+
+
+def _batches(rows, size):
+    '''lists of up to size items from an iterator'''
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _split_locus(locus):
+    '''(book, line) from a book.line locus'''
+    parts = locus.split('.')
+    return (parts[0] if len(parts) > 1 else ''), parts[-1]
+
+
+#
+# Table rows: values() projections read in chunks, one query per batch at
+#   most, so the queries don't grow with the corpus and memory stays bounded.
+#   Each row comes with its record's primary key, which identifies it
+#   between exports whether or not the table shows it.
+#
+
+def author_rows():
+    authors = Author.objects.order_by('id').values_list('id', 'name', 'wd', 'urn')
+    for pk, name, wd, urn in authors.iterator(chunk_size=BATCH_SIZE):
+        yield pk, [pk, name, wd or '', urn or '']
+
+
+def work_rows():
+    works = Work.objects.order_by('id').values_list('id', 'author_id', 'title', 'lang', 'wd', 'urn', 'tlg')
+    for pk, author_id, title, lang, wd, urn, tlg in works.iterator(chunk_size=BATCH_SIZE):
+        yield pk, [pk, author_id, title, lang, wd or '', urn or '', tlg or '']
+
+
+def character_rows():
+    chars = Character.objects.order_by('name', 'id').values_list(
+        'id', 'name', 'being', 'number', 'gender', 'wd', 'manto', 'tt', 'notes')
+    for pk, name, being, number, gender, wd, manto, tt, notes in chars.iterator(chunk_size=BATCH_SIZE):
+        yield pk, [name, being, number, gender, wd or '', manto or '', tt or '', notes or '']
+
+
+def instance_rows():
+    insts = CharacterInstance.objects.order_by('name', 'context', 'id').values_list(
+        'id', 'name', 'char__name', 'display', 'being', 'number', 'gender',
+        'disguise', 'context', 'anon', 'notes')
+    for pk, name, char_name, display, being, number, gender, disguise, context, anon, notes in insts.iterator(chunk_size=BATCH_SIZE):
+        yield pk, [
+            name, char_name or '', display, being, number, gender,
+            disguise or '', context, 'yes' if anon else 'no', notes or '',
+        ]
+
+
+def _participants(relation, speech_ids):
+    '''{speech id: [instance names]} for one side of the speech'''
+    through = relation.through
+    names = {}
+    rows = (through.objects.filter(speech_id__in=speech_ids)
+            .order_by('characterinstance__name', 'characterinstance_id')
+            .values_list('speech_id', 'characterinstance__name'))
+    for speech_id, name in rows:
+        names.setdefault(speech_id, []).append(name)
+    return names
+
+
+def _tags(speech_ids):
+    '''{speech id: [tag codes, doubtful ones marked ?]}'''
+    tags = {}
+    rows = SpeechTag.objects.filter(speech_id__in=speech_ids).order_by('id').values_list('speech_id', 'type', 'doubt')
+    for speech_id, tag_type, doubt in rows:
+        tags.setdefault(speech_id, []).append(f"{tag_type}?" if doubt else tag_type)
+    return tags
+
+
+def speech_rows():
+    speeches = Speech.objects.order_by('seq', 'id').values_list(
+        'id', 'seq', 'work_id', 'l_fi', 'l_la', 'cluster_id', 'part', 'type',
+        'level', 'spkr_notes', 'addr_notes', 'notes')
+
+    for batch in _batches(speeches.iterator(chunk_size=BATCH_SIZE), BATCH_SIZE):
+        ids = [row[0] for row in batch]
+        speakers = _participants(Speech.spkr, ids)
+        addressees = _participants(Speech.addr, ids)
+        tags = _tags(ids)
+
+        for pk, seq, work_id, l_fi, l_la, cluster_id, part, speech_type, level, spkr_notes, addr_notes, notes in batch:
+            from_book, from_line = _split_locus(l_fi)
+            to_book, to_line = _split_locus(l_la)
+            yield pk, [
+                seq, work_id, from_book, from_line, to_book, to_line,
+                cluster_id, part, speech_type, level,
+                ';'.join(speakers.get(pk, [])),
+                ';'.join(addressees.get(pk, [])),
+                spkr_notes or '', addr_notes or '', notes or '',
+                ';'.join(tags.get(pk, [])),
+            ]
+
+
+def cluster_rows():
+    clusters = (SpeechCluster.objects.order_by('seq', 'id')
+                .annotate(speech_count=Count('speeches'))
+                .values_list('id', 'public_id', 'seq', 'speech_count'))
+    for row in clusters.iterator(chunk_size=BATCH_SIZE):
+        yield row[0], list(row)
+
+
+def tag_rows():
+    tags = SpeechTag.objects.order_by('speech__seq', 'type', 'id').values_list('id', 'speech__seq', 'type', 'doubt')
+    for pk, speech_seq, tag_type, doubt in tags.iterator(chunk_size=BATCH_SIZE):
+        yield pk, [pk, speech_seq, tag_type, 'yes' if doubt else 'no']
+
+
+# (name, header, rows), in README order
+TABLES = [
+    ('authors', ['id', 'name', 'wd', 'urn'], author_rows),
+    ('works', ['id', 'author', 'title', 'lang', 'wd', 'urn', 'tlg'], work_rows),
+    ('characters', ['name', 'being', 'number', 'gender', 'wd', 'manto', 'topostext', 'notes'], character_rows),
+    ('instances', [
+        'name', 'instance of', 'screen name', 'being', 'number', 'gender',
+        'disguise', 'context', 'anon', 'notes'
+    ], instance_rows),
+    ('speeches', [
+        'seq', 'work_id', 'from_book', 'from_line', 'to_book', 'to_line',
+        'cluster_id', 'cluster_part', 'turn_type', 'embedded_level',
+        'speaker', 'addressee', 'speaker_notes', 'addressee_notes',
+        'misc_notes', 'short_speech_type'
+    ], speech_rows),
+    ('clusters', ['id', 'public_id', 'seq', 'speech_count'], cluster_rows),
+    ('tags', ['id', 'speech_seq', 'type', 'doubt'], tag_rows),
+]
+
+
+#
+# Output: files are hashed as they are written, compressed or not, so the
+#   manifest costs no second read
+#
+
+class HashingWriter(io.RawIOBase):
+    '''binary sink that passes bytes to a file, keeping their SHA-256'''
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.file.write(data)
+        return len(data)
+
+
+def _zstd_writer(fileobj):
+    '''zstd compressing stream over fileobj, leaving it open on close'''
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd.ZstdFile(fileobj, mode='w')
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise CommandError('--compress zstd needs Python 3.14+ or the zstandard package')
+    return zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+
+
+@contextmanager
+def open_output(path, compress=None):
+    '''text stream to path, compressed as asked; yields (stream, sink), the
+        sink's sha256 being complete once the block exits
+    '''
+    with open(path, 'wb') as f:
+        sink = HashingWriter(f)
+        if compress == 'gzip':
+            # no timestamp in the header: the same data gives the same file
+            stream = gzip.GzipFile(filename='', mode='wb', fileobj=sink, mtime=0)
+        elif compress == 'zstd':
+            stream = _zstd_writer(sink)
+        else:
+            stream = io.BufferedWriter(sink)
+        text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        yield text, sink
+        text.close()
+
+
+def open_input(path, compress=None):
+    '''text stream from a file written by open_output()'''
+    if compress == 'gzip':
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if compress == 'zstd':
+        try:
+            from compression import zstd  # Python 3.14+
+        except ImportError:
+            import zstandard as zstd
+        return zstd.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+class LineFormatter:
+    '''rows as delimited text lines, one at a time'''
+
+    def __init__(self, delimiter):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, delimiter=delimiter)
+
+    def __call__(self, row):
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.writer.writerow(row)
+        return self.buffer.getvalue()
+
+
+#
+# Incremental exports: alongside the tables, an export keeps the SHA-256 of
+#   each table's text and of each row (by primary key) under hashes/. A
+#   later export given it as --since compares against them: a table whose
+#   text hasn't changed is kept as it is, and a changed one is rewritten,
+#   with its added, changed and removed rows listed in DELTA.jsonl.
+#
+
+def read_state(export_dir):
+    '''the hashes/ state of an earlier export, or None'''
+    try:
+        with open(export_dir / HASHES / STATE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def read_row_hashes(export_dir, name):
+    '''[(key, row digest)] of an earlier export's table, in table order'''
+    with open(export_dir / HASHES / f"{name}.tsv") as f:
+        return [(int(key), digest) for key, digest in (line.split() for line in f)]
+
+
+def table_digest(header, rows, delimiter):
+    '''SHA-256 of a table's text, without writing it'''
+    sha256 = hashlib.sha256()
+    line = LineFormatter(delimiter)
+    sha256.update(line(header).encode())
+    for key, row in rows():
+        sha256.update(line(row).encode())
+    return sha256.hexdigest()
+
+
+def export_table(output_dir, name, header, rows, delimiter, compress=None, since=None):
+    '''write one table and its row hashes, or keep an earlier export's copy
+        if it hasn't changed
+
+        Returns the table's state entry plus its delta against since
+        ('delta', a list of changes, or None with no earlier table to
+        compare) and whether it was kept ('kept').
+    '''
+    filename = f"{name}.tsv{COMPRESS_SUFFIX[compress]}"
+    previous = since['state']['tables'].get(name) if since else None
+    comparable = previous is not None and since['state']['delimiter'] == delimiter
+
+    try:
+        if comparable and since['state']['compress'] == compress:
+            # an extra pass over the rows is far cheaper than compressing
+            #   and writing a table that is the same as last time
+            digest = table_digest(header, rows, delimiter)
+            if digest == previous['sha256']:
+                if since['dir'] != output_dir:
+                    shutil.copy2(since['dir'] / filename, output_dir / filename)
+                    shutil.copy2(since['dir'] / HASHES / f"{name}.tsv", output_dir / HASHES / f"{name}.tsv")
+                return dict(previous, delta=[], kept=True)
+
+        old_hashes = dict(read_row_hashes(since['dir'], name)) if comparable else None
+        changes = []
+        line = LineFormatter(delimiter)
+        sha256 = hashlib.sha256()
+        count = 0
+
+        # write beside the files in place, which the removed rows are read
+        #   back from
+        path = output_dir / filename
+        hashes_path = output_dir / HASHES / f"{name}.tsv"
+        with open_output(path.with_name(path.name + '.tmp'), compress) as (f, sink), \
+                open(hashes_path.with_name(hashes_path.name + '.tmp'), 'w') as hashes:
+            text = line(header)
+            sha256.update(text.encode())
+            f.write(text)
+            for key, row in rows():
+                text = line(row)
+                sha256.update(text.encode())
+                f.write(text)
+                digest = hashlib.sha256(text.encode()).hexdigest()
+                hashes.write(f"{key}\t{digest}\n")
+                count += 1
+                if old_hashes is not None:
+                    old = old_hashes.pop(key, None)
+                    if old is None:
+                        changes.append(('added', key, row))
+                    elif old != digest:
+                        changes.append(('changed', key, row))
+
+        if old_hashes:
+            changes.extend(_removed_rows(since, name, previous['file'], old_hashes))
+        os.replace(path.with_name(path.name + '.tmp'), path)
+        os.replace(hashes_path.with_name(hashes_path.name + '.tmp'), hashes_path)
+        if previous is not None and since['dir'] == output_dir and previous['file'] != filename:
+            # compressed differently last time
+            (output_dir / previous['file']).unlink(missing_ok=True)
+    finally:
+        # each thread has its own connection
+        connections.close_all()
+
+    return {
+        'file': filename,
+        'sha256': sha256.hexdigest(),
+        'file_sha256': sink.sha256.hexdigest(),
+        'rows': count,
+        'delta': [
+            # as the text has them, like rows read back from a file
+            {'change': change, 'key': key, 'row': dict(zip(header, map(str, row)))}
+            for change, key, row in changes
+        ] if old_hashes is not None else None,
+        'kept': False,
+    }
+
+
+def _removed_rows(since, name, filename, removed):
+    '''('removed', key, row) for rows of an earlier export no longer there,
+        read back from its table by position
+    '''
+    state = since['state']
+    keys = (key for key, digest in read_row_hashes(since['dir'], name))
+    with open_input(since['dir'] / filename, state['compress']) as f:
+        reader = csv.reader(f, delimiter=state['delimiter'])
+        next(reader)
+        for key, row in zip(keys, reader):
+            if key in removed:
+                yield 'removed', key, row
+
 
 class Command(BaseCommand):
     help = 'Export database to CSV files for archival (e.g., Dataverse/Borealis)'
@@ -28,6 +382,18 @@ class Command(BaseCommand):
             choices=[',', '\t', '|'],
             help='CSV delimiter (default: tab)'
         )
+        parser.add_argument(
+            '--compress',
+            choices=['gzip', 'zstd'],
+            help='Write compressed files (.gz/.zst) instead of plain text'
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            metavar='PREVIOUS_EXPORT_DIR',
+            help='Rewrite only tables changed since this export (may be output_dir itself), '
+                 f'and list the changed rows in {DELTA}'
+        )
         parser.add_argument(
             '--create-readme',
             action='store_true',
@@ -35,206 +401,101 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
-        output_dir = Path(options['output_dir'])
-        output_dir.mkdir(parents=True, exist_ok=True)
-
         delimiter = options['delimiter']
+        compress = options['compress']
+        suffix = COMPRESS_SUFFIX[compress]
         timestamp = time.strftime('%Y-%m-%d %H:%M:%S %z')
 
+        if compress == 'zstd':
+            # fail before anything is written
+            _zstd_writer(io.BytesIO()).close()
+
+        output_dir = Path(options['output_dir'])
+
+        since = None
+        if options['since']:
+            since_dir = Path(options['since'])
+            if not since_dir.is_dir():
+                raise CommandError(f"No export at {since_dir}")
+            state = read_state(since_dir)
+            if state is None:
+                self.stderr.write(self.style.WARNING(
+                    f"{since_dir} has no {HASHES}/ (an older export?); exporting everything"))
+            else:
+                since = {'dir': since_dir.resolve(), 'state': state}
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        (output_dir / HASHES).mkdir(exist_ok=True)
+        output_dir = output_dir.resolve()
+
+        delimiter_name = 'TAB' if delimiter == '\t' else delimiter
         self.stdout.write(f"Exporting to: {output_dir}")
-        self.stdout.write(f"Delimiter: {'TAB' if delimiter == '\\t' else delimiter}\n")
-
-        # Export each model
-        export_count = 0
-
-        # Authors
-        authors_file = output_dir / 'authors.tsv'
-        self.stdout.write(f"Exporting authors to {authors_file.name}...")
-        with open(authors_file, 'w', newline='') as f:
-            writer = csv.writer(f, delimiter=delimiter)
-            writer.writerow(['id', 'name', 'wd', 'urn'])
-
-            for author in Author.objects.all().order_by('id'):
-                writer.writerow([
-                    author.id,
-                    author.name,
-                    author.wd or '',
-                    author.urn or '',
-                ])
-                export_count += 1
-
-        self.stdout.write(self.style.SUCCESS(f"  ✓ {Author.objects.count()} authors"))
-
-        # Works
-        works_file = output_dir / 'works.tsv'
-        self.stdout.write(f"Exporting works to {works_file.name}...")
-        with open(works_file, 'w', newline='') as f:
-            writer = csv.writer(f, delimiter=delimiter)
-            writer.writerow(['id', 'author', 'title', 'lang', 'wd', 'urn', 'tlg'])
-
-            for work in Work.objects.all().order_by('id'):
-                writer.writerow([
-                    work.id,
-                    work.author.id,
-                    work.title,
-                    work.lang,
-                    work.wd or '',
-                    work.urn or '',
-                    work.tlg or '',
-                ])
-                export_count += 1
-
-        self.stdout.write(self.style.SUCCESS(f"  ✓ {Work.objects.count()} works"))
-
-        # Characters
-        chars_file = output_dir / 'characters.tsv'
-        self.stdout.write(f"Exporting characters to {chars_file.name}...")
-        with open(chars_file, 'w', newline='') as f:
-            writer = csv.writer(f, delimiter=delimiter)
-            writer.writerow(['name', 'being', 'number', 'gender', 'wd', 'manto', 'topostext', 'notes'])
-
-            for char in Character.objects.all().order_by('name'):
-                writer.writerow([
-                    char.name,
-                    char.being,
-                    char.number,
-                    char.gender,
-                    char.wd or '',
-                    char.manto or '',
-                    char.tt or '',
-                    char.notes or '',
-                ])
-                export_count += 1
-
-        self.stdout.write(self.style.SUCCESS(f"  ✓ {Character.objects.count()} characters"))
-
-        # Character Instances
-        instances_file = output_dir / 'instances.tsv'
-        self.stdout.write(f"Exporting character instances to {instances_file.name}...")
-        with open(instances_file, 'w', newline='') as f:
-            writer = csv.writer(f, delimiter=delimiter)
-            writer.writerow([
-                'name', 'instance of', 'screen name', 'being', 'number', 'gender',
-                'disguise', 'context', 'anon', 'notes'
-            ])
-
-            for inst in CharacterInstance.objects.all().order_by('name', 'context'):
-                writer.writerow([
-                    inst.name,
-                    inst.char.name if inst.char else '',
-                    inst.display,
-                    inst.being,
-                    inst.number,
-                    inst.gender,
-                    inst.disguise or '',
-                    inst.context,
-                    'yes' if inst.anon else 'no',
-                    inst.notes or '',
-                ])
-                export_count += 1
-
-        self.stdout.write(self.style.SUCCESS(f"  ✓ {CharacterInstance.objects.count()} instances"))
-
-        # Speeches (main data - may be multiple files if very large)
-        speeches_file = output_dir / 'speeches.tsv'
-        self.stdout.write(f"Exporting speeches to {speeches_file.name}...")
-        with open(speeches_file, 'w', newline='') as f:
-            writer = csv.writer(f, delimiter=delimiter)
-            writer.writerow([
-                'seq', 'work_id', 'from_book', 'from_line', 'to_book', 'to_line',
-                'cluster_id', 'cluster_part', 'turn_type', 'embedded_level',
-                'speaker', 'addressee', 'speaker_notes', 'addressee_notes',
-                'misc_notes', 'short_speech_type'
-            ])
-
-            for speech in Speech.objects.all().order_by('seq'):
-                # Parse book.line format
-                l_fi_parts = speech.l_fi.split('.')
-                from_book = l_fi_parts[0] if len(l_fi_parts) > 1 else ''
-                from_line = l_fi_parts[-1]
-
-                l_la_parts = speech.l_la.split('.')
-                to_book = l_la_parts[0] if len(l_la_parts) > 1 else ''
-                to_line = l_la_parts[-1]
-
-                # Get speakers and addressees
-                speakers = ';'.join(s.name for s in speech.spkr.all())
-                addressees = ';'.join(a.name for a in speech.addr.all())
-
-                # Get tags
-                tags = SpeechTag.objects.filter(speech=speech)
-                tag_str = ';'.join(
-                    f"{tag.type}?" if tag.doubt else tag.type
-                    for tag in tags
-                )
-
-                writer.writerow([
-                    speech.seq,
-                    speech.work.id,
-                    from_book,
-                    from_line,
-                    to_book,
-                    to_line,
-                    speech.cluster.id,
-                    speech.part,
-                    speech.type,
-                    speech.level,
-                    speakers,
-                    addressees,
-                    speech.spkr_notes or '',
-                    speech.addr_notes or '',
-                    speech.notes or '',
-                    tag_str,
-                ])
-                export_count += 1
-
-        self.stdout.write(self.style.SUCCESS(f"  ✓ {Speech.objects.count()} speeches"))
-
-        # Speech Clusters
-        clusters_file = output_dir / 'clusters.tsv'
-        self.stdout.write(f"Exporting speech clusters to {clusters_file.name}...")
-        with open(clusters_file, 'w', newline='') as f:
-            writer = csv.writer(f, delimiter=delimiter)
-            writer.writerow(['id', 'public_id', 'seq', 'speech_count'])
-
-            for cluster in SpeechCluster.objects.all().order_by('seq'):
-                speech_count = Speech.objects.filter(cluster=cluster).count()
-                writer.writerow([
-                    cluster.id,
-                    cluster.public_id,
-                    cluster.seq,
-                    speech_count,
-                ])
-
-        self.stdout.write(self.style.SUCCESS(f"  ✓ {SpeechCluster.objects.count()} clusters"))
-
-        # Speech Tags
-        tags_file = output_dir / 'tags.tsv'
-        self.stdout.write(f"Exporting speech tags to {tags_file.name}...")
-        with open(tags_file, 'w', newline='') as f:
-            writer = csv.writer(f, delimiter=delimiter)
-            writer.writerow(['id', 'speech_seq', 'type', 'doubt'])
-
-            for tag in SpeechTag.objects.all().order_by('speech__seq', 'type'):
-                writer.writerow([
-                    tag.id,
-                    tag.speech.seq,
-                    tag.type,
-                    'yes' if tag.doubt else 'no',
-                ])
-
-        self.stdout.write(self.style.SUCCESS(f"  ✓ {SpeechTag.objects.count()} tags"))
+        self.stdout.write(f"Delimiter: {delimiter_name}")
+        if compress:
+            self.stdout.write(f"Compression: {compress}")
+        if since:
+            self.stdout.write(f"Since: {since['dir']}")
+        self.stdout.write(f"Writing {len(TABLES)} tables in parallel...\n")
+
+        # one thread per table
+        with ThreadPoolExecutor(max_workers=len(TABLES)) as executor:
+            jobs = [
+                (name, executor.submit(export_table, output_dir, name, header, rows, delimiter, compress, since))
+                for name, header, rows in TABLES
+            ]
+            tables = {}
+            for name, job in jobs:
+                tables[name] = table = job.result()
+                status = 'unchanged' if table['kept'] else 'written'
+                if table['delta']:
+                    status += ', ' + ', '.join(
+                        f"{n} {change}" for change in ('added', 'changed', 'removed')
+                        if (n := sum(1 for entry in table['delta'] if entry['change'] == change))
+                    )
+                self.stdout.write(self.style.SUCCESS(f"  ✓ {table['rows']} {name} ({table['file']}, {status})"))
+
+        counts = {name: table['rows'] for name, table in tables.items()}
+        digests = {table['file']: table['file_sha256'] for table in tables.values()}
+
+        # a delta from an earlier run would describe the wrong export
+        delta_file = output_dir / DELTA
+        delta_file.unlink(missing_ok=True)
+        if since:
+            with open_output(delta_file) as (f, sink):
+                for name, table in tables.items():
+                    for entry in table['delta'] or []:
+                        f.write(json.dumps({'table': name, **entry}, ensure_ascii=False) + '\n')
+            digests[DELTA] = sink.sha256.hexdigest()
+            changed = sum(len(table['delta'] or []) for table in tables.values())
+            self.stdout.write(self.style.SUCCESS(f"  ✓ {changed} changed rows listed in {DELTA}"))
+
+        with open(output_dir / HASHES / STATE, 'w') as f:
+            json.dump({
+                'exported': timestamp,
+                'delimiter': delimiter,
+                'compress': compress,
+                'tables': {
+                    name: {key: table[key] for key in ('file', 'sha256', 'file_sha256', 'rows')}
+                    for name, table in tables.items()
+                },
+            }, f, indent=2)
 
         # Create README if requested
         if options['create_readme']:
-            self._create_readme(output_dir, timestamp)
+            digests['README.txt'] = self._create_readme(output_dir, timestamp, counts, suffix, delta=bool(since))
+
+        manifest_file = output_dir / MANIFEST
+        with open(manifest_file, 'w') as f:
+            for filename, digest in digests.items():
+                f.write(f"{digest}  {filename}\n")
+        self.stdout.write(self.style.SUCCESS(f"  ✓ Checksums written: {manifest_file.name}"))
 
         self.stdout.write(
-            self.style.SUCCESS(f"\n✓ Export complete! {export_count} total records exported to {output_dir}")
+            self.style.SUCCESS(f"\n✓ Export complete! {sum(counts.values())} total records exported to {output_dir}")
         )
 
-    def _create_readme(self, output_dir, timestamp):
-        """Create README.txt with export metadata"""
+    def _create_readme(self, output_dir, timestamp, counts, suffix, delta=False):
+        """Create README.txt with export metadata; returns its SHA-256"""
 
         readme_file = output_dir / 'README.txt'
 
@@ -255,7 +516,7 @@ class Command(BaseCommand):
         except Exception:
             pass
 
-        with open(readme_file, 'w') as f:
+        with open_output(readme_file) as (f, sink):
             f.write("DICES Database Export\n")
             f.write("=" * 70 + "\n\n")
             f.write(f"Export Date: {timestamp}\n")
@@ -267,13 +528,23 @@ class Command(BaseCommand):
 
             f.write("Files:\n")
             f.write("-" * 70 + "\n")
-            f.write("  authors.tsv          - Authors (Homer, Vergil, etc.)\n")
-            f.write("  works.tsv            - Literary works (Iliad, Aeneid, etc.)\n")
-            f.write("  characters.tsv       - Character definitions\n")
-            f.write("  instances.tsv        - Character instances in specific contexts\n")
-            f.write("  speeches.tsv         - Direct speech data (main dataset)\n")
-            f.write("  clusters.tsv         - Speech cluster metadata\n")
-            f.write("  tags.tsv             - Speech type tags\n")
+            for filename, description in [
+                ('authors.tsv', 'Authors (Homer, Vergil, etc.)'),
+                ('works.tsv', 'Literary works (Iliad, Aeneid, etc.)'),
+                ('characters.tsv', 'Character definitions'),
+                ('instances.tsv', 'Character instances in specific contexts'),
+                ('speeches.tsv', 'Direct speech data (main dataset)'),
+                ('clusters.tsv', 'Speech cluster metadata'),
+                ('tags.tsv', 'Speech type tags'),
+                (MANIFEST, 'SHA-256 checksums of the files'),
+                (DELTA, 'Rows added, changed or removed since the previous export'),
+                (f"{HASHES}/", 'Table and row checksums, for the next export'),
+            ]:
+                if filename == DELTA and not delta:
+                    continue
+                if filename.endswith('.tsv'):
+                    filename += suffix
+                f.write(f"  {filename:<20} - {description}\n")
             f.write("\n")
 
             f.write("Format:\n")
@@ -281,17 +552,20 @@ class Command(BaseCommand):
             f.write("  All files use tab-separated values (TSV)\n")
             f.write("  First row contains column headers\n")
             f.write("  Empty fields are represented as empty strings\n")
+            if suffix:
+                f.write(f"  Data files are compressed ({suffix})\n")
+            f.write("  Verify files with: sha256sum -c MANIFEST.sha256\n")
             f.write("\n")
 
             f.write("Statistics:\n")
             f.write("-" * 70 + "\n")
-            f.write(f"  Authors:              {Author.objects.count():>6}\n")
-            f.write(f"  Works:                {Work.objects.count():>6}\n")
-            f.write(f"  Characters:           {Character.objects.count():>6}\n")
-            f.write(f"  Character Instances:  {CharacterInstance.objects.count():>6}\n")
-            f.write(f"  Speeches:             {Speech.objects.count():>6}\n")
-            f.write(f"  Speech Clusters:      {SpeechCluster.objects.count():>6}\n")
-            f.write(f"  Speech Tags:          {SpeechTag.objects.count():>6}\n")
+            f.write(f"  Authors:              {counts['authors']:>6}\n")
+            f.write(f"  Works:                {counts['works']:>6}\n")
+            f.write(f"  Characters:           {counts['characters']:>6}\n")
+            f.write(f"  Character Instances:  {counts['instances']:>6}\n")
+            f.write(f"  Speeches:             {counts['speeches']:>6}\n")
+            f.write(f"  Speech Clusters:      {counts['clusters']:>6}\n")
+            f.write(f"  Speech Tags:          {counts['tags']:>6}\n")
             f.write("\n")
 
             f.write("Citation:\n")
@@ -302,3 +576,4 @@ class Command(BaseCommand):
             f.write("  https://borealisdata.ca/dataset.xhtml?persistentId=doi:10.5683/SP3/N8LS2Y\n")
 
         self.stdout.write(self.style.SUCCESS(f"  ✓ README created: {readme_file.name}"))
+        return sink.sha256.hexdigest()
@@ -1,10 +1,15 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 import django.db.utils
+from django.db import transaction
 from speechdb.models import Metadata, IntegrityError
 from speechdb.models import Author, Work, Character, CharacterInstance
 from speechdb.models import Speech, SpeechCluster, SpeechTag
+from speechdb.search import rebuild_search_rows
+from speechdb.hierarchy import rebuild_embeddings
+from speechdb import signals
 import csv
+import functools
 import os
 import re
 import time
@@ -12,6 +17,12 @@ from django.core import serializers
 from git import Repo
 
 
+@functools.cache
+def choice_values(choices):
+    '''Valid values of a TextChoices class, computed once per class'''
+    return tuple(choices.values)
+
+
 def validate(s, choices=None, allow_na=False, na_value="", transform=None):
     '''Validate user input'''
     
@@ -24,11 +35,12 @@ def validate(s, choices=None, allow_na=False, na_value="", transform=None):
     
     # if choices, make sure s is one of them
     if choices is not None:
-        for val in list(choices.values):
+        values = choice_values(choices)
+        for val in values:
             if s.lower() == val.lower():
                 s = val
                 break
-        if s not in choices.values:
+        if s not in values:
             raise ValueError(f"Can't validate field value {s}")
 
     # if na, see whether allowed
@@ -41,8 +53,8 @@ def validate(s, choices=None, allow_na=False, na_value="", transform=None):
         return s
 
 
-def addAuthors(file):
-    '''Parse the authors list from a TSV file'''
+def readAuthors(file):
+    '''Parse the authors list from a TSV file, yielding unsaved Authors'''
     
     with open(file) as f:
         reader = csv.DictReader(f, delimiter='\t')
@@ -57,11 +69,21 @@ def addAuthors(file):
                 raise
             a.wd = validate(rec.get('wd'), allow_na=True)
             a.urn = validate(rec.get('urn'), allow_na=True)
-            a.save()
+            yield a
 
 
-def addWorks(file):
-    '''Parse the works list from a TSV file'''
+def addAuthors(file):
+    '''Parse the authors list from a TSV file'''
+    
+    for a in readAuthors(file):
+        a.save()
+
+
+def readWorks(file, authors):
+    '''Parse the works list from a TSV file, yielding unsaved Works
+    
+        - authors is a dictionary of Author objects indexed by id
+    '''
 
     with open(file) as f:
         reader = csv.DictReader(f, delimiter='\t')
@@ -71,7 +93,7 @@ def addWorks(file):
             w.id = int(validate(rec.get('id')))
             auth_id = int(validate(rec.get('author')))
             try:
-                w.author = Author.objects.get(id=auth_id)
+                w.author = authors[auth_id]
             except:
                 raise ValueError(f'Failed on work {w}: Can\'t parse author id "{auth_id}".')
 
@@ -80,12 +102,19 @@ def addWorks(file):
             w.wd = validate(rec.get('wd'), allow_na=True)
             w.urn = validate(rec.get('urn'), allow_na=True)
             w.tlg = validate(rec.get('tlg'), allow_na=True)
-            w.save()
+            yield w
+
+
+def addWorks(file):
+    '''Parse the works list from a TSV file'''
 
+    authors = Author.objects.in_bulk()
+    for w in readWorks(file, authors):
+        w.save()
 
 
-def addCharacters(file):
-    '''Parse the characters list from a TSV file
+def readCharacters(file):
+    '''Parse the characters list from a TSV file, yielding unsaved Characters
     
         NEW VERSION!
     '''
@@ -120,7 +149,14 @@ def addCharacters(file):
             # notes
             c.notes = validate(rec.get('notes'), allow_na=True)
         
-            c.save()
+            yield c
+
+
+def addCharacters(file):
+    '''Parse the characters list from a TSV file'''
+
+    for c in readCharacters(file):
+        c.save()
 
 
 
@@ -132,6 +168,11 @@ def getInstances(file):
         a dictionary indexing instance attributes by name.
     '''
     
+    # index characters by name once, rather than querying per record
+    chars_by_name = {}
+    for c in Character.objects.all():
+        chars_by_name.setdefault(c.name, []).append(c)
+    
     with open(file) as f:
         reader = csv.DictReader(f, delimiter='\t')
         
@@ -155,85 +196,119 @@ def getInstances(file):
             # if instance of, check character list
             char_name = validate(rec.get('instance of'), allow_na=True)
             if char_name:
-                qs = Character.objects.filter(name=char_name)
+                qs = chars_by_name.get(char_name, [])
                 if len(qs) < 1:
                     raise ValueError(f"Instance failed on character name: {rec}")
                 elif len(qs) > 1:
                     raise IntegrityError(f"Instance matches two character names: {rec}")
                 else:
-                    inst["char"] = qs.first()
+                    inst["char"] = qs[0]
                     
             # otherwise, check instance name against character list
             else:
-                qs = Character.objects.filter(name=inst["name"])
+                qs = chars_by_name.get(inst["name"], [])
                 if len(qs) > 1:
                     raise IntegrityError(f"Instance matches two character names: {rec}")
                 elif len(qs) == 1:
-                    inst["char"] = qs.first()
+                    inst["char"] = qs[0]
             
             instances[inst["name"]] = inst
             
     return instances
             
 
+def readSpeech(rec, works):
+    '''Parse the scalar fields of one speech record into an unsaved Speech
+    
+        - works is a dictionary of Work objects indexed by id
+        - cluster and character instances are left to the caller
+    '''
+    
+    s = Speech()
+    
+    try:
+        # sequence
+        s.seq = int(validate(rec.get('seq')))
+
+        # locus
+        book_fi = validate(rec.get('from_book'), allow_na=True)
+        if book_fi:
+            book_fi += '.'
+        else:
+            book_fi = ''
+    
+        book_la = validate(rec.get('to_book'), allow_na=True)
+        if book_la:
+            book_la += '.'
+        else:
+            book_la = ''
+
+        line_fi = validate(rec.get('from_line'))
+        line_la = validate(rec.get('to_line'))
+
+        s.l_fi = book_fi + line_fi
+        s.l_la = book_la + line_la
+        s.set_locus_fields()
+
+        # work
+        work_id = int(validate(rec.get('work_id')))
+        s.work = works[work_id]
+
+        # cluster type
+        s.type = validate(rec.get('turn_type'), choices=Speech.SpeechType, transform=lambda s: s[0])
+
+        # cluster part
+        s.part = int(validate(rec.get('cluster_part')))
+    
+        # embeddedness
+        s.level = int(validate(rec.get('embedded_level')))
+
+        # speaker notes
+        s.spkr_notes = validate(rec.get('speaker_notes'), allow_na=True)
+
+        # addressee notes
+        s.addr_notes = validate(rec.get('addressee_notes'), allow_na=True)
+
+        # general notes
+        s.notes = validate(rec.get('misc_notes'), allow_na=True)
+
+    except (ValueError, KeyError) as e:
+        raise CommandError(f"Can't read speech seq {rec.get('seq')!r} "
+                           f"of work {rec.get('work_id')!r}: {e!r}") from e
+    
+    return s
+
+
+def readTags(rec, s):
+    '''Parse the speech type tags of one speech record as (type, doubt) pairs'''
+    
+    tag_str = validate(rec.get('short_speech_type'), allow_na=True)
+    for tag in tag_str.split(';'):
+        tag = tag.strip().lower()
+        doubt = tag.endswith('?')
+        tag = tag.strip(' ?')
+        if tag is not None and len(tag) > 0:
+            if tag not in choice_values(SpeechTag.TagType):
+                raise ValueError(f"speech {s} failed on undefined tag {tag}")
+            yield tag, doubt
+
+
 def addSpeeches(file, instances):
     '''Parse the speeches list from a TSV file'''
     
+    works = Work.objects.select_related('author').in_bulk()
+    
     with open(file) as f:
         reader = csv.DictReader(f, delimiter='\t')
     
         for rec in reader:
-            try:
-                s = Speech()
-        
-                # sequence
-                s.seq = int(validate(rec.get('seq')))
-        
-                # locus
-                book_fi = validate(rec.get('from_book'), allow_na=True)
-                if book_fi:
-                    book_fi += '.'
-                else:
-                    book_fi = ''
+            s = readSpeech(rec, works)
             
-                book_la = validate(rec.get('to_book'), allow_na=True)
-                if book_la:
-                    book_la += '.'
-                else:
-                    book_la = ''
-
-                line_fi = validate(rec.get('from_line'))
-                line_la = validate(rec.get('to_line'))
-    
-                s.l_fi = book_fi + line_fi
-                s.l_la = book_la + line_la
-        
-                # work
-                work_id = int(validate(rec.get('work_id')))
-                s.work = Work.objects.get(id=work_id)            
-
-                # cluster type
-                s.type = validate(rec.get('turn_type'), choices=Speech.SpeechType, transform=lambda s: s[0])
-        
+            try:
                 # cluster_id
                 cluster_id = int(validate(rec.get('cluster_id')))
                 s.cluster, cluster_created = SpeechCluster.objects.get_or_create(id=cluster_id)
 
-                # cluster part
-                s.part = int(validate(rec.get('cluster_part')))
-            
-                # embeddedness
-                s.level = int(validate(rec.get('embedded_level')))
-        
-                # speaker notes
-                s.spkr_notes = validate(rec.get('speaker_notes'), allow_na=True)
-        
-                # addressee notes
-                s.addr_notes = validate(rec.get('addressee_notes'), allow_na=True)
-        
-                # general notes
-                s.notes = validate(rec.get('misc_notes'), allow_na=True)
-
                 # speech must be saved before adding character instances
                 s.save()
 
@@ -294,41 +369,181 @@ def addSpeeches(file, instances):
             s.save()
             
             # speech type tags
-            tag_str = validate(rec.get('short_speech_type'), allow_na=True)
-            for tag in tag_str.split(';'):
-                tag = tag.strip().lower()
-                doubt = tag.endswith('?')
-                tag = tag.strip(' ?')
-                if tag is not None and len(tag) > 0:
-                    if tag not in SpeechTag.TagType.values:
-                        raise ValueError(f"speech {s} failed on undefined tag {tag}")
-                    t = SpeechTag(type=tag, speech=s, doubt=doubt)
-                    t.save()
+            for tag, doubt in readTags(rec, s):
+                t = SpeechTag(type=tag, speech=s, doubt=doubt)
+                t.save()
+
+
+def bulkAddSpeeches(files, instances):
+    '''Parse all speech files into memory and write them with bulk_create
+    
+        works, clusters and character instances are resolved against
+        dictionaries instead of the database; speeches, speaker/addressee
+        through rows and tags are then each written in one pass.
+    '''
+    
+    works = Work.objects.select_related('author').in_bulk()
+    clusters = {}
+    insts = {}
+    speeches = []
+    
+    def getInstance(name, context, s, role):
+        if name not in instances:
+            raise ValueError(f"speech {s} failed on {role} {name}")
+        key = (name, context)
+        if key not in insts:
+            insts[key] = CharacterInstance(context=context, **instances[name])
+        return insts[key]
+    
+    for file in files:
+        with open(file) as f:
+            reader = csv.DictReader(f, delimiter='\t')
             
+            for rec in reader:
+                s = readSpeech(rec, works)
+                
+                # cluster_id
+                cluster_id = int(validate(rec.get('cluster_id')))
+                if cluster_id not in clusters:
+                    clusters[cluster_id] = SpeechCluster(id=cluster_id)
+                s.cluster = clusters[cluster_id]
+                
+                # generate context from work
+                context = s.work.get_long_name()
+                
+                # speakers, de-duplicated but in file order
+                spkr = []
+                for name in validate(rec.get('speaker')).split(';'):
+                    inst = getInstance(name, context, s, 'speaker')
+                    if inst not in spkr:
+                        spkr.append(inst)
+                assert len(spkr) > 0
+                
+                # addressees; "self" is the first speaker in name order,
+                #   matching spkr.first() in the row-at-a-time loader
+                addr = []
+                for name in validate(rec.get('addressee')).split(';'):
+                    if name == 'self':
+                        inst = min(spkr, key=lambda i: i.name)
+                    else:
+                        inst = getInstance(name, context, s, 'addressee')
+                    if inst not in addr:
+                        addr.append(inst)
+                assert len(addr) > 0
+                
+                tags = list(readTags(rec, s))
+                
+                speeches.append((s, spkr, addr, tags))
+    
+    # cluster sort-order: first appearance in default speech order
+    #   (work author, work title, seq); see setClusterOrder()
+    sort_key = 0
+    seen = set()
+    for s, _, _, _ in sorted(speeches, key=lambda rec: (rec[0].work.author.name, rec[0].work.title, rec[0].seq)):
+        if s.cluster.id not in seen:
+            seen.add(s.cluster.id)
+            s.cluster.seq = sort_key
+            sort_key += 1
+    
+    # clusters and instances first, so speeches can point to them
+    cluster_list = list(clusters.values())
+    SpeechCluster.assign_public_ids(cluster_list)
+    SpeechCluster.objects.bulk_create(cluster_list)
+    
+    inst_list = list(insts.values())
+    CharacterInstance.assign_public_ids(inst_list)
+    CharacterInstance.objects.bulk_create(inst_list)
+    
+    # speeches
+    speech_list = [s for s, _, _, _ in speeches]
+    for s in speech_list:
+        s.cluster_id = s.cluster.id
+    Speech.assign_public_ids(speech_list)
+    Speech.objects.bulk_create(speech_list)
+    
+    # speaker/addressee through rows and tags
+    SpkrThrough = Speech.spkr.through
+    AddrThrough = Speech.addr.through
+    spkr_rows = []
+    addr_rows = []
+    tag_list = []
+    for s, spkr, addr, tags in speeches:
+        spkr_rows.extend(SpkrThrough(speech_id=s.id, characterinstance_id=inst.id) for inst in spkr)
+        addr_rows.extend(AddrThrough(speech_id=s.id, characterinstance_id=inst.id) for inst in addr)
+        tag_list.extend(SpeechTag(type=tag, speech=s, doubt=doubt) for tag, doubt in tags)
+    
+    SpkrThrough.objects.bulk_create(spkr_rows)
+    AddrThrough.objects.bulk_create(addr_rows)
+    SpeechTag.assign_public_ids(tag_list)
+    SpeechTag.objects.bulk_create(tag_list)
+
+
+def setClusterOrder():
+    '''Set sort-order for speech clusters by first appearance in speech order'''
+    
+    cluster_index = {}
+    sort_key = 0
+    for cluster_id in Speech.objects.values_list('cluster_id', flat=True):
+        if cluster_id not in cluster_index:
+            cluster_index[cluster_id] = sort_key
+            sort_key += 1
+    
+    clusters = list(SpeechCluster.objects.all())
+    for cluster in clusters:
+        cluster.seq = cluster_index[cluster.pk]
+    SpeechCluster.objects.bulk_update(clusters, ['seq'], batch_size=1000)
+
 
 class Command(BaseCommand):
     help = 'Check data integrity?'
     
     def add_arguments(self, parser):
         parser.add_argument('path', type=str)
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Parse the whole corpus into memory and write each table with bulk_create, in one transaction'
+        )
     
     def handle(self, *args, **options):
-        path = options['path']
-
+        # derived tables are rebuilt once at the end, not row by row
+        with signals.paused():
+            if options['bulk']:
+                with transaction.atomic():
+                    self.ingest(options['path'], bulk=True)
+            else:
+                self.ingest(options['path'])
+    
+    def ingest(self, path, bulk=False):
         # authors
         auth_file = os.path.join(path, 'authors')
         self.stderr.write(f'Reading data from {auth_file}')
-        addAuthors(auth_file)
+        if bulk:
+            authors = list(readAuthors(auth_file))
+            Author.assign_public_ids(authors)
+            Author.objects.bulk_create(authors)
+        else:
+            addAuthors(auth_file)
 
         # works
         work_file = os.path.join(path, 'works')
         self.stderr.write(f'Reading data from {work_file}')
-        addWorks(work_file)
+        if bulk:
+            works = list(readWorks(work_file, Author.objects.in_bulk()))
+            Work.assign_public_ids(works)
+            Work.objects.bulk_create(works)
+        else:
+            addWorks(work_file)
 
         # characters
         char_file = os.path.join(path, 'characters')
         self.stderr.write(f'Reading data from {char_file}')
-        addCharacters(char_file)
+        if bulk:
+            chars = list(readCharacters(char_file))
+            Character.assign_public_ids(chars)
+            Character.objects.bulk_create(chars)
+        else:
+            addCharacters(char_file)
 
         # instances
         inst_file = os.path.join(path, 'instances')
@@ -338,21 +553,26 @@ class Command(BaseCommand):
         # speeches, clusters, and char instances
         speech_files = [os.path.join(path, f) for f in sorted(os.listdir(path))
                         if f.startswith('speeches')]
-        for speech_file in speech_files:
-            self.stderr.write(f'Reading data from {speech_file}')
-            addSpeeches(speech_file, instances=instances)
+        if bulk:
+            for speech_file in speech_files:
+                self.stderr.write(f'Reading data from {speech_file}')
+            bulkAddSpeeches(speech_files, instances=instances)
+        else:
+            for speech_file in speech_files:
+                self.stderr.write(f'Reading data from {speech_file}')
+                addSpeeches(speech_file, instances=instances)
                         
-        # set sort-order for speech clusters
-        cluster_index = {}
-        sort_key = 0
-        for speech in Speech.objects.all():
-            cluster_id = speech.cluster.pk
-            if cluster_id not in cluster_index:
-                cluster_index[cluster_id] = sort_key
-                sort_key += 1
-        for cluster in SpeechCluster.objects.all():
-            cluster.seq = cluster_index[cluster.pk]
-            cluster.save()
+            # set sort-order for speech clusters
+            setClusterOrder()
+
+        # derived columns, the denormalized search table and the
+        #   embedding hierarchy
+        Speech.update_cluster_sizes()
+        Speech.update_work_ranks()
+        self.stderr.write('Building search table')
+        rebuild_search_rows()
+        self.stderr.write('Building speech hierarchy')
+        rebuild_embeddings()
         
         # get current git hash
         repo = Repo(search_parent_directories=True)
@@ -364,4 +584,7 @@ class Command(BaseCommand):
         # metadata
         Metadata(name='version', value='1.1').save()
         Metadata(name='date', value=time.strftime('%Y-%m-%d %H:%M:%S %z')).save()
-        Metadata(name='git-commit', value=commit_hash).save()
\ No newline at end of file
+        Metadata(name='git-commit', value=commit_hash).save()
+
+        # invalidate in-memory indexes and caches
+        Work.mark_speeches_changed(Metadata.bump_generation())
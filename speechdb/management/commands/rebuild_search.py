@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from speechdb.models import Metadata, Work, Speech
+from speechdb.search import rebuild_search_rows
+from speechdb.hierarchy import rebuild_embeddings
+
+
+class Command(BaseCommand):
+    help = 'Recompute every derived speech column (line counts, parsed loci, cluster sizes, work ranks) and rebuild the speech search and hierarchy tables'
+
+    def handle(self, *args, **options):
+        # every derived speech column, for rows written without save()
+        k = Speech.update_locus_fields()
+        Speech.update_cluster_sizes()
+        Speech.update_work_ranks()
+        n = rebuild_search_rows()
+        m = rebuild_embeddings()
+        Work.mark_speeches_changed(Metadata.bump_generation())
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rederived line columns of {k} speeches; wrote {n} search rows, {m} hierarchy rows'))
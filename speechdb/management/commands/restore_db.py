@@ -0,0 +1,337 @@
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.serializers.base import DeserializationError
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from speechdb.chunkstore import ChunkStore, read_manifest
+from speechdb.models import Metadata, Work, Speech, SpeechSearchRow, SpeechEmbedding
+from speechdb.search import rebuild_search_rows
+from speechdb.hierarchy import rebuild_embeddings
+from speechdb import signals
+
+# rows inserted per statement
+BATCH_SIZE = 2000
+
+# backup file read at a time
+BLOCK_SIZE = 1024 * 1024
+
+
+def read_blocks(manifest_file):
+    '''the bytes of a backup_db backup, checked against its manifest'''
+    manifest = read_manifest(manifest_file)
+    if 'chunks' in manifest:
+        yield from ChunkStore(manifest_file.parent / 'chunks').read(manifest)
+        return
+
+    sha256 = hashlib.sha256()
+    with gzip.open(manifest_file.parent / manifest['file'], 'rb') as f:
+        while data := f.read(BLOCK_SIZE):
+            sha256.update(data)
+            yield data
+    if sha256.hexdigest() != manifest['sha256']:
+        raise ValueError("backup does not match its manifest")
+
+
+def read_lines(blocks):
+    '''lines of a stream of byte blocks'''
+    pending = b''
+    for data in blocks:
+        lines = (pending + data).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def read_fixture(path):
+    '''records of a fixture file: .json or .jsonl, optionally gzipped'''
+    opener = gzip.open if path.suffix == '.gz' else open
+    name = path.stem if path.suffix == '.gz' else path.name
+    if name.endswith('.jsonl'):
+        with opener(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif name.endswith('.json'):
+        with opener(path, 'rb') as f:
+            yield from json.load(f)
+    else:
+        raise CommandError(f"Not a fixture or backup manifest: {path.name}")
+
+
+def speechdb_models():
+    '''the speechdb models, M2M tables included'''
+    return list(apps.get_app_config('speechdb').get_models(include_auto_created=True))
+
+
+class TableLoader:
+    '''INSERT parameters for one model's fixture records, converted by
+        each field as the ORM would, but without building instances
+    '''
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = model._meta.concrete_fields
+        self.table = model._meta.db_table
+        self.sql = self._insert(self.table, [field.column for field in self.fields])
+        self.m2m = {
+            field.name: (field.remote_field.through._meta.db_table, self._insert(
+                field.remote_field.through._meta.db_table, [field.m2m_column_name(), field.m2m_reverse_name()]))
+            for field in model._meta.many_to_many if field.remote_field.through._meta.auto_created
+        }
+
+    @staticmethod
+    def _insert(table, columns):
+        qn = connection.ops.quote_name
+        return (f"INSERT INTO {qn(table)} ({', '.join(qn(column) for column in columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))})")
+
+    def row(self, pk, values):
+        if self.model is Speech:
+            # derived columns, absent from fixtures made before they were
+            speech = Speech(l_fi=values['l_fi'], l_la=values['l_la'])
+            speech.set_locus_fields()
+            values = {**values, **{name: getattr(speech, name) for name in Speech.LOCUS_FIELDS}}
+
+        params = []
+        for field in self.fields:
+            if field.primary_key:
+                value = pk
+            elif field.name in values:
+                value = values[field.name]
+            else:
+                # a field added since the fixture was made
+                value = field.get_default()
+            params.append(field.get_db_prep_save(field.to_python(value), connection))
+        return params
+
+
+def bulk_load(records):
+    '''Insert fixture records with executemany(), a batch at a time, and
+        their M2M ids straight into the through tables
+
+        Returns {table: rows inserted}.
+    '''
+    loaders = {}
+    pending = {}
+    counts = {}
+
+    def add(table, sql, params):
+        batch = pending.setdefault((table, sql), [])
+        batch.append(params)
+        if len(batch) >= BATCH_SIZE:
+            insert(table, sql)
+
+    def insert(table, sql):
+        batch = pending.pop((table, sql), [])
+        if batch:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            counts[table] = counts.get(table, 0) + len(batch)
+
+    for record in records:
+        label = record['model']
+        if label not in loaders:
+            try:
+                loaders[label] = TableLoader(apps.get_model(label))
+            except (LookupError, ValueError):
+                # a model since removed
+                loaders[label] = None
+        loader = loaders[label]
+        if loader is None:
+            continue
+
+        values = record.get('fields', {})
+        try:
+            pk = loader.model._meta.pk.to_python(record['pk'])
+            add(loader.table, loader.sql, loader.row(pk, values))
+        except (KeyError, ValidationError) as e:
+            raise DeserializationError(f"{label} {record.get('pk')}: {e}")
+        for name, (table, sql) in loader.m2m.items():
+            for related in values.get(name, ()):
+                add(table, sql, [pk, related])
+
+    for table, sql in list(pending):
+        insert(table, sql)
+    return counts
+
+
+class Command(BaseCommand):
+    help = 'Replace the speechdb tables with a backup_db backup or a fixture, bulk-loaded and verified'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source',
+            type=str,
+            help='Backup manifest (*.manifest.json), backup directory (latest fixture backup), '
+                 'or fixture file (.json/.jsonl, optionally .gz)'
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false',
+            dest='interactive',
+            help='Do not ask for confirmation before replacing the data'
+        )
+
+    def handle(self, *args, **options):
+        source = self._resolve(Path(options['source']))
+        manifest = read_manifest(source) if source.name.endswith('.manifest.json') else None
+
+        if options['interactive']:
+            confirm = input(
+                f"This will replace all speechdb data in the "
+                f"'{settings.DATABASES['default']['NAME']}' database with {source.name}.\n"
+                "Type 'yes' to continue, or 'no' to cancel: "
+            )
+            if confirm != 'yes':
+                self.stdout.write("Restore cancelled.")
+                return
+
+        if manifest is not None and manifest['format'] == 'sql':
+            self._restore_sql(source, manifest)
+        else:
+            self._restore_fixture(source, manifest)
+
+    def _resolve(self, source):
+        '''the manifest or fixture file to restore from'''
+        if not source.exists():
+            raise CommandError(f"No such backup: {source}")
+        if not source.is_dir():
+            return source
+
+        manifests = sorted(source.glob('dices_fixture_*.manifest.json'))
+        if manifests:
+            return manifests[-1]
+        if any(source.glob('speeches.tsv*')):
+            raise CommandError(
+                f"{source} is an export_archive export, which can't be restored: it leaves out "
+                "record ids and public ids, and names speakers rather than linking them. "
+                "Restore a backup_db backup instead."
+            )
+        raise CommandError(f"No fixture backups in {source}")
+
+    def _restore_fixture(self, source, manifest):
+        if manifest is not None:
+            records = (json.loads(line) for line in read_lines(read_blocks(source)) if line.strip())
+        else:
+            records = read_fixture(source)
+
+        models = speechdb_models()
+        tables = [model._meta.db_table for model in models]
+        generation = Metadata.get_generation()
+
+        self.stdout.write(f"Restoring from {source}...")
+        try:
+            with signals.paused(), transaction.atomic():
+                with connection.constraint_checks_disabled():
+                    connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables))
+                    counts = bulk_load(records)
+                # constraints are checked once, over the loaded tables
+                connection.check_constraints(table_names=tables)
+
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                        cursor.execute(sql)
+
+                if manifest is not None:
+                    self._verify_counts(manifest)
+                self.stdout.write(self.style.SUCCESS(
+                    f"✓ Loaded {sum(counts.values())} rows into {len(counts)} tables"))
+
+                # derived data, for fixtures made before it was kept
+                Speech.update_cluster_sizes()
+                Speech.update_work_ranks()
+                if not counts.get(SpeechSearchRow._meta.db_table):
+                    self.stdout.write("Building search table")
+                    rebuild_search_rows()
+                if not counts.get(SpeechEmbedding._meta.db_table):
+                    self.stdout.write("Building speech hierarchy")
+                    rebuild_embeddings()
+
+                self._advance_generation(generation)
+        except (DeserializationError, ValueError, OSError) as e:
+            raise CommandError(f"Restore failed, nothing changed: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"\n✓ Restore complete from {source.name}"))
+
+    def _restore_sql(self, source, manifest):
+        '''pipe a pg_dump backup to psql; the database should be empty'''
+        db_config = settings.DATABASES['default']
+        if 'postgresql' not in db_config['ENGINE']:
+            raise CommandError(f"{source.name} is a pg_dump backup, but the database is {db_config['ENGINE']}")
+
+        env = os.environ.copy()
+        if db_config.get('PASSWORD'):
+            env['PGPASSWORD'] = db_config['PASSWORD']
+        cmd = ['psql', '-v', 'ON_ERROR_STOP=1', '--single-transaction', '--quiet']
+        if db_config.get('HOST'):
+            cmd.extend(['-h', db_config['HOST']])
+        if db_config.get('PORT'):
+            cmd.extend(['-p', str(db_config['PORT'])])
+        if db_config.get('USER'):
+            cmd.extend(['-U', db_config['USER']])
+        cmd.extend(['-d', db_config['NAME']])
+
+        self.stdout.write(f"Restoring from {source}...")
+        generation = Metadata.get_generation() if 'speechdb_metadata' in connection.introspection.table_names() else 0
+        connection.close()
+        try:
+            proc = subprocess.Popen(cmd, env=env, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+        except OSError as e:
+            raise CommandError(f"psql failed: {e}")
+        try:
+            for data in read_blocks(source):
+                proc.stdin.write(data)
+        except ValueError as e:
+            # psql is inside one transaction: closing its input short of
+            #   the end rolls it back
+            proc.kill()
+            raise CommandError(f"Restore failed, nothing changed: {e}")
+        finally:
+            proc.stdin.close()
+        if proc.wait():
+            raise CommandError("psql failed; see its messages above")
+
+        # psql has committed: the data is replaced whatever the counts say
+        try:
+            self._verify_counts(manifest)
+        except ValueError as e:
+            self._advance_generation(generation)
+            raise CommandError(f"Restore applied, but its counts don't match the manifest: {e}")
+        self._advance_generation(generation)
+        self.stdout.write(self.style.SUCCESS(f"\n✓ Restore complete from {source.name}"))
+
+    def _verify_counts(self, manifest):
+        """Compare table row counts with those the backup recorded"""
+
+        counts = {model._meta.db_table: model._default_manager.count() for model in speechdb_models()}
+        wrong = [
+            f"{table}: {counts.get(table)} rows, backup had {expected}"
+            for table, expected in manifest['counts'].items() if counts.get(table) != expected
+        ]
+        if wrong:
+            raise ValueError("row counts differ from the backup's: " + "; ".join(wrong))
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Verified {len(counts)} tables and checksum against the manifest"))
+
+    def _advance_generation(self, generation):
+        """Move the data generation past both the restored and the replaced
+        data's, so no cache or index built from either is used, and mark
+        every work's speeches as changed in it"""
+
+        restored = Metadata.get_generation()
+        if restored < generation:
+            record = Metadata.objects.filter(name=Metadata.GENERATION).first() \
+                or Metadata(name=Metadata.GENERATION)
+            record.value = str(generation)
+            record.save()
+        Work.mark_speeches_changed(Metadata.bump_generation())
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0005_speech_embedded_in'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='author',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=8, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='character',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=8, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='characterinstance',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=8, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='metadata',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=8, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='speech',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=8, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='speechcluster',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=8, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='speechtag',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=8, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='work',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=8, unique=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0006_alter_author_public_id_alter_character_public_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(fields=['name', 'id'], name='speechdb_ch_name_db1a9e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='characterinstance',
+            index=models.Index(fields=['name', 'id'], name='speechdb_ch_name_64a699_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='speech',
+            index=models.Index(fields=['work', 'seq', 'id'], name='speechdb_sp_work_id_737d3e_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_search_rows(apps, schema_editor):
+    from speechdb.search import rebuild_search_rows
+    rebuild_search_rows(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0007_character_speechdb_ch_name_db1a9e_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpeechSearchRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('spkr', 'Speaker'), ('addr', 'Addressee')], max_length=4)),
+                ('inst_pubid', models.CharField(db_index=True, max_length=8)),
+                ('inst_name', models.CharField(db_index=True, max_length=128)),
+                ('inst_display', models.CharField(db_index=True, max_length=128)),
+                ('inst_being', models.CharField(db_index=True, max_length=16)),
+                ('inst_number', models.CharField(db_index=True, max_length=16)),
+                ('inst_gender', models.CharField(db_index=True, max_length=16)),
+                ('inst_anon', models.BooleanField(db_index=True)),
+                ('inst_disguise', models.CharField(blank=True, db_index=True, default='', max_length=128)),
+                ('inst_changed', models.CharField(db_index=True, max_length=16)),
+                ('char_pubid', models.CharField(db_index=True, max_length=8, null=True)),
+                ('char_name', models.CharField(db_index=True, max_length=128, null=True)),
+                ('char_being', models.CharField(db_index=True, max_length=16, null=True)),
+                ('char_number', models.CharField(db_index=True, max_length=16, null=True)),
+                ('char_gender', models.CharField(db_index=True, max_length=16, null=True)),
+                ('char_manto', models.CharField(db_index=True, max_length=32, null=True)),
+                ('char_wd', models.CharField(db_index=True, max_length=32, null=True)),
+                ('char_tt', models.CharField(db_index=True, max_length=32, null=True)),
+                ('work_title', models.CharField(db_index=True, max_length=128)),
+                ('work_lang', models.CharField(db_index=True, max_length=8)),
+                ('author_name', models.CharField(db_index=True, max_length=128)),
+                ('type', models.CharField(db_index=True, max_length=1)),
+                ('part', models.IntegerField(db_index=True)),
+                ('level', models.IntegerField(db_index=True)),
+                ('tags', models.CharField(blank=True, db_index=True, default='', max_length=128)),
+                ('cluster_size', models.IntegerField(db_index=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_rows', to='speechdb.author')),
+                ('char', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='search_rows', to='speechdb.character')),
+                ('cluster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_rows', to='speechdb.speechcluster')),
+                ('inst', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_rows', to='speechdb.characterinstance')),
+                ('speech', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_rows', to='speechdb.speech')),
+                ('work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_rows', to='speechdb.work')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['speech', 'role'], name='speechdb_sp_speech__a2bdca_idx')],
+            },
+        ),
+        migrations.RunPython(populate_search_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:48
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def populate_counts(apps, schema_editor):
+    from speechdb.models import count_lines
+    Speech = apps.get_model('speechdb', 'Speech')
+
+    sizes = (Speech.objects.filter(cluster_id=OuterRef('cluster_id')).order_by()
+             .values('cluster_id').annotate(n=Count('pk')).values('n'))
+    Speech.objects.update(cluster_size=Subquery(sizes))
+
+    speeches = list(Speech.objects.only('id', 'l_fi', 'l_la'))
+    for s in speeches:
+        s.n_lines = count_lines(s.l_fi, s.l_la)
+    Speech.objects.bulk_update(speeches, ['n_lines'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0008_speechsearchrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='speech',
+            name='cluster_size',
+            field=models.IntegerField(db_index=True, default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='speech',
+            name='n_lines',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
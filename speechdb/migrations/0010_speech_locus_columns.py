@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:56
+
+from django.db import migrations, models
+
+
+def populate_loci(apps, schema_editor):
+    from speechdb.models import parse_locus
+    Speech = apps.get_model('speechdb', 'Speech')
+
+    speeches = list(Speech.objects.only('id', 'l_fi', 'l_la'))
+    for s in speeches:
+        s.fi_book, s.fi_line, s.fi_suffix = parse_locus(s.l_fi) or (None, None, None)
+        s.la_book, s.la_line, s.la_suffix = parse_locus(s.l_la) or (None, None, None)
+    Speech.objects.bulk_update(speeches, [
+        'fi_book', 'fi_line', 'fi_suffix', 'la_book', 'la_line', 'la_suffix',
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0009_speech_cluster_size_n_lines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='speech',
+            name='fi_book',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='speech',
+            name='fi_line',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='speech',
+            name='fi_suffix',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='speech',
+            name='la_book',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='speech',
+            name='la_line',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='speech',
+            name='la_suffix',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='speech',
+            index=models.Index(fields=['work', 'fi_book', 'fi_line', 'fi_suffix'], name='speechdb_sp_work_id_295681_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='speech',
+            index=models.Index(fields=['work', 'la_book', 'la_line', 'la_suffix'], name='speechdb_sp_work_id_c990b0_idx'),
+        ),
+        migrations.RunPython(populate_loci, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_embeddings(apps, schema_editor):
+    from speechdb.hierarchy import rebuild_embeddings
+    rebuild_embeddings(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0010_speech_locus_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpeechEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='speechdb.speech')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='speechdb.speech')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='speechdb_sp_descend_539036_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_speech_embedding')],
+            },
+        ),
+        migrations.RunPython(populate_embeddings, migrations.RunPython.noop),
+    ]
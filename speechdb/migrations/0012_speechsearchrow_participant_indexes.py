@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0011_speechembedding'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='speechsearchrow',
+            index=models.Index(fields=['inst', 'role'], name='speechdb_sp_inst_id_ba1ef4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='speechsearchrow',
+            index=models.Index(fields=['char', 'role'], name='speechdb_sp_char_id_3ad186_idx'),
+        ),
+    ]
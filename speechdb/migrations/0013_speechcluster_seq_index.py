@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0012_speechsearchrow_participant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='speechcluster',
+            index=models.Index(fields=['seq', 'id'], name='speechdb_sp_seq_f87260_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:54
+
+from django.db import migrations, models
+
+
+def populate_ranks(apps, schema_editor):
+    Work = apps.get_model('speechdb', 'Work')
+    Speech = apps.get_model('speechdb', 'Speech')
+
+    ranks = Work.objects.order_by('author__name', 'title', 'id').values_list('id', flat=True)
+    for rank, work_id in enumerate(ranks):
+        Speech.objects.filter(work_id=work_id).update(work_rank=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0013_speechcluster_seq_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='speech',
+            name='work_rank',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='speech',
+            index=models.Index(fields=['work_rank', 'seq', 'id'], name='speechdb_sp_work_ra_d5fbe6_idx'),
+        ),
+        migrations.RunPython(populate_ranks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('speechdb', '0014_speech_work_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='work',
+            name='speech_generation',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,34 +1,64 @@
-from django.db import models, IntegrityError
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, OuterRef, Subquery
 from django.utils.functional import cached_property
 import re
 import secrets
 
 URN_BASE = "https://db.dices.mta.ca/app"
 
-def _locus_key(locus):
-    '''Parse a locus string (e.g. "345", "12.345", "12.345a") into a sortable
-    (book, line) tuple. Best-effort only: leading digits are taken from each
-    dot-separated part and anything else (editorial suffixes, etc.) is ignored.
+def parse_locus(locus):
+    '''Parse a locus string (e.g. "345", "12.345", "12.345a", "1.2.24") into
+    integer (book, line, suffix) columns, or None if the line doesn't start
+    with digits.
+        - book packs every dot-separated level before the line, three
+          digits to a level, so "1.2.24" has book 1002; no book is 0
+        - suffix numbers a trailing letter: none 0, a 1, b 2, ...
     '''
-    if not locus:
-        return (0, 0)
-    parts = str(locus).split('.', 1)
-    book_str, line_str = parts if len(parts) == 2 else ('0', parts[0])
+    book_str, _, line_str = str(locus).strip().rpartition('.')
+    m = re.match(r'(\d+)([a-zA-Z]?)', line_str)
+    if not m:
+        return None
 
-    def leading_int(s):
-        m = re.match(r'\d+', s.strip())
-        return int(m.group()) if m else 0
+    book = 0
+    for part in book_str.split('.') if book_str else ():
+        b = re.match(r'\d+', part)
+        book = book * 1000 + (int(b.group()) if b else 0)
 
-    return (leading_int(book_str), leading_int(line_str))
+    suffix = ord(m.group(2).lower()) - ord('a') + 1 if m.group(2) else 0
+    return (book, int(m.group(1)), suffix)
+
+
+def count_lines(l_fi, l_la):
+    '''Number of lines from l_fi to l_la inclusive, or None if it can't be
+    told from the loci alone: they lie in different books (whose lengths we
+    don't know), or a line number doesn't start with digits.
+    '''
+    book_fi, _, line_fi = str(l_fi).rpartition('.')
+    book_la, _, line_la = str(l_la).rpartition('.')
+    if book_fi != book_la:
+        return None
+
+    m_fi, m_la = re.match(r'\d+', line_fi), re.match(r'\d+', line_la)
+    if not (m_fi and m_la):
+        return None
+
+    n = int(m_la.group()) - int(m_fi.group()) + 1
+    return n if n > 0 else None
 
 class PublicIdModel(models.Model):
     '''a base class that incorporates a public-facing unique id in all records
-        - every new record gets a `public_id` field, a four-digit hex code
+        - every new record gets a `public_id` field, a hex code of
+          `public_id_length` digits: four by default
         - this is suitable for generating record-specific URNs
+        - large tables set a wider `public_id_length`; the column holds up
+          to eight digits, so existing four-digit ids stay valid
     '''
 
-    # expect four character string
-    public_id = models.CharField(max_length=4, unique=True, editable=False)
+    # four to eight character string
+    public_id = models.CharField(max_length=8, unique=True, editable=False)
+    
+    # hex digits in newly generated ids
+    public_id_length = 4
         
     class Meta:
          abstract = True
@@ -39,26 +69,92 @@ class PublicIdModel(models.Model):
         
         return f"{URN_BASE}/{self.__class__.__name__}/{self.public_id}"
     
+    @classmethod
+    def allocate_public_ids(cls, n, length=None):
+        '''return n new public_ids not already used by this model
+            - used ids are fetched in one query and checked in memory
+            - nothing is reserved: the unique constraint still arbitrates
+              if another writer claims one of these ids first
+        '''
+        
+        length = length or cls.public_id_length
+        space = 16 ** length
+        used = set(cls.objects.values_list('public_id', flat=True))
+        n_used = sum(1 for pid in used if len(pid) == length)
+        
+        if n > space - n_used:
+            raise IntegrityError(f"Only {space - n_used} unique public_ids of length {length} "
+                                 f"left for {n} new {cls.__name__} records")
+        
+        # dense tables: sample from an explicit list of the free ids
+        if (n_used + n) * 2 > space:
+            free = [pid for pid in (f"{k:0{length}X}" for k in range(space)) if pid not in used]
+            return secrets.SystemRandom().sample(free, n)
+        
+        # sparse tables: random draws rarely collide
+        ids = []
+        while len(ids) < n:
+            candidate = f"{secrets.randbits(4 * length):0{length}X}"
+            if candidate not in used:
+                used.add(candidate)
+                ids.append(candidate)
+        return ids
+    
+    @classmethod
+    def assign_public_ids(cls, objs, length=None):
+        '''fill in public_id on unsaved objects, e.g. ahead of bulk_create'''
+        
+        pending = [obj for obj in objs if not obj.public_id]
+        for obj, pid in zip(pending, cls.allocate_public_ids(len(pending), length)):
+            obj.public_id = pid
+        return objs
     
     # overload the save method to generate a unique public_id value
     def save(self, *args, **kwargs):
-        if not self.public_id:
-            for _ in range(100):
-                
-                # generate four-digit hex
-                candidate = f"{secrets.randbits(16):04X}"
-                if not type(self).objects.filter(public_id=candidate).exists():
-                    self.public_id = candidate
-                    break
-            else:
-                raise IntegrityError("No available unique public_id after 100 attempts")
-        super().save(*args, **kwargs)
+        if self.public_id:
+            return super().save(*args, **kwargs)
+        
+        # let the unique constraint catch collisions, so that two editors
+        #   saving at once can't both claim the same id
+        for _ in range(100):
+            self.public_id = f"{secrets.randbits(4 * self.public_id_length):0{self.public_id_length}X}"
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if not type(self).objects.filter(public_id=self.public_id).exists():
+                    self.public_id = ""
+                    raise
+        
+        self.public_id = ""
+        raise IntegrityError("No available unique public_id after 100 attempts")
 
 # Metadata about the database itself
 class Metadata(PublicIdModel):
     name = models.CharField(max_length=128, blank=False, unique=True)
     value = models.TextField()
 
+    # counter bumped on every committed write to the corpus, so that
+    # in-memory indexes and caches can tell when they are stale
+    GENERATION = 'generation'
+
+    @classmethod
+    def get_generation(cls):
+        '''current data generation'''
+        value = cls.objects.filter(name=cls.GENERATION).values_list('value', flat=True).first()
+        return int(value) if value else 0
+
+    @classmethod
+    def bump_generation(cls):
+        '''advance the data generation; returns the new value'''
+        with transaction.atomic():
+            record = cls.objects.select_for_update().filter(name=cls.GENERATION).first()
+            if record is None:
+                record = cls(name=cls.GENERATION, value='0')
+            record.value = str(int(record.value) + 1)
+            record.save()
+        return int(record.value)
+
 # Entity classes
 
 class Author(PublicIdModel):
@@ -89,6 +185,10 @@ class Work(PublicIdModel):
     author = models.ForeignKey(Author, on_delete=models.PROTECT)
     lang = models.CharField(max_length=8, choices=Language.choices)
     
+    # derived: the data generation in which the work's speeches last
+    #   changed, so that per-work indexes can tell when they are stale
+    speech_generation = models.IntegerField(default=0, editable=False)
+    
     class Meta:
         ordering = ['author', 'title']
 
@@ -97,6 +197,12 @@ class Work(PublicIdModel):
         return self.get_long_name()
 
     
+    @classmethod
+    def mark_speeches_changed(cls, generation, work_ids=None):
+        '''Record that the given works' speeches, or all, changed in generation'''
+        qs = cls.objects.all() if work_ids is None else cls.objects.filter(pk__in=work_ids)
+        return qs.update(speech_generation=generation)
+
     def get_long_name(self):
         '''Return common name as a string'''
         if self.author.name == "Anonymous":
@@ -140,6 +246,7 @@ class Character(PublicIdModel):
 
     class Meta:
         ordering = ['name']
+        indexes = [models.Index(fields=['name', 'id'])]
 
 
     def __str__(self):
@@ -151,6 +258,10 @@ class Character(PublicIdModel):
     def get_addresses(self):
         return Speech.objects.filter(addr__char__id=self.id)
 
+    def get_participations(self):
+        '''speeches with this character as speaker or addressee'''
+        return Speech.objects.filter(pk__in=self.search_rows.values('speech'))
+
 
 class CharacterInstance(PublicIdModel):
     '''A character engaged in a speech'''
@@ -164,6 +275,9 @@ class CharacterInstance(PublicIdModel):
         GENDER = ("gender", "Gender")
         METAMORPHOSIS = ("metamorphosis", "Metamorphosis")
         
+    # a row per character per appearance, outgrowing four digits
+    public_id_length = 6
+
     name = models.CharField(max_length=128)
     display = models.CharField(max_length=128)
     being = models.CharField(max_length=16, 
@@ -187,6 +301,7 @@ class CharacterInstance(PublicIdModel):
     
     class Meta:
         ordering = ['name']
+        indexes = [models.Index(fields=['name', 'id'])]
     
     def __str__(self):
         return self.get_long_name()
@@ -215,6 +330,7 @@ class SpeechCluster(PublicIdModel):
     
     class Meta:
         ordering = ['seq']
+        indexes = [models.Index(fields=['seq', 'id'])]
 
     seq = models.IntegerField(default=0)
 
@@ -290,6 +406,9 @@ class Speech(PublicIdModel):
         DIALOGUE = ('D', 'Dialogue')
         GENERAL = ('G', 'General')
     
+    # the largest tables, with SpeechTag: room to grow past 65,536 records
+    public_id_length = 6
+    
     cluster = models.ForeignKey(SpeechCluster, related_name='speeches', on_delete=models.CASCADE)
     work = models.ForeignKey(Work, on_delete=models.PROTECT)
     type = models.CharField(max_length=1, choices=SpeechType.choices)
@@ -306,11 +425,90 @@ class Speech(PublicIdModel):
             on_delete=models.SET_NULL, related_name='embedded_speeches')
     notes = models.CharField(max_length=256, blank=True, default="")
     
+    # derived: speeches in the cluster, kept current by the write signals;
+    #   and length in lines, set on save
+    cluster_size = models.IntegerField(default=1, db_index=True, editable=False)
+    
+    # derived: the work's place in list order (by author, then title), so
+    #   that speeches sort, and seek, on integer columns alone; kept
+    #   current by the write signals
+    work_rank = models.IntegerField(default=0, editable=False)
+    n_lines = models.IntegerField(null=True, blank=True, db_index=True, editable=False)
+    
+    # derived: first and last line parsed for range searches (parse_locus)
+    fi_book = models.IntegerField(null=True, blank=True, editable=False)
+    fi_line = models.IntegerField(null=True, blank=True, editable=False)
+    fi_suffix = models.IntegerField(null=True, blank=True, editable=False)
+    la_book = models.IntegerField(null=True, blank=True, editable=False)
+    la_line = models.IntegerField(null=True, blank=True, editable=False)
+    la_suffix = models.IntegerField(null=True, blank=True, editable=False)
+    
+    # columns set_locus_fields() derives
+    LOCUS_FIELDS = ['n_lines', 'fi_book', 'fi_line', 'fi_suffix', 'la_book', 'la_line', 'la_suffix']
+    
     class Meta:
         ordering = ['work', 'seq']
+        indexes = [
+            models.Index(fields=['work', 'seq', 'id']),
+            models.Index(fields=['work_rank', 'seq', 'id']),
+            models.Index(fields=['work', 'fi_book', 'fi_line', 'fi_suffix']),
+            models.Index(fields=['work', 'la_book', 'la_line', 'la_suffix']),
+        ]
     
     def __str__(self):
         return f'{self.work} {self.l_fi}-{self.l_la}'
+    
+    def save(self, *args, **kwargs):
+        self.set_locus_fields()
+        super().save(*args, **kwargs)
+    
+    def set_locus_fields(self):
+        '''Derive n_lines and the parsed locus columns from l_fi, l_la'''
+        self.n_lines = count_lines(self.l_fi, self.l_la)
+        self.fi_book, self.fi_line, self.fi_suffix = parse_locus(self.l_fi) or (None, None, None)
+        self.la_book, self.la_line, self.la_suffix = parse_locus(self.l_la) or (None, None, None)
+    
+    @classmethod
+    def update_locus_fields(cls, batch_size=2000):
+        '''Rederive the locus columns of every speech, e.g. after rows were
+        written without save() (loaddata, raw SQL, bulk_create); only rows
+        that change are written, a batch at a time
+        '''
+        n = 0
+        last = 0
+        while True:
+            batch = list(cls.objects.filter(pk__gt=last).order_by('pk')
+                         .only('id', 'l_fi', 'l_la', *cls.LOCUS_FIELDS)[:batch_size])
+            if not batch:
+                return n
+            last = batch[-1].pk
+            changed = []
+            for speech in batch:
+                old = [getattr(speech, name) for name in cls.LOCUS_FIELDS]
+                speech.set_locus_fields()
+                if [getattr(speech, name) for name in cls.LOCUS_FIELDS] != old:
+                    changed.append(speech)
+            n += cls.objects.bulk_update(changed, cls.LOCUS_FIELDS)
+    
+    @classmethod
+    def update_cluster_sizes(cls, cluster_ids=None):
+        '''Recount cluster_size for speeches in the given clusters, or all'''
+        sizes = (cls.objects.filter(cluster_id=OuterRef('cluster_id')).order_by()
+                 .values('cluster_id').annotate(n=Count('pk')).values('n'))
+        qs = cls.objects.all() if cluster_ids is None else cls.objects.filter(cluster_id__in=cluster_ids)
+        return qs.update(cluster_size=Subquery(sizes))
+    
+    @classmethod
+    def update_work_ranks(cls, work_ids=None):
+        '''Renumber work_rank for speeches in the given works, or all,
+        touching only rows whose rank has changed
+        '''
+        ranks = Work.objects.order_by('author__name', 'title', 'id').values_list('id', flat=True)
+        n = 0
+        for rank, work_id in enumerate(ranks):
+            if work_ids is None or work_id in work_ids:
+                n += cls.objects.filter(work_id=work_id).exclude(work_rank=rank).update(work_rank=rank)
+        return n
         
     def get_urn(self):
         '''Return CTS URN for the whole speech'''
@@ -332,6 +530,16 @@ class Speech(PublicIdModel):
             t += str(self.part)
         return t
 
+    def get_ancestors(self):
+        '''Return the speeches this one is embedded in, outermost first'''
+        return (Speech.objects.filter(descendant_links__descendant=self, descendant_links__depth__gt=0)
+                .order_by('-descendant_links__depth'))
+    
+    def get_descendants(self):
+        '''Return every speech embedded in this one, at any depth, in speech order'''
+        return (Speech.objects.filter(ancestor_links__ancestor=self, ancestor_links__depth__gt=0)
+                .annotate(depth=models.F('ancestor_links__depth')))
+
     @classmethod
     def guess_enclosing(cls, work, l_fi, l_la, level=None, exclude_pk=None):
         '''Best-guess the enclosing speech for a (work, l_fi, l_la, level) locus:
@@ -344,26 +552,29 @@ class Speech(PublicIdModel):
         line-tightest match with an unexpected level is itself worth surfacing
         rather than hiding. A suggestion only -- always meant to be overridable.
         '''
-        fi_key, la_key = _locus_key(l_fi), _locus_key(l_la)
+        from .intervals import get_index
 
-        qs = cls.objects.filter(work=work)
-        if exclude_pk is not None:
-            qs = qs.exclude(pk=exclude_pk)
+        fi_key, la_key = parse_locus(l_fi), parse_locus(l_la)
+        if fi_key is None or la_key is None:
+            return None
+        work_id = work.pk if isinstance(work, Work) else int(work)
 
+        # candidates come from the work's interval index; ties go to the
+        #   earliest in speech order
         best, best_key = None, None
-        for candidate in qs:
-            c_fi, c_la = _locus_key(candidate.l_fi), _locus_key(candidate.l_la)
-            if not (c_fi <= fi_key and c_la >= la_key and (c_fi, c_la) != (fi_key, la_key)):
+        for c_fi, c_la, c_level, seq, pk in get_index(work_id).enclosing(fi_key, la_key):
+            if (c_fi, c_la) == (fi_key, la_key) or str(pk) == str(exclude_pk):
                 continue
 
             if level is not None:
-                key = (c_fi, candidate.level if candidate.level < level else -1)
+                key = (c_fi, c_level if c_level < level else -1, -seq)
             else:
-                key = (c_fi,)
+                key = (c_fi, -seq)
 
             if best is None or key > best_key:
-                best, best_key = candidate, key
-        return best
+                best, best_key = pk, key
+
+        return cls.objects.filter(pk=best).first() if best is not None else None
 
 
 class SpeechTag(PublicIdModel):
@@ -398,8 +609,94 @@ class SpeechTag(PublicIdModel):
         WARNING = ('war', 'Warning')
         UNDEFINED = ('und', 'Undefined')
 
+    public_id_length = 6
+
     type = models.CharField(max_length=3, choices=TagType.choices, 
                                 default=TagType.UNDEFINED)
     doubt = models.BooleanField(default=False)
     notes = models.CharField(max_length=128, blank=True, default="")
     speech = models.ForeignKey(Speech, on_delete=models.CASCADE, related_name='tags')
+
+
+class SpeechSearchRow(models.Model):
+    '''A flattened speech search record: one row per speech participant
+        - denormalizes the speech, its work and author, and the participant's
+          instance and character, so searches need no joins
+        - derived data: kept current by speechdb.signals and rebuilt
+          wholesale by speechdb.search.rebuild_search_rows()
+    '''
+
+    class Role(models.TextChoices):
+        SPEAKER = ('spkr', 'Speaker')
+        ADDRESSEE = ('addr', 'Addressee')
+
+    speech = models.ForeignKey(Speech, on_delete=models.CASCADE, related_name='search_rows')
+    role = models.CharField(max_length=4, choices=Role.choices)
+
+    # participant instance
+    inst = models.ForeignKey(CharacterInstance, on_delete=models.CASCADE, related_name='search_rows')
+    inst_pubid = models.CharField(max_length=8, db_index=True)
+    inst_name = models.CharField(max_length=128, db_index=True)
+    inst_display = models.CharField(max_length=128, db_index=True)
+    inst_being = models.CharField(max_length=16, db_index=True)
+    inst_number = models.CharField(max_length=16, db_index=True)
+    inst_gender = models.CharField(max_length=16, db_index=True)
+    inst_anon = models.BooleanField(db_index=True)
+    inst_disguise = models.CharField(max_length=128, blank=True, default="", db_index=True)
+    inst_changed = models.CharField(max_length=16, db_index=True)
+
+    # participant character; null throughout for instances without one
+    char = models.ForeignKey(Character, null=True, on_delete=models.SET_NULL, related_name='search_rows')
+    char_pubid = models.CharField(max_length=8, null=True, db_index=True)
+    char_name = models.CharField(max_length=128, null=True, db_index=True)
+    char_being = models.CharField(max_length=16, null=True, db_index=True)
+    char_number = models.CharField(max_length=16, null=True, db_index=True)
+    char_gender = models.CharField(max_length=16, null=True, db_index=True)
+    char_manto = models.CharField(max_length=32, null=True, db_index=True)
+    char_wd = models.CharField(max_length=32, null=True, db_index=True)
+    char_tt = models.CharField(max_length=32, null=True, db_index=True)
+
+    # speech, work and author
+    work = models.ForeignKey(Work, on_delete=models.CASCADE, related_name='search_rows')
+    work_title = models.CharField(max_length=128, db_index=True)
+    work_lang = models.CharField(max_length=8, db_index=True)
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='search_rows')
+    author_name = models.CharField(max_length=128, db_index=True)
+    type = models.CharField(max_length=1, db_index=True)
+    part = models.IntegerField(db_index=True)
+    level = models.IntegerField(db_index=True)
+    tags = models.CharField(max_length=128, blank=True, default="", db_index=True)
+    cluster = models.ForeignKey(SpeechCluster, on_delete=models.CASCADE, related_name='search_rows')
+    cluster_size = models.IntegerField(db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['speech', 'role']),
+            models.Index(fields=['inst', 'role']),
+            models.Index(fields=['char', 'role']),
+        ]
+
+    def __str__(self):
+        return f'{self.speech_id} {self.role} {self.inst_name}'
+
+
+class SpeechEmbedding(models.Model):
+    '''A closure table over Speech.embedded_in: one row per (ancestor,
+    descendant) pair in the embedding hierarchy
+        - every speech is also paired with itself, at depth 0
+        - derived data: kept current by speechdb.signals and rebuilt
+          wholesale by speechdb.hierarchy.rebuild_embeddings()
+    '''
+
+    ancestor = models.ForeignKey(Speech, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Speech, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_speech_embedding'),
+        ]
+        indexes = [models.Index(fields=['descendant', 'depth'])]
+
+    def __str__(self):
+        return f'{self.ancestor_id} > {self.descendant_id} ({self.depth})'
@@ -0,0 +1,293 @@
+'''Keyset (seek) pagination for the HTML list views and the API
+
+    Pages are addressed by the sort key of the row just before (or after)
+    them rather than by offset, so each page is an indexed range scan and
+    costs the same however deep the user pages.
+
+    The API keeps numbered pages by default, for existing clients; keyset
+    pages are opt-in there (APIPagination). A numbered page needs the total
+    count, which over the filtered, distinct querysets costs about as much
+    as the page itself, so counts are cached by filter params and data
+    generation.
+'''
+
+import base64
+import json
+from functools import partial
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .generation import current_generation
+from .results import cache_key, CACHE_TIMEOUT
+
+
+def encode_cursor(values):
+    '''opaque, url-safe token for a tuple of key values'''
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, n_keys):
+    '''key values from a cursor token, or None if it is malformed'''
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != n_keys:
+        return None
+    return values
+
+
+def seek_filter(keys, values, reverse=False):
+    '''Q selecting rows strictly after (or before) values in keys order
+
+        (a, b, c) > (x, y, z) expands to
+        a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+    '''
+    op = "lt" if reverse else "gt"
+    q = Q()
+    for i, key in enumerate(keys):
+        term = Q(**{f"{key}__{op}": values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            term &= Q(**{prev_key: prev_value})
+        q |= term
+    return q
+
+
+def seek_page(queryset, keys, after=None, before=None, size=100):
+    '''one page of rows in keys order, just after (or before) a cursor:
+        (rows, has_next, has_previous)
+    '''
+    if before is not None:
+        rows = list(
+            queryset.filter(seek_filter(keys, before, reverse=True))
+            .order_by(*(f"-{key}" for key in keys))[:size + 1]
+        )
+        return rows[:size][::-1], True, len(rows) > size
+
+    if after is not None:
+        queryset = queryset.filter(seek_filter(keys, after))
+    rows = list(queryset.order_by(*keys)[:size + 1])
+    return rows[:size], len(rows) > size, after is not None
+
+
+class KeysetPage:
+    '''one page of results, with cursors for its neighbours'''
+
+    def __init__(self, object_list, keys, has_next, has_previous, query, result_count=None):
+        self.object_list = object_list
+        self.keys = keys
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self._query = query
+        # matches on every page, where known
+        self.result_count = result_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _cursor(self, obj):
+        return encode_cursor(getattr(obj, key) for key in self.keys)
+
+    def _link(self, direction, obj):
+        query = self._query.copy()
+        query.pop("after", None)
+        query.pop("before", None)
+        query[direction] = self._cursor(obj)
+        return query.urlencode()
+
+    @property
+    def next_query(self):
+        '''query string for the next page, keeping the search params'''
+        if self.has_next:
+            return self._link("after", self.object_list[-1])
+
+    @property
+    def previous_query(self):
+        '''query string for the previous page, keeping the search params'''
+        if self.has_previous:
+            return self._link("before", self.object_list[0])
+
+
+class KeysetPaginationMixin:
+    '''keyset pagination for a ListView
+        - `keyset` names the ordering columns; the last should be unique
+        - pages are requested with ?after=<cursor> or ?before=<cursor>
+        - views that can list matching ids in keyset order (cached
+          results, an index) do so in paginate_ids(); only the page's rows
+          are then fetched
+        - views that can count their matches do so in count_results(),
+          for display above the list
+    '''
+
+    paginate_by = 100
+
+    def paginate_ids(self, after, before, page_size):
+        '''(ids, has_next, has_previous) for one page, or None'''
+        if hasattr(self, "fill_results"):
+            results = self.fill_results()
+            if results is not None:
+                return results.page(after, before, page_size)
+        return None
+
+    def get_result_count(self):
+        '''number of matches on every page, or None if unknown'''
+        if hasattr(self, "count_results"):
+            return self.count_results()
+        return None
+
+    def paginate_queryset(self, queryset, page_size):
+        keys = self.keyset
+        query = self.request.GET
+        after = decode_cursor(query.get("after", ""), len(keys)) if query.get("after") else None
+        before = decode_cursor(query.get("before", ""), len(keys)) if query.get("before") else None
+
+        paged = self.paginate_ids(after, before, page_size)
+        if paged is not None:
+            ids, has_next, has_previous = paged
+            rows = list(queryset.filter(pk__in=ids).order_by(*keys))
+        else:
+            rows, has_next, has_previous = seek_page(queryset, keys, after, before, page_size)
+
+        page = KeysetPage(rows, keys, has_next, has_previous, query, self.get_result_count())
+        return (None, page, rows, page.has_other_pages())
+
+
+class CachedCountPaginator(Paginator):
+    '''Paginator that reads its count from the cache under count_key'''
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        count = cache.get(self.count_key)
+        if count is None:
+            count = super().count
+            cache.set(self.count_key, count, CACHE_TIMEOUT)
+        return count
+
+
+class APIPagination(PageNumberPagination):
+    '''numbered pages with a cached count, or keyset pages on request
+        - ?pagination=cursor switches to keyset pages, ordered by the
+          view's `keyset` (default: id); responses then carry next and
+          previous links (?after=/?before= cursors) but no count
+        - numbered pages keep the queryset's order, or take the keyset's
+          if it has none
+        - numbered pages cache their count under the view, the filter
+          params and the data generation
+    '''
+
+    # params that shape the response but not which rows match
+    display_params = {"page", "pagination", "after", "before", "fields", "depth", "expand", "min", "format"}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        params = request.query_params
+        self.cursor = params.get("pagination") == "cursor" or "after" in params or "before" in params
+        self.keys = getattr(view, "keyset", ("id",))
+        if not self.cursor:
+            if not queryset.ordered:
+                # numbered pages need a stable order too: the cursors' one
+                queryset = queryset.order_by(*self.keys)
+            key = self.get_count_key(request, view)
+            self.django_paginator_class = partial(CachedCountPaginator, count_key=key)
+            return super().paginate_queryset(queryset, request, view)
+
+        after = before = None
+        if "before" in params:
+            before = decode_cursor(params["before"], len(self.keys))
+            if before is None:
+                raise NotFound("Invalid cursor.")
+        elif "after" in params:
+            after = decode_cursor(params["after"], len(self.keys))
+            if after is None:
+                raise NotFound("Invalid cursor.")
+
+        page_size = self.get_page_size(request)
+        rows, self.has_next, self.has_previous = seek_page(queryset, self.keys, after, before, page_size)
+        self.rows = rows
+        return rows
+
+    def get_count_key(self, request, view):
+        params = {
+            name: request.query_params.getlist(name)
+            for name in request.query_params if name not in self.display_params
+        }
+        return cache_key(f"count:{type(view).__name__}", params, current_generation())
+
+    def _cursor_link(self, direction, obj):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(remove_query_param(url, "after"), "before")
+        url = replace_query_param(url, "pagination", "cursor")
+        return replace_query_param(url, direction, encode_cursor(getattr(obj, key) for key in self.keys))
+
+    def get_next_link(self):
+        if not self.cursor:
+            return super().get_next_link()
+        if self.has_next and self.rows:
+            return self._cursor_link("after", self.rows[-1])
+        return None
+
+    def get_previous_link(self):
+        if not self.cursor:
+            return super().get_previous_link()
+        if self.has_previous and self.rows:
+            return self._cursor_link("before", self.rows[0])
+        return None
+
+    def get_paginated_response(self, data):
+        if not self.cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response["required"] = ["results"]
+        response["properties"]["count"]["description"] = "Omitted with pagination=cursor."
+        return response
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            *super().get_schema_operation_parameters(view),
+            {
+                "name": "pagination",
+                "required": False,
+                "in": "query",
+                "description": "cursor: page by keyset cursors instead of page numbers, without a count.",
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+            {
+                "name": "after",
+                "required": False,
+                "in": "query",
+                "description": "Keyset cursor: the page after this one (from a next link).",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": "before",
+                "required": False,
+                "in": "query",
+                "description": "Keyset cursor: the page before this one (from a previous link).",
+                "schema": {"type": "string"},
+            },
+        ]
@@ -0,0 +1,135 @@
+'''Query plans for the REST API, read off the serializer
+
+    The API serializers nest related objects (Meta.depth, declared nested
+    serializers), and serializing a page would otherwise query once per
+    related object. plan_queryset() walks the fields a serializer will
+    actually render, after any per-request field or depth choices, and
+    adds the matching select_related() and prefetch_related() calls:
+
+    - a nested to-one relation is joined with select_related(), and its
+      own fields are planned in turn
+    - a to-many relation, nested or as a list of ids, is prefetched with a
+      queryset planned the same way for its serializer
+    - a to-one relation rendered as an id needs nothing: the id is on the
+      row
+
+    Each queryset also loads only() the columns its fields render, so a
+    client asking for a few fields doesn't fetch whole rows. Fields whose
+    source isn't a model field (methods, properties) keep the whole row.
+
+    The number of queries for a page then depends only on the shape of the
+    serializer, not on how many rows are on the page.
+'''
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _nested(field):
+    '''the serializer rendering each related object, if any'''
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+    if isinstance(field, serializers.BaseSerializer):
+        return field
+    return None
+
+
+def _many_ids(field):
+    return isinstance(field, serializers.ManyRelatedField)
+
+
+def _whole(model, path):
+    '''every column of a model, as only() lookups'''
+    return [f"{path}{field.name}" for field in model._meta.concrete_fields]
+
+
+def _plan(model, serializer, prefix=""):
+    '''(select_related, prefetch_related, only) lookups for a serializer's
+        fields
+    '''
+    select, prefetch, only = [], [], []
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == "*":
+            # a method or the like, free to read anything on the object
+            only.extend(_whole(model, prefix))
+            continue
+        nested = _nested(field)
+
+        current, path = model, prefix
+        attrs = field.source_attrs
+        for i, attr in enumerate(attrs):
+            try:
+                relation = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # a property or method; nothing to plan, and it may read
+                #   any column
+                only.extend(_whole(current, path))
+                break
+
+            lookup = f"{path}{attr}"
+            if not relation.is_relation:
+                only.append(lookup)
+                break
+
+            last = i == len(attrs) - 1
+            if relation.many_to_many or relation.one_to_many:
+                related = relation.related_model._default_manager.all()
+                if nested is not None and last:
+                    related = plan_queryset(related, nested, keep=_join_key(relation))
+                elif _many_ids(field) and last:
+                    # just the ids, and the key the prefetch joins on
+                    related = related.only("pk", *_join_key(relation))
+                prefetch.append(Prefetch(lookup, queryset=related))
+                break
+
+            only.append(lookup)
+            if last and nested is None and isinstance(field, serializers.PrimaryKeyRelatedField):
+                break
+
+            select.append(lookup)
+            current, path = relation.related_model, f"{lookup}__"
+        else:
+            if nested is not None:
+                more_select, more_prefetch, more_only = _plan(current, nested, path)
+                select.extend(more_select)
+                prefetch.extend(more_prefetch)
+                only.extend(more_only)
+            else:
+                # a related object rendered whole, e.g. as a string
+                only.extend(_whole(current, path))
+
+    return select, prefetch, only
+
+
+def _join_key(relation):
+    '''columns a prefetched queryset needs to be matched to its owners'''
+    return [relation.field.name] if relation.one_to_many else []
+
+
+def plan_queryset(queryset, serializer, keep=()):
+    '''queryset with the joins and prefetches serializer needs, loading
+        only the columns it renders (plus keep)
+    '''
+    select, prefetch, only = _plan(queryset.model, serializer)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if only:
+        queryset = queryset.only(*dict.fromkeys([*only, *keep]))
+    return queryset
+
+
+class PrefetchPlanMixin:
+    '''plan a generic API view's queryset for its serializer
+        - planned per request, from the serializer get_serializer() makes,
+          so per-request field and depth choices are taken into account
+        - the view's keyset columns are always loaded, for cursors
+    '''
+
+    def get_queryset(self):
+        return plan_queryset(super().get_queryset(), self.get_serializer(), keep=getattr(self, 'keyset', ()))
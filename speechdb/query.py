@@ -0,0 +1,297 @@
+'''Table-driven compilation of search parameters into queryset filters
+
+    Each search parameter accepted by PagerForm maps to a lookup and,
+    for multi-valued relations, the group it belongs to. Parameters in the
+    same group are combined inside one subquery, so that (as with a single
+    filter() call over a join) the same speaker must satisfy every speaker
+    condition, but the outer query never fans out and needs no distinct().
+
+    Speaker and addressee conditions are normally matched against
+    SpeechSearchRow, which flattens each participant's instance and
+    character attributes into one indexed row, so each group is a single
+    index scan yielding speech ids. Unprefixed participant parameters
+    (char_name, inst_gender...) match a participant in either role, from
+    the same rows.
+'''
+
+from django.db.models import Q, Exists, OuterRef
+from .models import CharacterInstance, SpeechTag, SpeechSearchRow, SpeechEmbedding, parse_locus
+from .intervals import surrounding
+
+
+def _inst_name(values, prefix=""):
+    '''instance name, or display name for anonymous instances'''
+    q = Q()
+    for name in values:
+        q |= Q(**{f"{prefix}name": name}) | Q(**{f"{prefix}display": name, f"{prefix}anon": True})
+    return q
+
+
+def _disguised(values, prefix=""):
+    '''instance has (or lacks) a disguise'''
+    q = Q()
+    for disg in values:
+        if str(disg).lower() == "true":
+            q |= ~Q(**{f"{prefix}disguise": ""})
+        elif str(disg).lower() == "false":
+            q |= Q(**{f"{prefix}disguise": ""})
+    return q
+
+
+def locus_q(end, op, locus, prefix=""):
+    '''compare a speech's first ("fi") or last ("la") line with a locus
+        - op is "lte" or "gte"
+        - the parsed (book, line, suffix) columns compare lexicographically;
+          the comparison is spelled out, with the book bound repeated up
+          front so that it can seek the (work, book, line, suffix) index
+    '''
+    key = parse_locus(locus)
+    columns = [f"{prefix}{end}_{part}" for part in ("book", "line", "suffix")]
+
+    q = Q()
+    for i, column in enumerate(columns):
+        # equal on the leading columns, beyond the bound on this one
+        last = i == len(columns) - 1
+        term = Q(**{columns[j]: key[j] for j in range(i)})
+        q |= term & Q(**{f"{column}__{op if last else op[:2]}": key[i]})
+
+    return Q(**{f"{columns[0]}__{op}": key[0]}) & q
+
+
+def _locus_from(values, prefix=""):
+    '''speech ends at or after the locus'''
+    return locus_q("la", "gte", values[0], prefix)
+
+
+def _locus_to(values, prefix=""):
+    '''speech starts at or before the locus'''
+    return locus_q("fi", "lte", values[0], prefix)
+
+
+def _locus_at(values, prefix=""):
+    '''speech includes the line; answered from the interval indexes'''
+    return Q(**{f"{prefix}pk__in": surrounding(values[0])})
+
+
+def _within(key):
+    '''speech is embedded, at any depth, in one of the given speeches'''
+    def lookup(values, prefix=""):
+        below = SpeechEmbedding.objects.filter(**{f"ancestor__{key}__in": values}, depth__gt=0)
+        return Q(**{f"{prefix}pk__in": below.values("descendant")})
+    return lookup
+
+
+def _root_spkr_name(values, prefix=""):
+    '''speech is embedded in a top-level speech by one of the characters'''
+    roots = SpeechSearchRow.objects.filter(
+        role=SpeechSearchRow.Role.SPEAKER, char_name__in=values, speech__embedded_in__isnull=True)
+    below = SpeechEmbedding.objects.filter(ancestor__in=roots.values("speech"), depth__gt=0)
+    return Q(**{f"{prefix}pk__in": below.values("descendant")})
+
+
+# participant attribute -> lookup on CharacterInstance
+INSTANCE_LOOKUPS = {
+    # character properties
+    "char_id": "char__pk",
+    "char_pubid": "char__public_id",
+    "char_name": "char__name",
+    "char_being": "char__being",
+    "char_gender": "char__gender",
+    "char_number": "char__number",
+    "char_manto": "char__manto",
+    "char_wd": "char__wd",
+    "char_tt": "char__tt",
+
+    # instance properties
+    "inst_id": "pk",
+    "inst_pubid": "public_id",
+    "inst_name": _inst_name,
+    "inst_being": "being",
+    "inst_gender": "gender",
+    "inst_number": "number",
+    "inst_anon": "anon",
+    "inst_disguised": _disguised,
+    "inst_changed": "changed",
+}
+
+# participant attribute -> column of the flattened SpeechSearchRow
+SEARCH_ROW_LOOKUPS = {
+    "char_id": "char_id",
+    "char_pubid": "char_pubid",
+    "char_name": "char_name",
+    "char_being": "char_being",
+    "char_gender": "char_gender",
+    "char_number": "char_number",
+    "char_manto": "char_manto",
+    "char_wd": "char_wd",
+    "char_tt": "char_tt",
+
+    "inst_id": "inst_id",
+    "inst_pubid": "inst_pubid",
+    "inst_name": lambda values, prefix="": _inst_name(values, f"{prefix}inst_"),
+    "inst_being": "inst_being",
+    "inst_gender": "inst_gender",
+    "inst_number": "inst_number",
+    "inst_anon": "inst_anon",
+    "inst_disguised": lambda values, prefix="": _disguised(values, f"{prefix}inst_"),
+    "inst_changed": "inst_changed",
+}
+
+
+def _participant_params(role, lookups):
+    '''parameter table entries for a speaker, an addressee, or "any"
+        participant, whose parameters are unprefixed
+    '''
+    prefix = "" if role == "any" else f"{role}_"
+    return {f"{prefix}{attr}": (role, lookup) for attr, lookup in lookups.items()}
+
+
+# relation groups: model searched, its link back to the speech, and any
+# further conditions on the group's rows
+#   - an instance in either role links back through both relations
+SPEECH_GROUPS = {
+    "spkr": (CharacterInstance, "speeches", {}),
+    "addr": (CharacterInstance, "addresses", {}),
+    "any": (CharacterInstance, ("speeches", "addresses"), {}),
+    "tags": (SpeechTag, "speech", {}),
+}
+
+# participants searched in the flattened table: one indexed scan, no joins
+SEARCH_ROW_GROUPS = {
+    **SPEECH_GROUPS,
+    "spkr": (SpeechSearchRow, "speech", {"role": SpeechSearchRow.Role.SPEAKER}),
+    "addr": (SpeechSearchRow, "speech", {"role": SpeechSearchRow.Role.ADDRESSEE}),
+    "any": (SpeechSearchRow, "speech", {}),
+}
+
+# relations joined for a group in "join" mode
+JOIN_RELATIONS = {
+    "any": ("spkr", "addr"),
+}
+
+# search parameter -> (relation group or None, lookup)
+#   - a string lookup is matched with __in against the parameter's values
+#   - a callable lookup takes (values, prefix) and returns a Q
+SPEECH_PROPERTY_PARAMS = {
+    # speech properties
+    "cluster_id": (None, "cluster__pk"),
+    "cluster_pubid": (None, "cluster__public_id"),
+    "type": (None, "type"),
+    "part": (None, "part"),
+    "n_parts": (None, "cluster_size"),
+    "n_lines_min": (None, lambda values, prefix: Q(**{f"{prefix}n_lines__gte": max(values)})),
+    "n_lines_max": (None, lambda values, prefix: Q(**{f"{prefix}n_lines__lte": min(values)})),
+    "level": (None, "level"),
+    "from": (None, _locus_from),
+    "to": (None, _locus_to),
+    "at": (None, _locus_at),
+    "within_id": (None, _within("pk")),
+    "within_pubid": (None, _within("public_id")),
+    "root_spkr_name": (None, _root_spkr_name),
+    "tags": ("tags", "type"),
+
+    # work properties
+    "work_id": (None, "work__pk"),
+    "work_pubid": (None, "work__public_id"),
+    "work_title": (None, "work__title"),
+    "work_lang": (None, "work__lang"),
+    "author_id": (None, "work__author__pk"),
+    "author_pubid": (None, "work__author__public_id"),
+    "author_name": (None, "work__author__name"),
+}
+
+SPEECH_PARAMS = {
+    **_participant_params("any", INSTANCE_LOOKUPS),
+    **_participant_params("spkr", INSTANCE_LOOKUPS),
+    **_participant_params("addr", INSTANCE_LOOKUPS),
+    **SPEECH_PROPERTY_PARAMS,
+}
+
+SEARCH_ROW_PARAMS = {
+    **_participant_params("any", SEARCH_ROW_LOOKUPS),
+    **_participant_params("spkr", SEARCH_ROW_LOOKUPS),
+    **_participant_params("addr", SEARCH_ROW_LOOKUPS),
+    **SPEECH_PROPERTY_PARAMS,
+}
+
+
+# speech list order, as Speech.Meta.ordering (work, by author and title;
+#   then seq), on the speech's own indexed integer columns so that pages
+#   can seek; id makes it unique
+SPEECH_KEYSET = ("work_rank", "seq", "id")
+
+
+def _lookup_q(lookup, values, prefix=""):
+    if callable(lookup):
+        return lookup(values, prefix)
+    return Q(**{f"{prefix}{lookup}__in": values})
+
+
+def compile_filters(params, table, groups, mode="in"):
+    '''Compile validated search params into a list of filter() arguments
+
+        - mode "in" puts each relation group in an uncorrelated subquery
+          of matching speech ids, which lets the database start from the
+          group's indexes rather than probing once per speech
+        - mode "exists" puts each relation group in a correlated subquery,
+          probed once per speech: SQLite only gains by it on broad
+          searches of a large corpus (see bench_speech_query)
+        - mode "join" reproduces the old plan, joining through each
+          relation; callers then need distinct(). Kept for benchmarking.
+    '''
+
+    direct = []
+    related = {}
+
+    for name, values in params.items():
+        if name not in table:
+            continue
+        group, lookup = table[name]
+
+        if group is None:
+            direct.append(_lookup_q(lookup, values))
+        elif mode == "join" and group not in JOIN_RELATIONS:
+            direct.append(_lookup_q(lookup, values, prefix=f"{group}__"))
+        else:
+            related.setdefault(group, []).append((lookup, values))
+
+    for group, terms in related.items():
+        if mode == "join":
+            # every term on the same participant, in one role or the other
+            q = Q()
+            for relation in JOIN_RELATIONS[group]:
+                q |= Q(*[_lookup_q(lookup, values, prefix=f"{relation}__") for lookup, values in terms])
+            direct.append(q)
+            continue
+
+        model, links, extra = groups[group]
+        rows = model.objects.filter(*[_lookup_q(lookup, values) for lookup, values in terms], **extra)
+        q = Q()
+        for link in (links if isinstance(links, tuple) else (links,)):
+            if mode == "in":
+                q |= Q(pk__in=rows.values(link))
+            else:
+                q |= Exists(rows.filter(**{link: OuterRef("pk")}))
+        direct.append(q)
+
+    return direct
+
+
+def participant_row_filters(params, role):
+    '''filter() arguments for the SpeechSearchRow rows of one role'''
+    return [_lookup_q(lookup, params[name])
+            for name, (group, lookup) in SEARCH_ROW_PARAMS.items()
+            if group == role and name in params]
+
+
+def compile_speech_filters(params, mode="in", search_rows=True):
+    '''filter() arguments for a Speech search
+        - search_rows matches participants against the flattened
+          SpeechSearchRow table rather than instances and characters
+        - the default plan is slower than join + distinct by a few ms on
+          selective name searches, but on broad ones, where the joins fan
+          out, faster by up to an order of magnitude or more
+    '''
+    if search_rows and mode != "join":
+        return compile_filters(params, SEARCH_ROW_PARAMS, SEARCH_ROW_GROUPS, mode=mode)
+    return compile_filters(params, SPEECH_PARAMS, SPEECH_GROUPS, mode=mode)
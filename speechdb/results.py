@@ -0,0 +1,191 @@
+'''Versioned cache of search results
+
+    A search's results are cached as the ids of the matching rows, in list
+    order, under the normalized search params plus the data generation.
+    Every committed write to the corpus bumps the generation, so an entry
+    never goes stale; it just stops being asked for.
+
+    The ids are a packed integer array, so that an entry stays well within
+    a cache backend's item size limit; searches matching more than
+    MAX_CACHED_IDS rows aren't cached at all.
+
+    The CSV view fills the entry to export the whole result, and so does
+    the first HTML list page of a search: listing the matching ids is an
+    index scan, and every later page (and the count shown above the list)
+    then comes from the cache. A search with more than MAX_CACHED_IDS
+    matches is paged by seeking the database instead, with its count
+    cached on its own.
+'''
+
+import hashlib
+import json
+from array import array
+from django.core.cache import cache
+
+from .generation import current_generation
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# 8 bytes an id: at most 800 KB an entry
+MAX_CACHED_IDS = 100_000
+
+# ids read from the database at a time
+ID_CHUNK_SIZE = 2000
+
+
+def cache_key(prefix, params, generation, names=None):
+    '''cache key for a normalized search parameter set
+        - names, if given, limits the params that count
+    '''
+    normalized = sorted(
+        (name, sorted(str(v) for v in values))
+        for name, values in params.items() if names is None or name in names
+    )
+    digest = hashlib.sha1(json.dumps(normalized).encode()).hexdigest()
+    return f"{prefix}:{generation}:{digest}"
+
+
+def _key(name, params):
+    return cache_key(f"results:{name}", params, current_generation())
+
+
+class CachedResults:
+    '''ids of a search's matches, in list order'''
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    @property
+    def count(self):
+        return len(self.ids)
+
+    def _position(self, cursor):
+        # the cursor's last key is the pk
+        try:
+            return self.ids.index(cursor[-1])
+        except ValueError:
+            return None
+
+    def page(self, after=None, before=None, size=100):
+        '''one page of ids by keyset cursor: (ids, has_next, has_previous),
+            or None if the cursor's row isn't among the results
+        '''
+        if before is not None:
+            end = self._position(before)
+            if end is None:
+                return None
+            start = max(end - size, 0)
+            return list(self.ids[start:end]), True, start > 0
+
+        start = 0
+        if after is not None:
+            start = self._position(after)
+            if start is None:
+                return None
+            start += 1
+        end = start + size
+        return list(self.ids[start:end]), end < len(self.ids), after is not None
+
+    def chunks(self, size):
+        '''ids, a chunk at a time'''
+        for i in range(0, len(self.ids), size):
+            yield list(self.ids[i:i + size])
+
+
+def peek_results(name, params):
+    '''cached results of a search, or None if they aren't cached'''
+    ids = cache.get(_key(name, params))
+    return CachedResults(ids) if ids is not None else None
+
+
+def get_results(name, params, queryset, keyset):
+    '''cached results of a search, computing them on a miss'''
+    key = _key(name, params)
+    ids = cache.get(key)
+    if ids is None:
+        rows = queryset.order_by(*keyset).values_list("pk", flat=True)
+        ids = array("q", rows.iterator(chunk_size=ID_CHUNK_SIZE))
+        if len(ids) <= MAX_CACHED_IDS:
+            cache.set(key, ids, CACHE_TIMEOUT)
+    return CachedResults(ids)
+
+
+def fill_results(name, params, queryset, keyset):
+    '''cached results of a search, computing them on a miss if they fit
+        in the cache; None if there are more than MAX_CACHED_IDS
+    '''
+    key = _key(name, params)
+    ids = cache.get(key)
+    if ids is None:
+        rows = queryset.order_by(*keyset).values_list("pk", flat=True)[:MAX_CACHED_IDS + 1]
+        ids = array("q", rows.iterator(chunk_size=ID_CHUNK_SIZE))
+        if len(ids) > MAX_CACHED_IDS:
+            return None
+        cache.set(key, ids, CACHE_TIMEOUT)
+    return CachedResults(ids)
+
+
+def count_results(name, params, queryset):
+    '''number of matches of a search, cached on its own'''
+    key = cache_key(f"count:{name}", params, current_generation())
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, CACHE_TIMEOUT)
+    return count
+
+
+class CachedResultsMixin:
+    '''share one cached result list between a search's HTML and CSV views
+        - result_name namespaces the cache entries
+        - keyset orders the results; its last column must be the pk
+        - get_results() lists every match, caching the ids;
+          fill_results() does so only if they fit in the cache;
+          peek_results() only looks in the cache
+        - expects `params` and get_queryset() from a *QueryMixin
+    '''
+
+    result_name = None
+    keyset = ("id",)
+    chunk_size = 500
+
+    def get_results(self):
+        if not hasattr(self, "_results"):
+            if self.params is None:
+                self._results = CachedResults(array("q"))
+            else:
+                self._results = get_results(self.result_name, self.params,
+                                            self.get_queryset(), self.keyset)
+        return self._results
+
+    def peek_results(self):
+        '''the cached results, if some earlier request computed them'''
+        if self.params is None:
+            return None
+        return peek_results(self.result_name, self.params)
+
+    def fill_results(self):
+        '''the results, listed and cached on a miss; None if too many'''
+        if not hasattr(self, "_filled"):
+            if self.params is None:
+                self._filled = CachedResults(array("q"))
+            else:
+                self._filled = fill_results(self.result_name, self.params,
+                                            self.get_queryset(), self.keyset)
+        return self._filled
+
+    def count_results(self):
+        '''number of matches, from the cached results if they fit'''
+        results = self.fill_results()
+        if results is not None:
+            return results.count
+        return count_results(self.result_name, self.params, self.get_queryset())
+
+    def iter_results(self):
+        '''full rows for every result, in order, fetched a chunk at a time'''
+        qs = self.get_queryset()
+        for ids in self.get_results().chunks(self.chunk_size):
+            rows = {obj.pk: obj for obj in qs.filter(pk__in=ids)}
+            for pk in ids:
+                if pk in rows:
+                    yield rows[pk]
@@ -1,4 +1,19 @@
 from drf_spectacular.openapi import AutoSchema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+
+
+SERIALIZER_OPTION_PARAMETERS = [
+    OpenApiParameter('fields', OpenApiTypes.STR, description=(
+        'Comma-separated fields to return; dotted paths (work.title) '
+        'select within nested objects.')),
+    OpenApiParameter('depth', OpenApiTypes.INT, description=(
+        'Levels of related objects to nest, up to 10.')),
+    OpenApiParameter('expand', OpenApiTypes.STR, description=(
+        'Comma-separated relations (work, work.author) to nest whatever '
+        'the depth.')),
+    OpenApiParameter('min', OpenApiTypes.BOOL, description='Return ids only.'),
+]
 
 
 class PublicReadAutoSchema(AutoSchema):
@@ -9,7 +24,24 @@ class PublicReadAutoSchema(AutoSchema):
     restricts writes that don't exist on these views. Without this
     override, drf-spectacular shows misleading auth-required padlocks
     on every endpoint in the Swagger UI.
+
+    It also documents the serializer options every view takes from the
+    query string, and keeps the docstrings of the views' mixins, which
+    are implementation notes, out of the endpoint descriptions.
     """
 
     def get_auth(self):
         return []
+
+    def get_description(self):
+        if not vars(type(self.view)).get('__doc__'):
+            return ''
+        return super().get_description()
+
+    def get_override_parameters(self):
+        from .views import SerializerOptionsMixin
+
+        parameters = super().get_override_parameters()
+        if isinstance(self.view, SerializerOptionsMixin):
+            parameters = [*parameters, *SERIALIZER_OPTION_PARAMETERS]
+        return parameters
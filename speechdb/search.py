@@ -0,0 +1,155 @@
+'''Maintenance of the denormalized speech search table
+
+    SpeechSearchRow holds one row per speech participant, copying in the
+    speech, work, author, instance and character attributes that searches
+    filter on. The rows are derived data: rebuild_search_rows() regenerates
+    them from the normalized tables, either wholesale (after an ingest or
+    restore) or for a handful of speeches (from the write signals).
+
+    The builder works from values() projections only, so it can also be run
+    against historical models from a data migration.
+'''
+
+from django.apps import apps as global_apps
+from django.db import connection, transaction
+from django.db.models import Count
+
+BATCH_SIZE = 2000
+
+
+def chunks(seq, size):
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def rebuild_search_rows(speech_ids=None, apps=None):
+    '''Regenerate search rows for the given speech ids, or for all speeches
+
+        Returns the number of rows written.
+    '''
+    apps = apps or global_apps
+    Speech = apps.get_model('speechdb', 'Speech')
+    SpeechSearchRow = apps.get_model('speechdb', 'SpeechSearchRow')
+
+    if speech_ids is None:
+        with transaction.atomic():
+            SpeechSearchRow.objects.all().delete()
+            return _build(Speech.objects.all(), apps, whole_table=True)
+
+    written = 0
+    for chunk in chunks(set(speech_ids), BATCH_SIZE):
+        with transaction.atomic():
+            SpeechSearchRow.objects.filter(speech_id__in=chunk).delete()
+            written += _build(Speech.objects.filter(pk__in=chunk), apps)
+    return written
+
+
+def _build(speeches, apps, whole_table=False):
+    '''create search rows for a Speech queryset
+        - whole_table skips the per-speech filtering of the lookup queries
+    '''
+    Work = apps.get_model('speechdb', 'Work')
+    Author = apps.get_model('speechdb', 'Author')
+    Character = apps.get_model('speechdb', 'Character')
+    CharacterInstance = apps.get_model('speechdb', 'CharacterInstance')
+    Speech = apps.get_model('speechdb', 'Speech')
+    SpeechTag = apps.get_model('speechdb', 'SpeechTag')
+    SpeechSearchRow = apps.get_model('speechdb', 'SpeechSearchRow')
+
+    speeches = list(speeches.values('id', 'work_id', 'cluster_id', 'type', 'part', 'level'))
+    if not speeches:
+        return 0
+    speech_ids = [s['id'] for s in speeches]
+
+    def for_speeches(qs):
+        return qs if whole_table else qs.filter(speech_id__in=speech_ids)
+
+    # lookup tables for everything a row copies in
+    authors = {a['id']: a for a in Author.objects.values('id', 'name')}
+    works = {w['id']: w for w in Work.objects.values('id', 'title', 'lang', 'author_id')}
+    chars = {c['id']: c for c in Character.objects.values(
+        'id', 'public_id', 'name', 'being', 'number', 'gender', 'manto', 'wd', 'tt')}
+
+    cluster_ids = {s['cluster_id'] for s in speeches}
+    cluster_qs = Speech.objects.all() if whole_table else Speech.objects.filter(cluster_id__in=cluster_ids)
+    cluster_size = dict(cluster_qs.values_list('cluster_id').annotate(n=Count('id')).order_by())
+
+    tags = {}
+    for speech_id, tag_type in for_speeches(SpeechTag.objects.all()).values_list('speech_id', 'type'):
+        tags.setdefault(speech_id, set()).add(tag_type)
+
+    participants = []
+    for role, field in (('spkr', Speech.spkr), ('addr', Speech.addr)):
+        through = for_speeches(field.through.objects.all())
+        for speech_id, inst_id in through.values_list('speech_id', 'characterinstance_id'):
+            participants.append((speech_id, role, inst_id))
+
+    inst_ids = {p[2] for p in participants}
+    inst_qs = CharacterInstance.objects.all() if whole_table else CharacterInstance.objects.filter(pk__in=inst_ids)
+    insts = {i['id']: i for i in inst_qs.values(
+        'id', 'public_id', 'name', 'display', 'being', 'number', 'gender',
+        'anon', 'disguise', 'changed', 'char_id')}
+
+    speeches = {s['id']: s for s in speeches}
+    rows = []
+    for speech_id, role, inst_id in participants:
+        s = speeches[speech_id]
+        w = works[s['work_id']]
+        i = insts[inst_id]
+        c = chars.get(i['char_id'])
+
+        rows.append(dict(
+            speech_id=speech_id,
+            role=role,
+            inst_id=inst_id,
+            inst_pubid=i['public_id'],
+            inst_name=i['name'],
+            inst_display=i['display'],
+            inst_being=i['being'],
+            inst_number=i['number'],
+            inst_gender=i['gender'],
+            inst_anon=i['anon'],
+            inst_disguise=i['disguise'],
+            inst_changed=i['changed'],
+            char_id=i['char_id'],
+            char_pubid=c['public_id'] if c else None,
+            char_name=c['name'] if c else None,
+            char_being=c['being'] if c else None,
+            char_number=c['number'] if c else None,
+            char_gender=c['gender'] if c else None,
+            char_manto=c['manto'] if c else None,
+            char_wd=c['wd'] if c else None,
+            char_tt=c['tt'] if c else None,
+            work_id=s['work_id'],
+            work_title=w['title'],
+            work_lang=w['lang'],
+            author_id=w['author_id'],
+            author_name=authors[w['author_id']]['name'],
+            type=s['type'],
+            part=s['part'],
+            level=s['level'],
+            tags=';'.join(sorted(tags.get(speech_id, ()))),
+            cluster_id=s['cluster_id'],
+            cluster_size=cluster_size.get(s['cluster_id'], 0),
+        ))
+
+    insert_rows(SpeechSearchRow, rows)
+    return len(rows)
+
+
+def insert_rows(model, rows):
+    '''insert row dicts (keyed by attname) with a plain executemany
+
+        bulk_create is held to ~30 rows a statement for a table this wide
+        by SQLite's parameter limit, and spends most of its time compiling
+        SQL; one parametrized statement run per row is several times faster.
+    '''
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+
+    with connection.cursor() as cursor:
+        for chunk in chunks(rows, BATCH_SIZE):
+            cursor.executemany(sql, [[row[f.attname] for f in fields] for row in chunk])
@@ -1,31 +1,107 @@
 from rest_framework import serializers
+from rest_framework.utils.field_mapping import get_nested_relation_kwargs
 from speechdb.models import Metadata
 from speechdb.models import Author, Work, Character, CharacterInstance, Speech, SpeechCluster, SpeechTag
 
 
+# derived columns kept for ordering, searching and cache invalidation,
+#   not part of the API: the parsed loci just restate l_fi and l_la
+INTERNAL_FIELDS = {
+    Work: ['speech_generation'],
+    Speech: ['work_rank', 'fi_book', 'fi_line', 'fi_suffix', 'la_book', 'la_line', 'la_suffix'],
+}
+
+
+def model_fields(model):
+    '''Meta options for all of a model's fields, less its internal ones'''
+    if model in INTERNAL_FIELDS:
+        return {'exclude': INTERNAL_FIELDS[model]}
+    return {'fields': '__all__'}
+
+
+def parse_fields(spec):
+    '''a field selection as a tree: {name: subtree or None for all}
+        - spec is a comma-separated string of dotted paths
+          ("id,work.title"), a list of them, or a tree already
+    '''
+    if spec is None or isinstance(spec, dict):
+        return spec
+    if isinstance(spec, str):
+        spec = spec.split(',')
+    tree = {}
+    for path in spec:
+        node = tree
+        names = [name for name in path.strip().split('.') if name]
+        for i, name in enumerate(names):
+            if i == len(names) - 1:
+                # the whole object, whatever else was asked of it
+                node[name] = None
+            elif name in node and node[name] is None:
+                break
+            else:
+                node = node.setdefault(name, {})
+    return tree
+
+
 class DynamicModelSerializer(serializers.ModelSerializer):
     """
-    A ModelSerializer that takes an additional `fields` argument that
-    controls which fields should be displayed.
+    A ModelSerializer that takes additional arguments, all scoped to the
+    instance:
+      - `fields` controls which fields should be displayed; dotted paths
+        ("work.title") select within nested objects
+      - `depth` overrides Meta.depth
+      - `expand` names relations ("work", "work.author") to nest even
+        beyond that depth
     """
 
     def __init__(self, *args, **kwargs):
         # Don't pass the extra args up to the superclass
         fields = kwargs.pop('fields', None)
         depth = kwargs.pop('depth', -1)
+        expand = kwargs.pop('expand', None)
 
         # Instantiate the superclass normally
         super().__init__(*args, **kwargs)
 
-        if fields is not None:
-            # Drop any fields that are not specified in the `fields` argument.
-            allowed = set(fields)
-            existing = set(self.fields)
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
+        self.selected = parse_fields(fields)
+        self.expand = parse_fields(expand) or {}
 
         if depth >= 0:
-            self.Meta.depth = depth
+            # shadow the class's Meta for this instance only
+            self.Meta = type('Meta', (self.Meta,), {'depth': depth})
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        if self.selected is not None:
+            # Drop any fields that are not specified in the `fields` argument.
+            fields = {name: field for name, field in fields.items() if name in self.selected}
+
+        # hand the selection and expansion within each nested object down
+        for name, field in fields.items():
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(nested, DynamicModelSerializer):
+                if self.selected is not None and self.selected.get(name):
+                    nested.selected = self.selected[name]
+                if self.expand.get(name):
+                    nested.expand = self.expand[name]
+        return fields
+
+    def build_field(self, field_name, info, model_class, nested_depth):
+        if field_name in self.expand and field_name in info.relations:
+            nested_depth = max(nested_depth, 1)
+        return super().build_field(field_name, info, model_class, nested_depth)
+
+    def build_nested_field(self, field_name, relation_info, nested_depth):
+        '''nested objects are dynamic too, so that fields and expand reach them'''
+        class NestedSerializer(DynamicModelSerializer):
+            Meta = type('Meta', (), {
+                'model': relation_info.related_model,
+                'depth': nested_depth - 1,
+                **model_fields(relation_info.related_model),
+            })
+
+        return NestedSerializer, get_nested_relation_kwargs(relation_info)
 
 
 class MetadataSerializer(DynamicModelSerializer):
@@ -43,7 +119,7 @@ class AuthorSerializer(DynamicModelSerializer):
 class WorkSerializer(DynamicModelSerializer):
     class Meta:
         model = Work
-        fields = '__all__'
+        exclude = INTERNAL_FIELDS[Work]
         depth = 2
 
 
@@ -70,9 +146,25 @@ class SpeechSerializer(DynamicModelSerializer):
     
     class Meta:
         model = Speech
-        fields = '__all__'
+        exclude = INTERNAL_FIELDS[Speech]
         depth = 3
 
+class SpeechDetailSerializer(SpeechSerializer):
+    '''a single speech, with its place in the embedded_in hierarchy'''
+    ancestors = serializers.SerializerMethodField()
+    descendants = serializers.SerializerMethodField()
+
+    class Meta(SpeechSerializer.Meta):
+        pass
+
+    def get_ancestors(self, obj) -> list[int]:
+        '''ids of the speeches this one is embedded in, outermost first'''
+        return list(obj.get_ancestors().values_list('id', flat=True))
+
+    def get_descendants(self, obj) -> list[dict]:
+        '''ids and relative depths of every speech embedded in this one'''
+        return list(obj.get_descendants().values('id', 'depth'))
+
 class SpeechClusterSerializer(DynamicModelSerializer):
     speeches = SpeechSerializer(many=True, fields=['id'])
     
@@ -0,0 +1,233 @@
+'''Write hooks that keep derived data in step with the normalized tables
+
+    Connected in SpeechdbConfig.ready(). Handlers only note which speeches
+    are affected; the search rows are rebuilt once, when the surrounding
+    transaction commits, so an admin save touching a speech, its
+    participants and its tags costs one rebuild, and cascading deletes
+    never resurrect rows for a speech on its way out.
+
+    Speech.cluster_size and work_rank and the SpeechEmbedding closure rows
+    are the exception: they are brought up to date at once, in the same
+    transaction, so that the saved speech reads back consistently.
+
+    Any committed write to the corpus also bumps the data generation
+    (Metadata.get_generation), which in-memory indexes and caches use to
+    tell when they are stale; works whose speeches changed are marked with
+    the new generation (Work.speech_generation) for per-work indexes.
+
+    Bulk loaders should wrap their work in paused() and rebuild the derived
+    tables once at the end, rather than paying for per-row maintenance.
+'''
+
+import threading
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+
+from .models import Metadata, Author, Work, Character, CharacterInstance
+from .models import Speech, SpeechCluster, SpeechTag, SpeechSearchRow, SpeechEmbedding
+from .search import rebuild_search_rows
+from .hierarchy import rebuild_embeddings
+from .generation import forget_generation
+
+_state = threading.local()
+
+
+@contextmanager
+def paused():
+    '''suspend derived-data maintenance, e.g. during a bulk ingest'''
+    _state.paused = getattr(_state, 'paused', 0) + 1
+    try:
+        yield
+    finally:
+        _state.paused -= 1
+
+
+def _active(raw=False):
+    # fixture loading (raw saves) is handled like a bulk load
+    return not getattr(_state, 'paused', 0) and not raw
+
+
+def _flush():
+    pending = getattr(_state, 'pending', None)
+    touched = getattr(_state, 'touched', False)
+    works = getattr(_state, 'works', None)
+    _state.pending = set()
+    _state.touched = False
+    _state.works = set()
+    if pending:
+        rebuild_search_rows(pending)
+    if touched:
+        generation = Metadata.bump_generation()
+        forget_generation()
+        if works:
+            Work.mark_speeches_changed(generation, works)
+
+
+def _touch():
+    '''bump the data generation when the transaction commits'''
+    _state.touched = True
+    # anything left behind by a rolled-back transaction is simply
+    # handled by the next flush
+    transaction.on_commit(_flush)
+
+
+def _schedule(speech_ids):
+    '''rebuild search rows for these speeches when the transaction commits'''
+    speech_ids = set(speech_ids)
+    if not hasattr(_state, 'pending'):
+        _state.pending = set()
+    _state.pending.update(speech_ids)
+    _touch()
+
+
+def _mark_works(work_ids):
+    '''mark these works' speeches as changed when the transaction commits'''
+    if not hasattr(_state, 'works'):
+        _state.works = set()
+    _state.works.update(set(work_ids) - {None})
+    _touch()
+
+
+def _speeches_in_clusters(cluster_ids):
+    return Speech.objects.filter(cluster_id__in=cluster_ids).values_list('pk', flat=True)
+
+
+def _speeches_with_rows(**lookup):
+    return SpeechSearchRow.objects.filter(**lookup).values_list('speech_id', flat=True)
+
+
+#
+# any corpus table
+#
+
+def corpus_changed(sender, raw=False, **kwargs):
+    if _active(raw):
+        _touch()
+
+
+#
+# speeches
+#
+
+def speech_pre_save(sender, instance, raw=False, **kwargs):
+    '''note the cluster a speech is leaving, whose sizes will change, the
+        speech it was embedded in and the work it was in
+    '''
+    instance._old_cluster_id = None
+    instance._old_embedded_in_id = None
+    instance._old_work_id = None
+    if _active(raw) and instance.pk is not None:
+        instance._old_cluster_id, instance._old_embedded_in_id, instance._old_work_id = (
+            Speech.objects.filter(pk=instance.pk).values_list('cluster_id', 'embedded_in_id', 'work_id').first()
+            or (None, None, None))
+
+
+def speech_saved(sender, instance, raw=False, created=False, **kwargs):
+    if not _active(raw):
+        return
+    clusters = {instance.cluster_id, getattr(instance, '_old_cluster_id', None)} - {None}
+    Speech.update_cluster_sizes(clusters)
+    Speech.update_work_ranks({instance.work_id})
+    if created or instance.embedded_in_id != getattr(instance, '_old_embedded_in_id', None):
+        rebuild_embeddings([instance.pk])
+    _mark_works({instance.work_id, getattr(instance, '_old_work_id', None)})
+    _schedule(_speeches_in_clusters(clusters))
+
+
+def speech_deleting(sender, instance, **kwargs):
+    '''note the speeches embedded in one on its way out'''
+    instance._embedded_ids = []
+    if _active():
+        instance._embedded_ids = list(SpeechEmbedding.objects.filter(
+            ancestor=instance, depth=1).values_list('descendant_id', flat=True))
+
+
+def speech_deleted(sender, instance, **kwargs):
+    if not _active():
+        return
+    # the speech's own rows cascade; its cluster-mates change size, and
+    #   what was embedded in it is now top-level
+    Speech.update_cluster_sizes([instance.cluster_id])
+    embedded = getattr(instance, '_embedded_ids', [])
+    if embedded:
+        rebuild_embeddings(embedded)
+    _mark_works([instance.work_id])
+    _schedule(_speeches_in_clusters([instance.cluster_id]))
+
+
+def speech_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not _active() or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _schedule([instance.pk])
+    elif action == 'post_clear':
+        # e.g. instance.speeches.clear(): the through rows are gone already
+        _schedule(_speeches_with_rows(inst=instance))
+    else:
+        _schedule(pk_set)
+
+
+def tag_changed(sender, instance, raw=False, **kwargs):
+    if _active(raw):
+        _schedule([instance.speech_id])
+
+
+#
+# copied attributes
+#
+
+def instance_saved(sender, instance, raw=False, created=False, **kwargs):
+    if _active(raw) and not created:
+        _schedule(_speeches_with_rows(inst=instance))
+
+
+def character_saved(sender, instance, raw=False, created=False, **kwargs):
+    if _active(raw) and not created:
+        _schedule(_speeches_with_rows(char=instance))
+
+
+def work_saved(sender, instance, raw=False, created=False, **kwargs):
+    if not _active(raw):
+        return
+    # a new or retitled work can move others in list order
+    Speech.update_work_ranks()
+    if not created:
+        _schedule(_speeches_with_rows(work=instance))
+
+
+def author_saved(sender, instance, raw=False, created=False, **kwargs):
+    if _active(raw) and not created:
+        Speech.update_work_ranks()
+        _schedule(_speeches_with_rows(author=instance))
+
+
+def character_deleting(sender, instance, **kwargs):
+    # instances and search rows are SET_NULL; collect them while we can
+    if _active():
+        _schedule(_speeches_with_rows(char=instance))
+
+
+def connect():
+    '''attach the handlers; called once from SpeechdbConfig.ready()'''
+    uid = 'speechdb.signals'
+
+    for model in (Author, Work, Character, CharacterInstance, SpeechCluster, Speech, SpeechTag):
+        post_save.connect(corpus_changed, sender=model, dispatch_uid=f'{uid}.{model.__name__}_saved')
+        post_delete.connect(corpus_changed, sender=model, dispatch_uid=f'{uid}.{model.__name__}_deleted')
+
+    pre_save.connect(speech_pre_save, sender=Speech, dispatch_uid=f'{uid}.speech_pre_save')
+    post_save.connect(speech_saved, sender=Speech, dispatch_uid=f'{uid}.speech_saved')
+    pre_delete.connect(speech_deleting, sender=Speech, dispatch_uid=f'{uid}.speech_deleting')
+    post_delete.connect(speech_deleted, sender=Speech, dispatch_uid=f'{uid}.speech_deleted')
+    m2m_changed.connect(speech_participants_changed, sender=Speech.spkr.through, dispatch_uid=f'{uid}.spkr_changed')
+    m2m_changed.connect(speech_participants_changed, sender=Speech.addr.through, dispatch_uid=f'{uid}.addr_changed')
+
+    post_save.connect(tag_changed, sender=SpeechTag, dispatch_uid=f'{uid}.tag_saved')
+    post_delete.connect(tag_changed, sender=SpeechTag, dispatch_uid=f'{uid}.tag_deleted')
+
+    post_save.connect(instance_saved, sender=CharacterInstance, dispatch_uid=f'{uid}.instance_saved')
+    post_save.connect(character_saved, sender=Character, dispatch_uid=f'{uid}.character_saved')
+    post_save.connect(work_saved, sender=Work, dispatch_uid=f'{uid}.work_saved')
+    post_save.connect(author_saved, sender=Author, dispatch_uid=f'{uid}.author_saved')
+    pre_delete.connect(character_deleting, sender=Character, dispatch_uid=f'{uid}.character_deleting')
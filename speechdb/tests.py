@@ -1,3 +1,1666 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import random
+import tempfile
+import warnings
+from pathlib import Path
+from urllib.parse import urlencode
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import IntegrityError, connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from .models import Metadata, Author, Work, Character, CharacterInstance, count_lines, parse_locus
+from .models import Speech, SpeechCluster, SpeechTag, SpeechEmbedding, SpeechSearchRow
+from .autocomplete import PrefixTrie, normalize
+from .bitmap import SpeechBitmapIndex
+from .chunkstore import ChunkStore, read_manifest
+from .facets import FACETS, facet_counts
+from .pagination import APIPagination, decode_cursor, seek_page
+from .search import rebuild_search_rows
+from .serializers import SpeechSerializer
+from .hierarchy import rebuild_embeddings
+from .generation import GenerationCache, GenerationMiddleware, current_generation
+from .intervals import IntervalIndex, get_index, surrounding
+from . import intervals
+from .results import CachedResults, cache_key, peek_results
+from .query import SPEECH_KEYSET, compile_speech_filters
+from .views import AppCharacterInstanceList, AppCharacterList, AppSpeechList, ValidateParams
+from . import autocomplete, forms, views
+from . import signals
+from .management.commands import backup_db, export_archive
+
+
+def make_corpus(seed=0):
+    '''a small corpus: three works, whose list order differs from their ids,
+        some sixty speeches with participants and tags; derived tables
+        built as after an ingest
+    '''
+    rng = random.Random(seed)
+    with signals.paused():
+        vergil = Author.objects.create(name="Vergil")
+        homer = Author.objects.create(name="Homer")
+        works = [
+            Work.objects.create(author=vergil, title="Aeneid", lang=Work.Language.LATIN),
+            Work.objects.create(author=homer, title="Odyssey", lang=Work.Language.GREEK),
+            Work.objects.create(author=homer, title="Iliad", lang=Work.Language.GREEK),
+        ]
+
+        B = Character.CharacterBeing
+        G = Character.CharacterGender
+        chars = [
+            Character.objects.create(name="Achilles", being=B.MORTAL, gender=G.MALE),
+            Character.objects.create(name="Athena", being=B.DIVINE, gender=G.FEMALE),
+            Character.objects.create(name="Odysseus", being=B.MORTAL, gender=G.MALE),
+            Character.objects.create(name="Juno", being=B.DIVINE, gender=G.FEMALE),
+            Character.objects.create(name="Greeks", being=B.MORTAL, gender=G.MALE,
+                                     number=Character.CharacterNumber.COLLECTIVE),
+        ]
+        instances = [
+            CharacterInstance.objects.create(name=char.name, display=char.name, char=char, being=char.being,
+                                             gender=char.gender, number=char.number, context=work.title)
+            for work in works for char in chars
+        ]
+        instances.append(CharacterInstance.objects.create(
+            name="Athena", display="Mentor", char=chars[1], being=B.DIVINE, gender=G.MALE,
+            disguise="Mentor", context="Odyssey"))
+        instances.append(CharacterInstance.objects.create(
+            name="Stranger", display="a stranger", being=B.MORTAL, anon=True, context="Odyssey"))
+
+        tags = [choice for choice, label in SpeechTag.TagType.choices[:4]]
+        types = [choice for choice, label in Speech.SpeechType.choices]
+        seq = 0
+        for work in works:
+            line = 1
+            for n in range(8):
+                cluster = SpeechCluster.objects.create(seq=seq)
+                for part in range(1, rng.randint(1, 4) + 1):
+                    seq += 1
+                    length = rng.randint(1, 30)
+                    book = 1 + line // 200
+                    speech = Speech.objects.create(
+                        cluster=cluster, work=work, seq=seq, part=part, type=rng.choice(types),
+                        l_fi=f"{book}.{line}", l_la=f"{book}.{line + length - 1}",
+                        level=rng.choice([0, 0, 0, 1]),
+                    )
+                    line += length
+                    speech.spkr.set(rng.sample(instances, rng.randint(1, 2)))
+                    speech.addr.set(rng.sample(instances, rng.randint(0, 3)))
+                    for tag in rng.sample(tags, rng.randint(0, 2)):
+                        SpeechTag.objects.create(speech=speech, type=tag, doubt=rng.random() < 0.2)
+    call_command('rebuild_search', stdout=io.StringIO())
+
+
+def search_params(**query):
+    '''validated search params, as the speech views see them'''
+    with mock.patch('builtins.print'):
+        return ValidateParams(RequestFactory().get('/app/speeches/', query))
+
+
+def orm_ids(params, **options):
+    return list(
+        Speech.objects.filter(*compile_speech_filters(params, **options))
+        .distinct().order_by(*SPEECH_KEYSET).values_list('pk', flat=True)
+    )
+
+
+SEARCHES = [
+    {},
+    {'spkr_inst_gender': 'female'},
+    {'spkr_inst_gender': 'male', 'spkr_inst_being': 'divine'},
+    {'addr_char_name': 'Odysseus'},
+    {'inst_name': 'Athena'},
+    {'tags': ['cha', 'com']},
+    {'work_lang': 'greek', 'spkr_char_being': 'divine'},
+    {'type': 'D', 'level': '1'},
+    {'author_name': 'Homer', 'addr_inst_anon': 'True'},
+]
+
+
+# a small corpus in the ingest TSV format: two speech files, a book-less
+#   work, suffixed lines, "self" addressees, a disguise, an anonymous
+#   instance and doubtful tags
+INGEST_FILES = {
+    'authors': [
+        ('id', 'name', 'wd', 'urn'),
+        ('1', 'Homer', 'Q6691', 'urn:cts:greekLit:tlg0012'),
+        ('2', 'Vergil', '', ''),
+    ],
+    'works': [
+        ('id', 'author', 'title', 'lang', 'wd', 'urn', 'tlg'),
+        ('1', '1', 'Odyssey', 'greek', '', 'urn:cts:greekLit:tlg0012.tlg002', '0012.002'),
+        ('2', '2', 'Aeneid', 'Latin', '', '', ''),
+        ('3', '1', 'Hymn to Demeter', 'greek', '', '', ''),
+    ],
+    'characters': [
+        ('name', 'being', 'number', 'gender', 'wd', 'manto', 'topostext', 'notes'),
+        ('Odysseus', 'mortal', 'individual', 'male', 'Q47231', '', '', ''),
+        ('Athena', 'divine', 'individual', 'female', '', '', '', ''),
+        ('Aeneas', 'mortal', 'individual', 'male', '', '', '', ''),
+        ('Trojans', 'mortal', 'collective', 'male', '', '', '', ''),
+        ('Demeter', 'divine', 'individual', 'female', '', '', '', ''),
+    ],
+    'instances': [
+        ('name', 'being', 'number', 'gender', 'disguise', 'anon', 'notes', 'screen name', 'instance of'),
+        ('Odysseus', 'mortal', 'individual', 'male', '', '', '', '', ''),
+        ('Athena', 'divine', 'individual', 'female', '', '', '', '', ''),
+        ('Mentor', 'divine', 'individual', 'male', 'Mentor', '', '', '', 'Athena'),
+        ('Aeneas', 'mortal', 'individual', 'male', '', '', '', '', ''),
+        ('Trojans', 'mortal', 'collective', 'male', '', '', '', '', ''),
+        ('Demeter', 'divine', 'individual', 'female', '', '', '', '', ''),
+        ('Stranger', 'mortal', 'individual', 'female', '', 'yes', '', 'a stranger', ''),
+    ],
+}
+SPEECH_HEADER = ('seq', 'work_id', 'cluster_id', 'from_book', 'from_line', 'to_book', 'to_line',
+                 'turn_type', 'cluster_part', 'embedded_level', 'speaker', 'addressee',
+                 'speaker_notes', 'addressee_notes', 'misc_notes', 'short_speech_type')
+INGEST_SPEECHES = {
+    'speeches_a': [
+        ('1', '1', '10', '1', '1', '1', '10', 'Dialogue', '1', '0', 'Mentor', 'Odysseus', '', '', '', 'com; exh?'),
+        ('2', '1', '10', '1', '11', '1', '12a', 'D', '2', '0', 'Odysseus', 'Mentor', 'hesitant', '', '', ''),
+        ('3', '1', '11', '1', '20', '1', '40', 'M', '1', '0', 'Odysseus', 'Athena;Stranger', '', '', '', 'cha'),
+        ('4', '1', '11', '1', '25', '1', '28', 'M', '1', '1', 'Stranger', 'Odysseus', '', '', 'quoted', ''),
+        ('5', '1', '12', '2', '3', '2', '3', 'S', '1', '0', 'Odysseus;Athena', 'self', '', '', '', ''),
+    ],
+    'speeches_b': [
+        ('1', '2', '20', '1', '5', '1', '9', 'G', '1', '0', 'Aeneas', 'Trojans', '', '', '', 'exh'),
+        ('2', '2', '21', '1', '100', '1', '98', 'S', '1', '0', 'Aeneas', 'self', '', '', '', ''),
+        ('1', '3', '30', '', '10', '', '20', 'M', '1', '0', 'Demeter', 'Stranger', '', '', '', 'des'),
+    ],
+}
+
+
+def write_tsv(path, rows):
+    path.write_text(''.join('\t'.join(row) + '\n' for row in rows))
+
+
+def write_ingest_corpus(path, speeches=INGEST_SPEECHES):
+    for name, rows in INGEST_FILES.items():
+        write_tsv(path / name, rows)
+    for name, rows in speeches.items():
+        write_tsv(path / name, [SPEECH_HEADER] + rows)
+
+
+def clear_corpus():
+    '''delete everything an ingest writes'''
+    with signals.paused():
+        Speech.objects.all().delete()
+        SpeechCluster.objects.all().delete()
+        CharacterInstance.objects.all().delete()
+        Character.objects.all().delete()
+        Work.objects.all().delete()
+        Author.objects.all().delete()
+        Metadata.objects.exclude(name=Metadata.GENERATION).delete()
+
+
+def ingested_rows():
+    '''the corpus as stored, with generated ids and public ids replaced
+        by natural keys (and the generation stamp left out), so that two
+        loads of the same files compare equal
+    '''
+    speech_key = {pk: (work_id, seq) for pk, work_id, seq in Speech.objects.values_list('id', 'work_id', 'seq')}
+    skip = {'id', 'public_id', 'speech_generation'}
+
+    def row(obj, **keys):
+        values = {f.attname: getattr(obj, f.attname) for f in obj._meta.concrete_fields if f.attname not in skip}
+        values.update(keys)
+        return values
+
+    def inst(i):
+        return (i.name, i.context)
+
+    speeches = []
+    for s in Speech.objects.select_related('cluster').prefetch_related('spkr', 'addr', 'tags'):
+        speeches.append(row(
+            s,
+            embedded_in_id=speech_key.get(s.embedded_in_id),
+            cluster_seq=s.cluster.seq,
+            spkr=sorted(map(inst, s.spkr.all())),
+            addr=sorted(map(inst, s.addr.all())),
+            tags=sorted((t.type, t.doubt) for t in s.tags.all()),
+        ))
+    speeches.sort(key=lambda r: (r['work_id'], r['seq']))
+
+    return dict(
+        authors=[row(a, id=a.id) for a in Author.objects.order_by('id')],
+        works=[row(w, id=w.id) for w in Work.objects.order_by('id')],
+        characters=sorted((row(c) for c in Character.objects.all()), key=lambda r: r['name']),
+        instances=sorted(
+            (row(i, char_id=i.char and i.char.name) for i in CharacterInstance.objects.select_related('char')),
+            key=lambda r: (r['name'], r['context'])),
+        speeches=speeches,
+        search_rows=sorted(
+            (speech_key[r.speech_id], r.role, r.inst_name, r.inst_display, r.inst_anon, r.char_name, r.tags)
+            for r in SpeechSearchRow.objects.all()),
+        embeddings=sorted(
+            (speech_key[e.ancestor_id], speech_key[e.descendant_id], e.depth)
+            for e in SpeechEmbedding.objects.all()),
+    )
+
+
+class IngestTestCase(TestCase):
+
+    def ingest(self, path, **options):
+        call_command('ingestcorpus', str(path), stderr=io.StringIO(), **options)
+
+    def test_bulk_matches_row_at_a_time(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp)
+            write_ingest_corpus(path)
+
+            self.ingest(path)
+            expected = ingested_rows()
+            clear_corpus()
+            self.ingest(path, bulk=True)
+            actual = ingested_rows()
+
+        self.assertEqual(len(expected['speeches']), 8)
+        for table in expected:
+            self.assertEqual(actual[table], expected[table], table)
+
+        # a sanity check on the derived columns themselves
+        speeches = {(r['work_id'], r['seq']): r for r in actual['speeches']}
+        self.assertEqual(speeches[1, 2]['n_lines'], 2)
+        self.assertEqual(speeches[2, 2]['n_lines'], None)
+        self.assertEqual((speeches[3, 1]['fi_book'], speeches[3, 1]['la_line']), (0, 20))
+        self.assertEqual(speeches[1, 3]['cluster_size'], 2)
+        self.assertEqual([speeches[w, 1]['work_rank'] for w in (1, 2, 3)], [1, 2, 0])
+        self.assertEqual(speeches[1, 5]['addr'], [('Athena', 'Homer, Odyssey')])
+        self.assertEqual(speeches[1, 1]['tags'], [('com', False), ('exh', True)])
+
+    def test_bad_record(self):
+        bad = dict(INGEST_SPEECHES)
+        bad['speeches_b'] = INGEST_SPEECHES['speeches_b'] + [
+            ('3', '2', '22', '1', '200', '1', '201', 'Xenia', '1', '0', 'Aeneas', 'Trojans', '', '', '', ''),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp)
+            write_ingest_corpus(path, bad)
+            for bulk in (False, True):
+                with self.subTest(bulk=bulk):
+                    clear_corpus()
+                    with self.assertRaisesRegex(CommandError, "seq '3' of work '2'"):
+                        self.ingest(path, bulk=bulk)
+
+
+class PublicIdTestCase(TestCase):
+
+    def test_allocate_sparse(self):
+        Author.objects.bulk_create(Author(name=f"a{k}", public_id=f"{k:04X}") for k in range(50))
+        with mock.patch('secrets.randbits', side_effect=list(range(60))):
+            ids = Author.allocate_public_ids(5)
+        # the fifty used ids are skipped, and draws are never repeated
+        self.assertEqual(ids, [f"{k:04X}" for k in range(50, 55)])
+
+    def test_allocate_dense(self):
+        Author.objects.bulk_create(Author(name=f"a{k}", public_id=f"{k:X}") for k in range(10))
+        ids = Author.allocate_public_ids(6, length=1)
+        self.assertEqual(sorted(ids), list("ABCDEF"))
+        with self.assertRaises(IntegrityError):
+            Author.allocate_public_ids(7, length=1)
+
+    def test_assign_then_bulk_create(self):
+        authors = [Author(name=f"a{k}") for k in range(200)] + [Author(name="kept", public_id="ABCD")]
+        Author.objects.bulk_create(Author.assign_public_ids(authors))
+        ids = list(Author.objects.values_list('public_id', flat=True))
+        self.assertEqual(len(set(ids)), 201)
+        self.assertIn("ABCD", ids)
+        self.assertTrue(all(len(pid) == 4 for pid in ids))
+
+    def test_save_retries_a_taken_id(self):
+        Author.objects.create(name="first", public_id="AAAA")
+        author = Author(name="second")
+        with mock.patch('secrets.randbits', side_effect=[0xAAAA, 0xAAAA, 0xBBBB]) as randbits:
+            author.save()
+        self.assertEqual(randbits.call_count, 3)
+        self.assertEqual(Author.objects.get(pk=author.pk).public_id, "BBBB")
+
+    def test_save_raises_other_integrity_errors(self):
+        Metadata(name="version", value="1").save()
+        duplicate = Metadata(name="version", value="2")
+        with self.assertRaises(IntegrityError):
+            duplicate.save()
+        self.assertEqual(duplicate.public_id, "")
+        self.assertEqual(Metadata.objects.filter(name="version").count(), 1)
+
+
+class SearchTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def test_exists_plan_matches_join(self):
+        for query in SEARCHES:
+            params = search_params(**query)
+            with self.subTest(query=query):
+                self.assertEqual(set(params), set(query))
+                expected = orm_ids(params, mode="join", search_rows=False)
+                self.assertEqual(orm_ids(params, search_rows=False), expected)
+                self.assertEqual(orm_ids(params, mode="exists", search_rows=False), expected)
+
+    def test_search_row_plans_match_join(self):
+        for query in SEARCHES:
+            params = search_params(**query)
+            with self.subTest(query=query):
+                expected = orm_ids(params, mode="join", search_rows=False)
+                self.assertEqual(orm_ids(params), expected)
+                self.assertEqual(orm_ids(params, mode="exists"), expected)
+
+    def search_rows(self):
+        fields = [f.attname for f in SpeechSearchRow._meta.concrete_fields if f.attname != 'id']
+        return sorted(SpeechSearchRow.objects.values_list(*fields))
+
+    def test_search_rows_kept_on_write(self):
+        speech = Speech.objects.filter(level=0).first()
+        other = Speech.objects.exclude(cluster=speech.cluster).last()
+        inst = CharacterInstance.objects.exclude(speeches=speech).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            speech.addr.add(inst)
+            SpeechTag.objects.create(speech=speech, type=SpeechTag.TagType.FAREWELL)
+            speech.cluster = other.cluster
+            speech.save()
+            other.spkr.first().speeches.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            athena = Character.objects.get(name="Athena")
+            athena.name = "Pallas Athena"
+            athena.save()
+            stranger = CharacterInstance.objects.get(name="Stranger")
+            stranger.gender = Character.CharacterGender.FEMALE
+            stranger.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            work = Work.objects.get(title="Iliad")
+            work.title = "Ilias"
+            work.save()
+            homer = Author.objects.get(name="Homer")
+            homer.name = "Homerus"
+            homer.save()
+            Speech.objects.filter(work=work).first().delete()
+            Character.objects.get(name="Juno").delete()
+
+        self.assertTrue(SpeechSearchRow.objects.filter(char_name="Pallas Athena", work_title="Ilias").exists())
+        rows = self.search_rows()
+        rebuild_search_rows()
+        self.assertEqual(rows, self.search_rows())
+
+    def test_bitmap_matches_orm(self):
+        index = SpeechBitmapIndex.build()
+        for query in SEARCHES:
+            params = search_params(**query)
+            with self.subTest(query=query):
+                bits = index.match(params)
+                if 'inst_name' in query:
+                    # matched on instance or display name: left to the database
+                    self.assertIsNone(bits)
+                    continue
+                ids, has_next, has_previous = index.page(bits, size=len(index.ids))
+                self.assertEqual(ids, orm_ids(params))
+                self.assertEqual(index.count(bits), len(ids))
+
+    def test_bitmap_facet_counts_match_orm(self):
+        index = SpeechBitmapIndex.build()
+        params = search_params(work_lang='greek')
+        counts = index.facet_counts(params, ['spkr_inst_gender'])['spkr_inst_gender']
+        self.assertTrue(counts)
+        for gender, count in counts.items():
+            with self.subTest(gender=gender):
+                self.assertEqual(count, len(orm_ids({**params, 'spkr_inst_gender': [gender]})))
+
+
+class KeysetTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        cache.clear()
+
+    def pagers(self, params):
+        '''page(after, before, size) -> (ids, has_next, has_previous) for
+            each way a page is found
+        '''
+        queryset = Speech.objects.filter(*compile_speech_filters(params))
+
+        def seek(after, before, size):
+            rows, has_next, has_previous = seek_page(queryset, SPEECH_KEYSET, after, before, size)
+            return [row.pk for row in rows], has_next, has_previous
+
+        index = SpeechBitmapIndex.build()
+        bits = index.match(params)
+        return {
+            'seek': seek,
+            'cached': CachedResults(orm_ids(params)).page,
+            'bitmap': lambda after, before, size: index.page(bits, after, before, size),
+        }
+
+    def keys(self, pk):
+        return list(Speech.objects.filter(pk=pk).values_list(*SPEECH_KEYSET).get())
+
+    def walk(self, page, size, limit):
+        '''every page forward, then back from the last; returns the pages,
+            failing if there are more than limit
+        '''
+        pages = []
+        after = None
+        while True:
+            ids, has_next, has_previous = page(after, None, size)
+            self.assertEqual(has_previous, bool(pages))
+            pages.append(ids)
+            self.assertLessEqual(len(pages), limit)
+            if not has_next:
+                break
+            after = self.keys(ids[-1])
+
+        back = [ids]
+        while has_previous:
+            ids, has_next, has_previous = page(None, self.keys(ids[0]), size)
+            self.assertTrue(has_next)
+            back.insert(0, ids)
+            self.assertLessEqual(len(back), limit)
+        self.assertEqual(back, pages)
+        return pages
+
+    def test_pages_at_boundaries(self):
+        for query in [{}, {'work_lang': 'greek'}, {'spkr_inst_gender': 'female'}]:
+            params = search_params(**query)
+            expected = orm_ids(params)
+            n = len(expected)
+            # pages that divide the results exactly, leave one over, hold
+            #   them in one, and hold them with room to spare
+            for size in sorted({1, n // 3 or 1, n - 1 or 1, n, n + 1}):
+                for name, page in self.pagers(params).items():
+                    with self.subTest(query=query, size=size, pager=name):
+                        pages = self.walk(page, size, limit=n // size + 1)
+                        self.assertEqual([pk for ids in pages for pk in ids], expected)
+                        self.assertTrue(all(len(ids) == size for ids in pages[:-1]))
+                        self.assertTrue(0 < len(pages[-1]) <= size)
+
+    def test_past_the_ends(self):
+        expected = orm_ids({})
+        for name, page in self.pagers({}).items():
+            with self.subTest(pager=name):
+                self.assertEqual(page(self.keys(expected[-1]), None, 5), ([], False, True))
+                ids, has_next, has_previous = page(None, self.keys(expected[0]), 5)
+                self.assertEqual((ids, has_previous), ([], False))
+
+    def walk_list_view(self, url, query):
+        '''(previous_query, ids) for each page, following the next links'''
+        pages = []
+        while query is not None:
+            page = self.client.get(f'{url}?{query}').context['page_obj']
+            pages.append((page.previous_query, [obj.pk for obj in page]))
+            query = page.next_query
+        return pages
+
+    def test_list_view_links(self):
+        '''the next and previous links walk the same pages'''
+        lists = [
+            (AppSpeechList, '/app/speeches/', 'work_lang=greek', orm_ids(search_params(work_lang='greek'))),
+            # instance names repeat, one per work: ties broken by id
+            (AppCharacterInstanceList, '/app/instances/', '',
+             list(CharacterInstance.objects.order_by('name', 'id').values_list('pk', flat=True))),
+            (AppCharacterList, '/app/characters/', '',
+             list(Character.objects.order_by('name', 'id').values_list('pk', flat=True))),
+        ]
+        for view, url, query, expected in lists:
+            with self.subTest(url=url), mock.patch.object(view, 'paginate_by', 2), \
+                    mock.patch('builtins.print'):
+                pages = self.walk_list_view(url, query)
+                self.assertEqual([pk for previous_query, ids in pages for pk in ids], expected)
+                self.assertGreater(len(pages), 2)
+
+                previous = self.client.get(f'{url}?{pages[2][0]}').context['page_obj']
+                self.assertEqual([obj.pk for obj in previous], pages[1][1])
+
+    @override_settings(SPEECH_BITMAP_INDEX=False)
+    def test_list_view_fills_results(self):
+        params = search_params(work_lang='greek')
+        expected = orm_ids(params)
+        with mock.patch('builtins.print'):
+            response = self.client.get('/app/speeches/?work_lang=greek')
+            self.assertEqual(list(peek_results('speeches', params).ids), expected)
+            self.assertEqual(response.context['page_obj'].result_count, len(expected))
+            self.assertContains(response, f'{len(expected)} results')
+
+            # later pages come from the cache
+            cache.set(cache_key('results:speeches', params, current_generation()), expected[:3])
+            page = self.client.get('/app/speeches/?work_lang=greek').context['page_obj']
+            self.assertEqual([speech.pk for speech in page], expected[:3])
+            self.assertEqual(page.result_count, 3)
+
+    @override_settings(SPEECH_BITMAP_INDEX=False)
+    def test_list_view_too_many_to_cache(self):
+        params = search_params(work_lang='greek')
+        expected = orm_ids(params)
+        with mock.patch('speechdb.results.MAX_CACHED_IDS', 5), \
+                mock.patch.object(AppSpeechList, 'paginate_by', 7), mock.patch('builtins.print'):
+            pages = self.walk_list_view('/app/speeches/', 'work_lang=greek')
+            self.assertIsNone(peek_results('speeches', params))
+            page = self.client.get('/app/speeches/?work_lang=greek').context['page_obj']
+        self.assertEqual([pk for previous_query, ids in pages for pk in ids], expected)
+        self.assertEqual(page.result_count, len(expected))
+
+    def test_malformed_cursor(self):
+        self.assertIsNone(decode_cursor('not a cursor', 3))
+        self.assertIsNone(decode_cursor('WzEsMl0', 3))
+        # a bad cursor starts the list over, rather than failing
+        with mock.patch('builtins.print'):
+            response = self.client.get('/app/speeches/?after=not-a-cursor')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['page_obj'].has_previous)
+
+
+@override_settings(SPEECH_BITMAP_INDEX=False)
+class FacetTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_match_searches(self):
+        '''each option's count is the number of speeches found with it
+            selected in place of the filter's own selection
+        '''
+        for query in [{}, {'work_lang': 'greek'}, {'spkr_inst_gender': 'female', 'work_lang': 'greek'},
+                      {'addr_inst_name': 'a stranger'}, {'tags': 'cha', 'spkr_char_name': 'Athena'}]:
+            params = search_params(**query)
+            counts = facet_counts(params)
+            self.assertEqual(set(counts), set(FACETS))
+            for name, options in counts.items():
+                others = {k: v for k, v in params.items() if k != name}
+                for value, n in options.items():
+                    with self.subTest(query=query, facet=name, value=value):
+                        self.assertEqual(n, len(orm_ids({**others, name: [value]})))
+            # anonymous instances are offered under their display names too
+            self.assertIn('a stranger', counts['addr_inst_name'])
+            self.assertIn('Stranger', counts['addr_inst_name'])
+
+    def test_queries(self):
+        unfiltered = facet_counts({})
+        one, two = search_params(work_lang='greek'), search_params(work_lang='greek', type='D')
+        # the generation; the searched filter's options are the cached
+        #   unfiltered ones, and the rest are counted in one query
+        with self.assertNumQueries(2):
+            counts = facet_counts(one)
+        self.assertEqual(counts['work_lang'], unfiltered['work_lang'])
+        # two searched filters: one more query each
+        with self.assertNumQueries(4):
+            facet_counts(two)
+
+
+class CSVTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        cache.clear()
+
+    def rendered(self, view_class, url, query):
+        '''the CSV as the views wrote it before streaming: the whole
+            queryset through one csv.writer into the response
+        '''
+        view = view_class()
+        with mock.patch('builtins.print'):
+            view.setup(RequestFactory().get(url, query))
+            objects = list(view.get_queryset())
+        out = io.StringIO()
+        writer = csv.writer(out, quoting=view.quoting)
+        writer.writerow([label for label, _ in view.fields])
+        for obj in objects:
+            writer.writerow([accessor(obj) for _, accessor in view.fields])
+        return out.getvalue().encode()
+
+    def test_streamed_csv_matches_rendered(self):
+        exports = [
+            (views.AppAuthorCSV, '/app/authors/csv/', {}),
+            (views.AppWorkCSV, '/app/works/csv/', {'lang': 'greek'}),
+            (views.AppCharacterCSV, '/app/characters/csv/', {}),
+            (views.AppCharacterInstanceCSV, '/app/instances/csv/', {}),
+            (views.AppSpeechClusterCSV, '/app/clusters/csv/', {}),
+            (views.AppSpeechCSV, '/app/speeches/csv/', {}),
+            (views.AppSpeechCSV, '/app/speeches/csv/', {'spkr_inst_gender': 'female', 'tags': 'cha'}),
+        ]
+        for view_class, url, query in exports:
+            with self.subTest(url=url, query=query):
+                expected = self.rendered(view_class, url, query)
+                with mock.patch('builtins.print'), mock.patch.object(view_class, 'chunk_size', 4):
+                    response = self.client.get(url, query)
+                self.assertTrue(response.streaming)
+                self.assertEqual(response['Content-Type'], 'text/csv')
+                self.assertEqual(b''.join(response.streaming_content), expected)
+                self.assertGreater(expected.count(b'\n'), 2)
+
+
+class LocusTestCase(SimpleTestCase):
+
+    def test_parse_locus(self):
+        self.assertEqual(parse_locus("345"), (0, 345, 0))
+        self.assertEqual(parse_locus("12.345"), (12, 345, 0))
+        self.assertEqual(parse_locus("12.345a"), (12, 345, 1))
+        self.assertEqual(parse_locus("12.345B"), (12, 345, 2))
+        self.assertEqual(parse_locus("1.2.24"), (1002, 24, 0))
+        self.assertEqual(parse_locus(" 3.7 "), (3, 7, 0))
+        self.assertEqual(parse_locus(17), (0, 17, 0))
+        self.assertIsNone(parse_locus(""))
+        self.assertIsNone(parse_locus("1.x"))
+        self.assertIsNone(parse_locus("pr"))
+
+    def test_parse_locus_orders_lines(self):
+        loci = ["2.1", "1.10", "1.9a", "1.9", "1.2.1", "1.100"]
+        self.assertEqual(sorted(loci, key=parse_locus), ["1.9", "1.9a", "1.10", "1.100", "2.1", "1.2.1"])
+
+    def test_count_lines(self):
+        self.assertEqual(count_lines("1.1", "1.10"), 10)
+        self.assertEqual(count_lines("5", "5"), 1)
+        self.assertEqual(count_lines("1.9a", "1.12b"), 4)
+        self.assertEqual(count_lines("1.2.3", "1.2.5"), 3)
+        # different books, a line without digits, or backwards
+        self.assertIsNone(count_lines("1.500", "2.3"))
+        self.assertIsNone(count_lines("1.2.3", "1.3.5"))
+        self.assertIsNone(count_lines("1.x", "1.5"))
+        self.assertIsNone(count_lines("1.10", "1.9"))
+
+
+class DerivedColumnTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def assertClusterSizes(self):
+        for speech in Speech.objects.all():
+            self.assertEqual(speech.cluster_size, Speech.objects.filter(cluster_id=speech.cluster_id).count())
+
+    def test_cluster_size_kept_on_write(self):
+        self.assertClusterSizes()
+        speech = Speech.objects.filter(cluster_size=1).first()
+        other = Speech.objects.filter(cluster_size__gt=1).last()
+        speech.cluster = other.cluster
+        speech.save()
+        self.assertClusterSizes()
+        Speech.objects.create(cluster=speech.cluster, work=speech.work, seq=1000, part=9,
+                              type=Speech.SpeechType.DIALOGUE, l_fi="9.1", l_la="9.4")
+        self.assertClusterSizes()
+        other.delete()
+        self.assertClusterSizes()
+
+    def test_n_lines_set_on_save(self):
+        speech = Speech.objects.first()
+        speech.l_fi, speech.l_la = "3.10", "3.19a"
+        speech.save()
+        self.assertEqual(Speech.objects.get(pk=speech.pk).n_lines, 10)
+        speech.l_la = "4.2"
+        speech.save()
+        self.assertIsNone(Speech.objects.get(pk=speech.pk).n_lines)
+
+    def test_n_lines_filter(self):
+        params = search_params(n_lines_min='10', n_lines_max='20')
+        expected = [pk for pk, l_fi, l_la in Speech.objects.order_by(*SPEECH_KEYSET).values_list('pk', 'l_fi', 'l_la')
+                    if 10 <= (count_lines(l_fi, l_la) or 0) <= 20]
+        self.assertTrue(expected)
+        self.assertEqual(orm_ids(params), expected)
+
+    def test_n_parts_filter(self):
+        params = search_params(n_parts='3')
+        expected = [speech.pk for speech in Speech.objects.order_by(*SPEECH_KEYSET)
+                    if speech.cluster.speeches.count() == 3]
+        self.assertTrue(expected)
+        self.assertEqual(orm_ids(params), expected)
+
+
+class LocusSearchTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def test_stored_loci(self):
+        for speech in Speech.objects.all():
+            self.assertEqual((speech.fi_book, speech.fi_line, speech.fi_suffix), parse_locus(speech.l_fi))
+            self.assertEqual((speech.la_book, speech.la_line, speech.la_suffix), parse_locus(speech.l_la))
+
+    def test_update_locus_fields(self):
+        Speech.objects.update(fi_book=None, fi_line=None, la_suffix=None, n_lines=None)
+        Speech.update_locus_fields()
+        self.test_stored_loci()
+        self.assertFalse(Speech.objects.filter(n_lines__isnull=True).exists())
+
+    def test_range_search(self):
+        rows = list(Speech.objects.order_by(*SPEECH_KEYSET).values_list('pk', 'l_fi', 'l_la'))
+        for query in [{'from': '1.50'}, {'to': '1.120'}, {'from': '1.50', 'to': '1.120'},
+                      {'from': '1.95', 'to': '1.95'}, {'from': '2.1'}, {'to': '0.1'}]:
+            start = parse_locus(query.get('from', '0.0'))
+            end = parse_locus(query.get('to', '999.0'))
+            expected = [pk for pk, l_fi, l_la in rows if parse_locus(l_la) >= start and parse_locus(l_fi) <= end]
+            with self.subTest(query=query):
+                self.assertEqual(orm_ids(search_params(**query)), expected)
+
+
+class IntervalTestCase(SimpleTestCase):
+
+    def records(self, rng, n):
+        '''random (id, fi_book, fi_line, fi_suffix, la_book, la_line,
+            la_suffix, level, seq) records, some unplaceable
+        '''
+        records = []
+        for pk in range(1, n + 1):
+            book = rng.randint(1, 3)
+            fi = rng.randint(1, 60)
+            la = fi + rng.choice([0, 0, 1, 3, 10, 40])
+            fi_line, la_line = (None, None) if rng.random() < 0.05 else (fi, la)
+            records.append((pk, book, fi_line, rng.randint(0, 1), book, la_line, rng.randint(0, 1),
+                            rng.randint(0, 2), pk))
+        return records
+
+    def test_queries_match_scan(self):
+        rng = random.Random(1)
+        for n in (0, 1, 2, 7, 200):
+            records = self.records(rng, n)
+            index = IntervalIndex(records)
+            items = [((b1, l1, s1), (b2, l2, s2), level, seq, pk)
+                     for pk, b1, l1, s1, b2, l2, s2, level, seq in records if l1 is not None]
+            for _ in range(50):
+                book = rng.randint(1, 3)
+                fi = (book, rng.randint(0, 70), rng.randint(0, 1))
+                la = max(fi, (book, fi[1] + rng.choice([0, 2, 20]), rng.randint(0, 1)))
+
+                def scan(test):
+                    return sorted(item for item in items if test(item[0], item[1]))
+
+                with self.subTest(n=n, fi=fi, la=la):
+                    self.assertEqual(sorted(index.enclosing(fi, la)), scan(lambda a, b: a <= fi and b >= la))
+                    self.assertEqual(sorted(index.overlapping(fi, la)), scan(lambda a, b: a <= la and b >= fi))
+                    self.assertEqual(sorted(index.contained(fi, la)), scan(lambda a, b: a >= fi and b <= la))
+                    self.assertEqual(sorted(index.surrounding(fi)), scan(lambda a, b: a <= fi <= b))
+
+
+class IntervalIndexTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        intervals._indexes.clear()
+
+    def scan_surrounding(self, locus, work_ids=None):
+        key = parse_locus(locus)
+        return sorted(
+            speech.pk for speech in Speech.objects.all()
+            if (work_ids is None or speech.work_id in work_ids)
+            and parse_locus(speech.l_fi) <= key <= parse_locus(speech.l_la)
+        )
+
+    def test_surrounding(self):
+        works = list(Work.objects.values_list('pk', flat=True))
+        for locus in ('1.1', '1.57', '1.199', '2.3', '9.9'):
+            for work_ids in (None, works[:1], works[1:]):
+                with self.subTest(locus=locus, work_ids=work_ids):
+                    self.assertEqual(sorted(surrounding(locus, work_ids)), self.scan_surrounding(locus, work_ids))
+        self.assertEqual(orm_ids(search_params(at='1.57')),
+                         [pk for pk in orm_ids({}) if pk in self.scan_surrounding('1.57')])
+
+    def test_guess_enclosing(self):
+        speeches = list(Speech.objects.all())
+        for speech in speeches:
+            fi, la = parse_locus(speech.l_fi), parse_locus(speech.l_la)
+            candidates = [
+                other for other in speeches
+                if other.work_id == speech.work_id and other.pk != speech.pk
+                and parse_locus(other.l_fi) <= fi and parse_locus(other.l_la) >= la
+                and (parse_locus(other.l_fi), parse_locus(other.l_la)) != (fi, la)
+            ]
+            expected = max(candidates, default=None, key=lambda other: (
+                parse_locus(other.l_fi), other.level if other.level < speech.level else -1, -other.seq))
+            with self.subTest(speech=speech.pk):
+                self.assertEqual(Speech.guess_enclosing(speech.work, speech.l_fi, speech.l_la,
+                                                        level=speech.level, exclude_pk=speech.pk), expected)
+
+    def test_generations_read_together(self):
+        works = list(Work.objects.values_list('pk', flat=True))
+        surrounding('1.5', works)
+        # the works' generations, in one query; no index is rebuilt
+        with self.assertNumQueries(1):
+            surrounding('1.5', works)
+
+        # once per request, however many lookups; then only the guessed
+        #   speeches are read
+        speech = Speech.objects.filter(level=1).first()
+        guessed = Speech.guess_enclosing(speech.work_id, speech.l_fi, speech.l_la, level=1)
+
+        def request(_):
+            surrounding('1.5', works)
+            for work_id in works:
+                get_index(work_id)
+            for _ in range(3):
+                Speech.guess_enclosing(speech.work_id, speech.l_fi, speech.l_la, level=1)
+
+        with self.assertNumQueries(1 + 3 * (guessed is not None)):
+            GenerationMiddleware(request)(None)
+
+    def test_invalidated_per_work(self):
+        first, second = Work.objects.all()[:2]
+        old = {work.pk: get_index(work.pk) for work in (first, second)}
+        speech = Speech.objects.filter(work=first).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            speech.l_la = '9.999'
+            speech.save()
+        self.assertIsNot(get_index(first.pk), old[first.pk])
+        self.assertIs(get_index(second.pk), old[second.pk])
+        self.assertIn(speech.pk, surrounding('9.999', [first.pk]))
+
+
+class EmbeddingTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def closure_rows(self):
+        return sorted(SpeechEmbedding.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def walked_rows(self):
+        '''the closure, by walking embedded_in from every speech'''
+        parent = dict(Speech.objects.values_list('id', 'embedded_in_id'))
+        rows = []
+        for pk in parent:
+            ancestor, depth = pk, 0
+            while ancestor is not None:
+                rows.append((ancestor, pk, depth))
+                ancestor, depth = parent[ancestor], depth + 1
+        return sorted(rows)
+
+    def assertClosure(self):
+        rows = self.closure_rows()
+        self.assertEqual(rows, self.walked_rows())
+        rebuild_embeddings()
+        self.assertEqual(rows, self.closure_rows())
+
+    def embed(self, speech, parent):
+        speech.embedded_in = parent
+        speech.save()
+
+    def test_kept_on_write(self):
+        a, b, c, d, e, f = Speech.objects.all()[:6]
+        self.assertClosure()
+
+        # a chain, built top down, then bottom up
+        for speech, parent in ((b, a), (c, b)):
+            self.embed(speech, parent)
+        for speech, parent in ((f, e), (e, d)):
+            self.embed(speech, parent)
+        self.assertClosure()
+        new = Speech.objects.create(cluster=c.cluster, work=c.work, seq=1000, part=9, embedded_in=c,
+                                    type=Speech.SpeechType.DIALOGUE, l_fi="9.1", l_la="9.4")
+        self.assertClosure()
+
+        # a subtree moves with its root, and out from under it again
+        self.embed(d, new)
+        self.assertClosure()
+        self.embed(b, None)
+        self.embed(e, a)
+        self.assertClosure()
+
+        # what was embedded in a deleted speech is top-level
+        self.assertEqual(list(c.get_descendants().order_by('depth')), [new, d])
+        c.delete()
+        self.assertIsNone(Speech.objects.get(pk=new.pk).embedded_in_id)
+        self.assertClosure()
+        self.assertEqual(list(new.get_descendants()), [d])
+
+    def test_several_at_once(self):
+        a, b, c, d = Speech.objects.all()[:4]
+        with signals.paused():
+            for speech, parent in ((b, a), (c, b), (d, c)):
+                self.embed(speech, parent)
+        # the order given doesn't matter
+        rebuild_embeddings([d.pk, a.pk, c.pk, b.pk])
+        self.assertClosure()
+        with signals.paused():
+            self.embed(c, None)
+            self.embed(a, d)
+        rebuild_embeddings([a.pk, c.pk])
+        self.assertClosure()
+
+    def test_cycle(self):
+        a, b, c = Speech.objects.all()[:3]
+        self.embed(b, a)
+        self.embed(c, b)
+        self.embed(a, c)
+        rows = self.closure_rows()
+        rebuild_embeddings()
+        self.assertEqual(rows, self.closure_rows())
+        self.embed(a, None)
+        self.assertClosure()
+
+    def test_incremental(self):
+        a, b = Speech.objects.all()[:2]
+        with signals.paused():
+            self.embed(b, a)
+        # the speech, its rows, the deeper links of its subtree, the new
+        #   parent's ancestors and the insert, in a savepoint; none of them
+        #   the whole table
+        with self.assertNumQueries(7):
+            rebuild_embeddings([b.pk])
+        self.assertClosure()
+
+
+# any participant searches: params, and whether an instance satisfies them
+#   all on its own
+PARTICIPANT_SEARCHES = [
+    ({'char_name': 'Athena'}, lambda i: i.char and i.char.name == 'Athena'),
+    ({'inst_gender': 'female'}, lambda i: i.gender == 'female'),
+    # Athena, disguised as Mentor: the terms hold for one participant
+    ({'char_being': 'divine', 'inst_gender': 'male'},
+     lambda i: i.char and i.char.being == 'divine' and i.gender == 'male'),
+    ({'inst_anon': 'True'}, lambda i: i.anon),
+]
+
+
+class ParticipantTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        cache.clear()
+
+    def scan(self, test):
+        '''speeches with a speaker or addressee passing test, in list order'''
+        return [
+            speech.pk for speech in Speech.objects.order_by(*SPEECH_KEYSET).prefetch_related('spkr__char', 'addr__char')
+            if any(test(inst) for inst in [*speech.spkr.all(), *speech.addr.all()])
+        ]
+
+    def test_any_participant_search(self):
+        for query, test in PARTICIPANT_SEARCHES:
+            params = search_params(**query)
+            expected = self.scan(test)
+            with self.subTest(query=query):
+                self.assertEqual(set(params), set(query))
+                self.assertTrue(expected)
+                self.assertEqual(orm_ids(params), expected)
+                self.assertEqual(orm_ids(params, mode="exists"), expected)
+                self.assertEqual(orm_ids(params, search_rows=False), expected)
+                self.assertEqual(orm_ids(params, mode="join", search_rows=False), expected)
+
+    def test_any_participant_api(self):
+        for query, test in PARTICIPANT_SEARCHES[:2]:
+            expected = self.scan(test)
+            api_query = {f'any_{name.removeprefix("char_")}': value for name, value in query.items()}
+            with self.subTest(query=api_query):
+                speeches = self.client.get('/api/speeches/', api_query).json()['results']
+                self.assertEqual(sorted(s['id'] for s in speeches), sorted(expected))
+
+                clusters = self.client.get('/api/clusters/', api_query).json()['results']
+                self.assertEqual(sorted(c['id'] for c in clusters),
+                                 sorted(set(Speech.objects.filter(pk__in=expected).values_list('cluster_id', flat=True))))
+
+
+class ClusterSearchTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        cache.clear()
+
+    def expected_clusters(self, params):
+        '''clusters with a matching speech, in list order'''
+        matched = set(Speech.objects.filter(pk__in=orm_ids(params)).values_list('cluster_id', flat=True))
+        return [pk for pk in SpeechCluster.objects.order_by('seq', 'id').values_list('pk', flat=True) if pk in matched]
+
+    def list_pages(self, query):
+        '''ids on each page of the cluster list, following the next links'''
+        pages = []
+        query = urlencode(query, doseq=True)
+        while query is not None:
+            page = self.client.get(f'/app/clusters/?{query}').context['page_obj']
+            pages.append([cluster.pk for cluster in page])
+            query = page.next_query
+        return pages
+
+    def test_cluster_search(self):
+        for query in [*SEARCHES, {'char_name': 'Athena'}]:
+            expected = self.expected_clusters(search_params(**query))
+            with self.subTest(query=query), mock.patch.object(views.AppSpeechClusterList, 'paginate_by', 5), \
+                    mock.patch('builtins.print'):
+                pages = self.list_pages(query)
+                self.assertEqual([pk for ids in pages for pk in ids], expected)
+
+                response = self.client.get('/app/clusters/csv/', query)
+                rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+                self.assertEqual(len(rows) - 1, len(expected))
+
+    def test_prefetch_per_page(self):
+        # the prefetches run once for the page, whatever its size
+        with mock.patch('builtins.print'):
+            counts = []
+            for size in (2, 6):
+                cache.clear()
+                with mock.patch.object(views.AppSpeechClusterList, 'paginate_by', size), \
+                        CaptureQueriesContext(connection) as queries:
+                    page = self.client.get('/app/clusters/?work_lang=greek').context['page_obj']
+                self.assertEqual(len(page), size)
+                counts.append(len(queries))
+
+                # and cover only its clusters
+                prefetch = [q['sql'] for q in queries if q['sql'].startswith('SELECT "speechdb_speech"')
+                            and '"speechdb_speech"."cluster_id" IN (' in q['sql']]
+                self.assertEqual(len(prefetch), 1)
+                self.assertEqual(prefetch[0].split('"cluster_id" IN (')[1].split(')')[0].count(',') + 1, size)
+        self.assertEqual(counts[0], counts[1])
+
+
+class ChoiceRegistryTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        # a registry of our own: generations repeat once a test rolls back
+        patcher = mock.patch.object(forms, '_registry', GenerationCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_choices(self):
+        self.assertEqual(forms.get_char_name_choices(),
+                         [(name, name) for name in sorted(Character.objects.values_list('name', flat=True))])
+        self.assertEqual(forms.get_work_title_choices(),
+                         [(title, title) for title in sorted(Work.objects.values_list('title', flat=True))])
+        # instance names repeat across works; anonymous ones go by display
+        inst_names = forms.get_inst_name_choices()
+        self.assertEqual(len(inst_names), len(set(inst_names)))
+        self.assertIn(('a stranger', 'a stranger'), inst_names)
+        self.assertNotIn(('Stranger', 'Stranger'), inst_names)
+
+        # each caller gets its own copy
+        forms.get_author_name_choices().clear()
+        self.assertEqual(len(forms.get_author_name_choices()), 2)
+
+    def test_forms_read_generation_only(self):
+        def request(_):
+            forms.PagerForm({})
+            for prefix in ('spkr', 'addr'):
+                forms.CharacterForm({}, prefix=prefix)
+                forms.InstanceForm({}, prefix=prefix)
+
+        request(None)
+        with self.assertNumQueries(1):
+            GenerationMiddleware(request)(None)
+
+    def test_invalidated_by_generation(self):
+        names = forms.get_char_name_choices()
+        with self.captureOnCommitCallbacks(execute=True):
+            Character.objects.create(name="Zeus", being=Character.CharacterBeing.DIVINE)
+        self.assertEqual(forms.get_char_name_choices(), sorted(names + [("Zeus", "Zeus")]))
+
+
+class PrefixTrieTestCase(SimpleTestCase):
+
+    def test_normalize(self):
+        for spelling in ("Akhilleus", "Achilleus", "Ἀχιλλεύς", "ACHILLEUS"):
+            with self.subTest(spelling=spelling):
+                self.assertEqual(normalize(spelling), "achilleus")
+        self.assertEqual(normalize("Aias"), normalize("Aeas"))
+        self.assertEqual(normalize("Kirke"), normalize("Circe"))
+        self.assertEqual(normalize("  Athena,  Pallas "), "athena pallas")
+
+    def test_search(self):
+        trie = PrefixTrie(["Athena Pallas", "Pallas", "Achilles", "Aias", "Ἀθηνᾶ"])
+        self.assertEqual(trie.search("ath"), ["Ἀθηνᾶ", "Athena Pallas"])
+        # first words first, then later ones
+        self.assertEqual(trie.search("pall"), ["Pallas", "Athena Pallas"])
+        self.assertEqual(trie.search("Akh"), ["Achilles"])
+        self.assertEqual(trie.search("Ae"), ["Aias"])
+        self.assertEqual(trie.search("zeus"), [])
+        self.assertEqual(trie.search(""), trie.values)
+
+
+class AutocompleteTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        for module, name in ((forms, '_registry'), (autocomplete, '_tries')):
+            patcher = mock.patch.object(module, name, GenerationCache())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def suggest(self, field, **query):
+        response = self.client.get(f'/app/autocomplete/{field}/', query)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [result['id'] for result in data['results']], data['pagination']['more']
+
+    def test_suggestions(self):
+        self.assertEqual(self.suggest('char_name', term='ath'), (['Athena'], False))
+        self.assertEqual(self.suggest('work_title', term='il'), (['Iliad'], False))
+        self.assertEqual(self.suggest('inst_name', term='str'), (['a stranger'], False))
+        self.assertEqual(self.client.get('/app/autocomplete/spkr_notes/').status_code, 404)
+
+    def test_pages(self):
+        names = sorted(Character.objects.values_list('name', flat=True))
+        with mock.patch.object(views.AppAutocomplete, 'page_size', 2):
+            pages = [self.suggest('char_name', page=page) for page in (1, 2, 3)]
+            self.assertEqual(self.suggest('char_name', page='x'), pages[0])
+        self.assertEqual([more for values, more in pages], [True, True, False])
+        self.assertEqual([name for values, more in pages for name in values], names)
+
+    def test_invalidated_by_generation(self):
+        self.assertEqual(self.suggest('char_name', term='ze'), ([], False))
+        with self.captureOnCommitCallbacks(execute=True):
+            Character.objects.create(name="Zeus", being=Character.CharacterBeing.DIVINE)
+        self.assertEqual(self.suggest('char_name', term='ze'), (['Zeus'], False))
+
+
+class APIPlanTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def get(self, url, size):
+        cache.clear()
+        with mock.patch.object(APIPagination, 'page_size', size), CaptureQueriesContext(connection) as queries:
+            results = self.client.get(url).json()['results']
+        self.assertEqual(len(results), size)
+        return results, len(queries)
+
+    def test_queries_fixed_per_page(self):
+        for url in ('/api/speeches/', '/api/speeches/?depth=6', '/api/clusters/', '/api/instances/', '/api/works/'):
+            with self.subTest(url=url):
+                small, count = self.get(url, 1)
+                with self.assertNumQueries(count):
+                    large, _ = self.get(url, 3)
+                self.assertEqual(large[0], small[0])
+
+    def test_planned_matches_unplanned(self):
+        results, count = self.get('/api/speeches/', 5)
+        speeches = Speech.objects.in_bulk([result['id'] for result in results])
+        unplanned = SpeechSerializer([speeches[result['id']] for result in results], many=True).data
+        self.assertEqual(results, json.loads(JSONRenderer().render(unplanned)))
+
+
+class SerializerOptionsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        cache.clear()
+
+    def results(self, query):
+        return self.client.get('/api/speeches/', query).json()['results']
+
+    def test_depth_per_request(self):
+        shallow = self.results({'depth': 0})[0]
+        self.assertIsInstance(shallow['work'], int)
+        deep = self.results({})[0]
+        self.assertIsInstance(deep['work']['author'], dict)
+        self.assertEqual(SpeechSerializer.Meta.depth, 3)
+
+        # two serializers at once, each with its own depth
+        speech = Speech.objects.first()
+        serializers = [SpeechSerializer(speech, depth=0), SpeechSerializer(speech), SpeechSerializer(speech, depth=1)]
+        works = [serializer.data['work'] for serializer in serializers]
+        self.assertIsInstance(works[0], int)
+        self.assertIsInstance(works[1]['author'], dict)
+        self.assertIsInstance(works[2]['author'], int)
+        self.assertEqual(SpeechSerializer.Meta.depth, 3)
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.results({'fields': 'id,work.title'})
+        self.assertTrue(results)
+        for result in results:
+            self.assertEqual(set(result), {'id', 'work'})
+            self.assertEqual(set(result['work']), {'title'})
+
+        # the columns not asked for aren't read
+        speech_queries = [q['sql'] for q in queries if 'FROM "speechdb_speech"' in q['sql']]
+        self.assertTrue(speech_queries)
+        self.assertFalse([sql for sql in speech_queries if '"l_fi"' in sql or '"notes"' in sql])
+
+        self.assertEqual([set(result) for result in self.results({'min': 1})], [{'id'}] * len(results))
+
+    def test_expand(self):
+        result = self.results({'depth': 0, 'expand': 'work.author'})[0]
+        self.assertIsInstance(result['work']['author'], dict)
+        self.assertIsInstance(result['cluster'], int)
+
+    def test_detail(self):
+        speech = Speech.objects.first()
+        result = self.client.get(f'/api/speeches/{speech.pk}/', {'fields': 'id,work.author.name', 'depth': 2}).json()
+        self.assertEqual(result, {'id': speech.pk, 'work': {'author': {'name': speech.work.author.name}}})
+
+
+class APIPaginationTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_corpus()
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url):
+        '''ids on each page, following the next links, then back again'''
+        pages = []
+        while url is not None:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            pages.append([result['id'] for result in data['results']])
+            url = data['next']
+
+        back = [pages[-1]]
+        url = data['previous']
+        while url is not None:
+            data = self.client.get(url).json()
+            back.insert(0, [result['id'] for result in data['results']])
+            url = data['previous']
+        self.assertEqual(back, pages)
+        return pages
+
+    def test_cursor_pages(self):
+        lists = [
+            ('/api/speeches/?pagination=cursor', orm_ids({})),
+            ('/api/speeches/?pagination=cursor&work_lang=greek&fields=id', orm_ids(search_params(work_lang='greek'))),
+            ('/api/clusters/?pagination=cursor',
+             list(SpeechCluster.objects.order_by('seq', 'id').values_list('pk', flat=True))),
+            # instance names repeat, one per work: ties broken by id
+            ('/api/instances/?pagination=cursor',
+             list(CharacterInstance.objects.order_by('name', 'id').values_list('pk', flat=True))),
+        ]
+        for url, expected in lists:
+            with self.subTest(url=url), mock.patch.object(APIPagination, 'page_size', 7):
+                pages = self.walk(url)
+                self.assertEqual([pk for ids in pages for pk in ids], expected)
+                self.assertGreater(len(pages), 1)
+        self.assertEqual(self.client.get('/api/speeches/?after=not-a-cursor').status_code, 404)
+
+    def test_cached_count(self):
+        count = Speech.objects.filter(work__lang='greek').count()
+        self.assertEqual(self.client.get('/api/speeches/?work_lang=greek').json()['count'], count)
+        key = cache_key('count:SpeechList', {'work_lang': ['greek']}, current_generation())
+        self.assertEqual(cache.get(key), count)
+
+        # other pages, and other renderings of them, share it
+        cache.set(key, 1000)
+        for query in ('page=1', 'fields=id&depth=0', 'min=1'):
+            with self.subTest(query=query), CaptureQueriesContext(connection) as queries:
+                data = self.client.get(f'/api/speeches/?work_lang=greek&{query}').json()
+                self.assertEqual(data['count'], 1000)
+                self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+        # which a write puts out of date
+        with self.captureOnCommitCallbacks(execute=True):
+            Speech.objects.filter(work__lang='greek').first().delete()
+        self.assertEqual(self.client.get('/api/speeches/?work_lang=greek').json()['count'], count - 1)
+
+    def test_unordered_pages(self):
+        for n in range(3):
+            Metadata.objects.create(name=f"note {n}", value=str(n))
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            results = self.client.get('/api/meta/').json()['results']
+        self.assertEqual([result['id'] for result in results], sorted(result['id'] for result in results))
+
+
+def zstd_available():
+    try:
+        export_archive._zstd_writer(io.BytesIO()).close()
+    except CommandError:
+        return False
+    return True
+
+
+class ExportTestCase(TransactionTestCase):
+
+    def setUp(self):
+        make_corpus()
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def export(self, name, **options):
+        call_command('export_archive', str(self.dir / name), stdout=io.StringIO(), **options)
+        return self.dir / name
+
+    def manifest(self, path):
+        '''{filename: sha256} as MANIFEST.sha256 lists them'''
+        with open(path / 'MANIFEST.sha256') as f:
+            return {filename: digest for digest, filename in (line.rstrip('\n').split('  ', 1) for line in f)}
+
+    def test_manifest(self):
+        path = self.export('one', create_readme=True)
+        manifest = self.manifest(path)
+        self.assertEqual(set(manifest), {f'{name}.tsv' for name, header, rows in export_archive.TABLES} | {'README.txt'})
+        for filename, digest in manifest.items():
+            with self.subTest(filename=filename):
+                self.assertEqual(hashlib.sha256((path / filename).read_bytes()).hexdigest(), digest)
+
+    def test_tables(self):
+        path = self.export('one')
+        with open(path / 'speeches.tsv', newline='') as f:
+            rows = list(csv.DictReader(f, delimiter='\t'))
+        speeches = Speech.objects.order_by('seq', 'id')
+        self.assertEqual(len(rows), speeches.count())
+        for row, speech in zip(rows, speeches):
+            self.assertEqual(row['seq'], str(speech.seq))
+            self.assertEqual(row['speaker'], ';'.join(speech.spkr.order_by('name', 'id').values_list('name', flat=True)))
+            self.assertEqual(row['addressee'], ';'.join(speech.addr.order_by('name', 'id').values_list('name', flat=True)))
+            self.assertEqual(row['short_speech_type'], ';'.join(
+                f'{t.type}?' if t.doubt else t.type for t in speech.tags.order_by('id')))
+
+        with open(path / 'clusters.tsv', newline='') as f:
+            counts = [int(row['speech_count']) for row in csv.DictReader(f, delimiter='\t')]
+        self.assertEqual(counts, [cluster.speeches.count() for cluster in SpeechCluster.objects.order_by('seq', 'id')])
+
+    def test_queries_per_batch(self):
+        # the speeches, then each batch's speakers, addressees and tags
+        n = Speech.objects.count()
+        with mock.patch.object(export_archive, 'BATCH_SIZE', 10), self.assertNumQueries(1 + 3 * -(-n // 10)):
+            self.assertEqual(len(list(export_archive.speech_rows())), n)
+
+    def test_compress_gzip(self):
+        plain = self.export('plain')
+        packed = self.export('gzip', compress='gzip')
+        manifest = self.manifest(packed)
+        for name, header, rows in export_archive.TABLES:
+            with self.subTest(table=name):
+                data = (packed / f'{name}.tsv.gz').read_bytes()
+                self.assertEqual(gzip.decompress(data), (plain / f'{name}.tsv').read_bytes())
+                self.assertEqual(manifest[f'{name}.tsv.gz'], hashlib.sha256(data).hexdigest())
+        # the same data, the same files
+        self.assertEqual(self.manifest(self.export('again', compress='gzip')), manifest)
+
+    def delta(self, path):
+        with open(path / 'DELTA.jsonl') as f:
+            return [json.loads(line) for line in f]
+
+    def test_unchanged_export(self):
+        self.export('one')
+        out = io.StringIO()
+        call_command('export_archive', str(self.dir / 'two'), since=str(self.dir / 'one'), stdout=out)
+        self.assertEqual(self.delta(self.dir / 'two'), [])
+        self.assertEqual(out.getvalue().count(', unchanged)'), len(export_archive.TABLES))
+        for name in ('speeches.tsv', 'tags.tsv', 'hashes/speeches.tsv'):
+            self.assertEqual((self.dir / 'one' / name).read_bytes(), (self.dir / 'two' / name).read_bytes())
+        self.assertIn('DELTA.jsonl', self.manifest(self.dir / 'two'))
+
+    def test_added_changed_removed(self):
+        self.export('one')
+
+        author = Author.objects.create(name="Apollonius")
+        work = Work.objects.get(title="Iliad")
+        work.title = "Ilias"
+        work.save()
+        tag_id, speech_id = SpeechTag.objects.order_by('id').values_list('id', 'speech_id').first()
+        SpeechTag.objects.filter(pk=tag_id).delete()
+
+        delta = self.delta(self.export('two', since=str(self.dir / 'one')))
+        self.assertEqual(
+            sorted((entry['table'], entry['change'], entry['key']) for entry in delta),
+            sorted([
+                ('authors', 'added', author.pk),
+                ('works', 'changed', work.pk),
+                ('tags', 'removed', tag_id),
+                # which lists its tags
+                ('speeches', 'changed', speech_id),
+            ])
+        )
+
+        changed = {entry['table']: entry for entry in delta}
+        self.assertEqual(changed['works']['row']['title'], "Ilias")
+        self.assertEqual(changed['authors']['row']['name'], "Apollonius")
+        self.assertEqual(changed['tags']['row']['id'], str(tag_id))
+
+    def test_export_in_place(self):
+        path = self.export('one')
+        Speech.objects.filter(pk=Speech.objects.order_by('id').first().pk).update(notes="revised")
+        delta = self.delta(self.export('one', since=str(path)))
+        self.assertEqual([(entry['table'], entry['change']) for entry in delta], [('speeches', 'changed')])
+        # and against itself once more, nothing
+        self.assertEqual(self.delta(self.export('one', since=str(path))), [])
+
+    def test_since_compressed_differently(self):
+        path = self.export('one')
+        Author.objects.create(name="Apollonius")
+        delta = self.delta(self.export('one', since=str(path), compress='gzip'))
+        self.assertEqual([(entry['table'], entry['change']) for entry in delta], [('authors', 'added')])
+        self.assertFalse((path / 'authors.tsv').exists())
+        self.assertEqual(set(self.manifest(path)),
+                         {f'{name}.tsv.gz' for name, header, rows in export_archive.TABLES} | {'DELTA.jsonl'})
+
+    @skipUnless(zstd_available(), 'needs Python 3.14+ or zstandard')
+    def test_compress_zstd(self):
+        plain = self.export('plain')
+        packed = self.export('zstd', compress='zstd')
+        with export_archive.open_input(packed / 'speeches.tsv.zst', 'zstd') as f:
+            self.assertEqual(f.read().encode(), (plain / 'speeches.tsv').read_bytes())
+
+    @skipIf(zstd_available(), 'zstd is available')
+    def test_compress_zstd_unavailable(self):
+        with self.assertRaises(CommandError):
+            self.export('zstd', compress='zstd')
+        # nothing written
+        self.assertFalse((self.dir / 'zstd').exists())
+
+
+class BackupTestCase(TransactionTestCase):
+
+    def setUp(self):
+        make_corpus()
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.backups = 0
+
+    def dumpdata(self):
+        '''speechdb records as dumpdata writes them'''
+        out = io.StringIO()
+        call_command('dumpdata', 'speechdb', format='jsonl', stdout=out)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def backup(self, **options):
+        '''the manifest of a fresh backup, each a day after the last'''
+        self.backups += 1
+        with mock.patch.object(backup_db, 'time') as clock:
+            clock.strftime.return_value = f'2026-01-{self.backups:02}_03-00-00'
+            call_command('backup_db', backup_dir=str(self.dir), format='json', stdout=io.StringIO(), **options)
+        return self.dir / f'dices_fixture_2026-01-{self.backups:02}_03-00-00.manifest.json'
+
+    def stored_chunks(self):
+        return {path.name.removesuffix('.gz') for path in (self.dir / 'chunks').glob('*/*.gz')}
+
+    def test_fixture(self):
+        manifest_file = self.backup()
+        manifest = read_manifest(manifest_file)
+        with gzip.open(self.dir / manifest['file'], 'rb') as f:
+            data = f.read()
+        self.assertEqual([json.loads(line) for line in data.splitlines()], self.dumpdata())
+        self.assertEqual(manifest['sha256'], hashlib.sha256(data).hexdigest())
+        self.assertEqual(manifest['size'], len(data))
+        self.assertEqual(manifest['counts']['speechdb_speech'], Speech.objects.count())
+        self.assertEqual(manifest['counts']['speechdb_speech_spkr'], Speech.spkr.through.objects.count())
+
+    @mock.patch('speechdb.chunkstore.MIN_CHUNK_SIZE', 512)
+    @mock.patch('speechdb.chunkstore.BOUNDARY_MASK', 0x7)
+    def test_chunks_shared(self):
+        first = read_manifest(self.backup(chunked=True))
+        self.assertGreater(len(first['chunks']), 10)
+        data = b''.join(ChunkStore(self.dir / 'chunks').read(first))
+        self.assertEqual([json.loads(line) for line in data.splitlines()], self.dumpdata())
+
+        Speech.objects.filter(pk=Speech.objects.order_by('pk').values('pk')[:1]).update(notes="revised")
+        second = read_manifest(self.backup(chunked=True))
+        old = {digest for digest, size in first['chunks']}
+        new = [digest for digest, size in second['chunks'] if digest not in old]
+        self.assertTrue(new)
+        self.assertLess(len(new), len(second['chunks']) // 4)
+        self.assertEqual(self.stored_chunks(), old | set(new))
+
+    @mock.patch('speechdb.chunkstore.MIN_CHUNK_SIZE', 512)
+    @mock.patch('speechdb.chunkstore.BOUNDARY_MASK', 0x7)
+    def test_keep_last(self):
+        manifests = []
+        for notes in ("one", "two", "three"):
+            Speech.objects.filter(pk=Speech.objects.order_by('pk').values('pk')[:1]).update(notes=notes)
+            manifests.append(self.backup(chunked=True, keep_last=2))
+        self.assertFalse(manifests[0].exists())
+        kept = [read_manifest(path) for path in manifests[1:]]
+        self.assertEqual(self.stored_chunks(), {digest for manifest in kept for digest, size in manifest['chunks']})
+
+    def test_verify(self):
+        for chunked in (False, True):
+            with self.subTest(chunked=chunked):
+                manifest_file = self.backup(chunked=chunked)
+                call_command('backup_db', backup_dir=str(self.dir), verify=str(manifest_file), stdout=io.StringIO())
+
+                manifest = read_manifest(manifest_file)
+                damaged = (self.dir / 'chunks').glob('*/*.gz') if chunked else [self.dir / manifest['file']]
+                for path in damaged:
+                    with gzip.open(path, 'wb') as f:
+                        f.write(b'{}\n')
+                with self.assertRaises(CommandError):
+                    call_command('backup_db', backup_dir=str(self.dir), verify=str(manifest_file),
+                                 stdout=io.StringIO())
+
+    def restorable(self):
+        '''dumpdata's records, less the generation bookkeeping a restore
+            moves on
+        '''
+        records = []
+        for record in self.dumpdata():
+            if record['model'] == 'speechdb.metadata' and record['fields']['name'] == 'generation':
+                continue
+            if record['model'] == 'speechdb.work':
+                del record['fields']['speech_generation']
+            records.append(record)
+        return records
+
+    def restore(self, source):
+        call_command('restore_db', str(source), interactive=False, stdout=io.StringIO())
+
+    def round_trip(self, chunked):
+        expected = self.restorable()
+        manifest_file = self.backup(chunked=chunked)
+        generation = current_generation()
+
+        # change, add and remove records, to be undone
+        Work.objects.update(title="Changed")
+        Author.objects.create(name="Apollonius")
+        SpeechTag.objects.filter(pk__in=SpeechTag.objects.values('pk')[:5]).delete()
+
+        self.restore(manifest_file)
+        self.assertEqual(self.restorable(), expected)
+        self.assertGreater(current_generation(), generation)
+
+    def test_round_trip(self):
+        self.round_trip(chunked=False)
+
+    def test_round_trip_chunked(self):
+        self.round_trip(chunked=True)
+
+    def test_counts_differ(self):
+        manifest_file = self.backup()
+        manifest = read_manifest(manifest_file)
+        manifest['counts']['speechdb_speech'] += 1
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f)
+
+        Author.objects.create(name="Apollonius")
+        expected = self.dumpdata()
+        with self.assertRaises(CommandError):
+            self.restore(manifest_file)
+        self.assertEqual(self.dumpdata(), expected)
+
+    def test_damaged_backup(self):
+        manifest_file = self.backup(chunked=True)
+        chunk = max((self.dir / 'chunks').glob('*/*.gz'), key=lambda path: path.stat().st_size)
+        with gzip.open(chunk, 'wb') as f:
+            f.write(b'{}\n')
+
+        Author.objects.create(name="Apollonius")
+        expected = self.dumpdata()
+        with self.assertRaises(CommandError):
+            self.restore(manifest_file)
+        self.assertEqual(self.dumpdata(), expected)
+
+    def test_latest_in_directory(self):
+        self.backup()
+        Author.objects.create(name="Apollonius")
+        expected = self.restorable()
+        self.backup()
+        Author.objects.filter(name="Apollonius").delete()
+        self.restore(self.dir)
+        self.assertEqual(self.restorable(), expected)
+
+        call_command('export_archive', str(self.dir / 'export'), stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, "can't be restored"):
+            self.restore(self.dir / 'export')
+
+
+class CSVOutTestCase(TransactionTestCase):
+
+    def setUp(self):
+        make_corpus()
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def csv_out(self, name, *models, **options):
+        if models:
+            options['models'] = list(models)
+        call_command('csv_out', str(self.dir / name), stdout=io.StringIO(), **options)
+        return self.dir / name
+
+    def read(self, path):
+        with open(path, newline='') as f:
+            return list(csv.reader(f))
+
+    def test_tables(self):
+        path = self.csv_out('all')
+        expected = list(apps.get_app_config('speechdb').get_models(include_auto_created=True))
+        self.assertEqual({p.name for p in path.iterdir()}, {f'{model._meta.model_name}.csv' for model in expected})
+        for model in expected:
+            with self.subTest(model=model._meta.label):
+                rows = self.read(path / f'{model._meta.model_name}.csv')
+                self.assertEqual(len(rows) - 1, model.objects.count())
+
+        # the through tables, as needed to rebuild speakers and addressees
+        rows = self.read(path / 'speech_spkr.csv')
+        self.assertEqual(rows[0], ['id', 'speech', 'characterinstance'])
+        self.assertEqual(sorted((int(speech), int(inst)) for pk, speech, inst in rows[1:]),
+                         sorted(Speech.spkr.through.objects.values_list('speech_id', 'characterinstance_id')))
+
+    def test_models(self):
+        path = self.csv_out('some', 'speechdb.Author', 'speechdb.Speech')
+        self.assertEqual(sorted(p.name for p in path.iterdir()),
+                         ['author.csv', 'speech.csv', 'speech_addr.csv', 'speech_spkr.csv'])
+        with self.assertRaises(CommandError):
+            self.csv_out('none', 'speechdb.Nothing')
+
+    def test_chunks_and_workers(self):
+        whole = self.csv_out('whole')
+        chunked = self.csv_out('chunked', chunk_size=3, workers=1)
+        for path in whole.iterdir():
+            with self.subTest(table=path.name):
+                self.assertEqual((chunked / path.name).read_bytes(), path.read_bytes())
@@ -27,6 +27,7 @@ frontend_urls = ([
     path('speeches/', views.AppSpeechList.as_view(), name='speeches'),
     path('speeches/csv/', views.AppSpeechCSV.as_view(), name='speeches_csv'),
     path('speech/<str:public_id>/', views.AppSpeechDetail.as_view(), name="speech_detail"),
+    path('autocomplete/<str:field>/', views.AppAutocomplete.as_view(), name='autocomplete'),
 ], 'app')
 
 api_urls = ([
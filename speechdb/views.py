@@ -1,18 +1,35 @@
-from django.http import HttpResponse, HttpResponseRedirect
+from django.conf import settings
+from django.http import HttpResponseRedirect, JsonResponse, Http404
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse, reverse_lazy
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Max
+from django.db.models import Q, Count, Max, Prefetch, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.views.generic import ListView, DetailView, TemplateView, View
 from django.views.decorators.cache import cache_page
 from django_filters.views import FilterView
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from django_filters import rest_framework as filters
+from django_filters.constants import EMPTY_VALUES
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from .models import Metadata
-from .models import Author, Work, Character, CharacterInstance, Speech, SpeechCluster, SpeechTag
+from .models import Author, Work, Character, CharacterInstance, Speech, SpeechCluster, SpeechTag, SpeechSearchRow
 from .serializers import MetadataSerializer
 from .serializers import AuthorSerializer, WorkSerializer, CharacterSerializer, CharacterInstanceSerializer, SpeechSerializer, SpeechClusterSerializer
-from .forms import InstanceForm, CharacterForm, TextForm, SpeechForm, PagerForm
+from .serializers import SpeechDetailSerializer, INTERNAL_FIELDS
+from .forms import InstanceForm, CharacterForm, TextForm, SpeechForm, PagerForm, LocusField, show_facet_counts
+from .facets import facet_counts
+from .query import compile_speech_filters, locus_q
+from .query import SPEECH_PROPERTY_PARAMS, SPEECH_KEYSET
+from .pagination import KeysetPaginationMixin
+from .results import CachedResultsMixin
+from .export import CSVExportMixin
+from .prefetch import PrefetchPlanMixin
+from .bitmap import get_index
+from .generation import current_generation
+from .intervals import surrounding
+from .autocomplete import SOURCES as AUTOCOMPLETE_SOURCES, suggest
 import csv
 import re
 import os
@@ -90,7 +107,7 @@ class WorkFilter(filters.FilterSet):
     
     class Meta:
         model = Work
-        exclude = []
+        exclude = INTERNAL_FIELDS[Work]
 
 
 class CharacterFilter(filters.FilterSet):
@@ -173,61 +190,183 @@ class CharacterInstanceFilter(filters.FilterSet):
         exclude = ['tags']
 
 
+class ParticipantFilterMixin:
+    '''match speeches on an attribute of a speaker or addressee
+        - field_name is a column of the flattened SpeechSearchRow table
+        - role None matches a participant in either role
+        - link is the row's column holding the filtered model's key:
+          'speech', or 'cluster' for clusters
+        - each filter is one indexed subquery of ids, so the list never
+          fans out and needs no distinct()
+    '''
+
+    def __init__(self, field_name=None, role=None, link='speech', **kwargs):
+        super().__init__(field_name, **kwargs)
+        self.role = role
+        self.link = link
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        rows = SpeechSearchRow.objects.filter(
+                    **{f'{self.field_name}__{self.lookup_expr}': value})
+        if self.role is not None:
+            rows = rows.filter(role=self.role)
+        return qs.filter(pk__in=rows.values(self.link))
+
+
+class ParticipantCharFilter(ParticipantFilterMixin, filters.CharFilter):
+    pass
+
+
+@extend_schema_field(OpenApiTypes.INT)
+class ParticipantNumberFilter(ParticipantFilterMixin, filters.NumberFilter):
+    pass
+
+
+class ParticipantChoiceFilter(ParticipantFilterMixin, filters.ChoiceFilter):
+    pass
+
+
+class ParticipantBooleanFilter(ParticipantFilterMixin, filters.BooleanFilter):
+    pass
+
+
+class LocusFilter(filters.CharFilter):
+    '''bound a speech's line range, on the parsed locus columns
+        - end is "fi" (first line) or "la" (last line); lookup_expr is
+          "lte" or "gte"; see query.locus_q
+    '''
+    field_class = LocusField
+
+    def __init__(self, end=None, **kwargs):
+        super().__init__(f'{end}_book', **kwargs)
+        self.end = end
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return qs.filter(locus_q(self.end, self.lookup_expr, value))
+
+
+class SurroundingFilter(filters.CharFilter):
+    '''speeches that include a line, from the per-work interval indexes'''
+    field_class = LocusField
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return qs.filter(pk__in=surrounding(value))
+
+
+class EmbeddingFilterMixin:
+    '''match speeches by their place in the embedded_in hierarchy
+        - param is the search parameter (query.SPEECH_PROPERTY_PARAMS) to
+          apply; each is one subquery on the SpeechEmbedding closure table
+    '''
+
+    def __init__(self, param=None, **kwargs):
+        super().__init__(**kwargs)
+        self.param = param
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        group, lookup = SPEECH_PROPERTY_PARAMS[self.param]
+        return qs.filter(lookup([value]))
+
+
+class EmbeddingCharFilter(EmbeddingFilterMixin, filters.CharFilter):
+    pass
+
+
+@extend_schema_field(OpenApiTypes.INT)
+class EmbeddingNumberFilter(EmbeddingFilterMixin, filters.NumberFilter):
+    pass
+
+
 class SpeechFilter(filters.FilterSet):
-    spkr_id = filters.NumberFilter('spkr__char__id')
-    spkr_name = filters.CharFilter('spkr__char__name')
-    spkr_manto = filters.CharFilter('spkr__char__manto')
-    spkr_wd = filters.CharFilter('spkr__char__wd')
-    spkr_tt = filters.CharFilter('spkr__char__tt')    
-    spkr_gender = filters.ChoiceFilter('spkr__char__gender', distinct=True,
+    any_id = ParticipantNumberFilter('char_id')
+    any_name = ParticipantCharFilter('char_name')
+    any_manto = ParticipantCharFilter('char_manto')
+    any_wd = ParticipantCharFilter('char_wd')
+    any_tt = ParticipantCharFilter('char_tt')
+    any_gender = ParticipantChoiceFilter('char_gender',
+                    choices=Character.CharacterGender.choices)
+    any_number = ParticipantChoiceFilter('char_number',
+                    choices=Character.CharacterNumber.choices)
+    any_being = ParticipantChoiceFilter('char_being',
+                    choices=Character.CharacterBeing.choices)
+
+    any_inst_id = ParticipantNumberFilter('inst_id')
+    any_inst_name = ParticipantCharFilter('inst_name')
+    any_inst_gender = ParticipantChoiceFilter('inst_gender',
+                    choices=Character.CharacterGender.choices)
+    any_inst_number = ParticipantChoiceFilter('inst_number',
+                    choices=Character.CharacterNumber.choices)
+    any_inst_being = ParticipantChoiceFilter('inst_being',
+                    choices=Character.CharacterBeing.choices)
+    any_anon = ParticipantBooleanFilter('inst_anon')
+
+    spkr_id = ParticipantNumberFilter('char_id', role='spkr')
+    spkr_name = ParticipantCharFilter('char_name', role='spkr')
+    spkr_manto = ParticipantCharFilter('char_manto', role='spkr')
+    spkr_wd = ParticipantCharFilter('char_wd', role='spkr')
+    spkr_tt = ParticipantCharFilter('char_tt', role='spkr')
+    spkr_gender = ParticipantChoiceFilter('char_gender', role='spkr',
                     choices=Character.CharacterGender.choices)
-    spkr_number = filters.ChoiceFilter('spkr__char__number', distinct=True,
+    spkr_number = ParticipantChoiceFilter('char_number', role='spkr',
                     choices=Character.CharacterNumber.choices)
-    spkr_being = filters.ChoiceFilter('spkr__char__being', distinct=True,
+    spkr_being = ParticipantChoiceFilter('char_being', role='spkr',
                     choices=Character.CharacterBeing.choices)
 
-    spkr_inst_id = filters.NumberFilter('spkr__id')
-    spkr_inst_name = filters.CharFilter('spkr__name', distinct=True)
-    spkr_inst_gender = filters.ChoiceFilter('spkr__gender', distinct=True,
+    spkr_inst_id = ParticipantNumberFilter('inst_id', role='spkr')
+    spkr_inst_name = ParticipantCharFilter('inst_name', role='spkr')
+    spkr_inst_gender = ParticipantChoiceFilter('inst_gender', role='spkr',
                     choices=Character.CharacterGender.choices)
-    spkr_inst_number = filters.ChoiceFilter('spkr__number', distinct=True,
+    spkr_inst_number = ParticipantChoiceFilter('inst_number', role='spkr',
                     choices=Character.CharacterNumber.choices)
-    spkr_inst_being = filters.ChoiceFilter('spkr__being', distinct=True,
+    spkr_inst_being = ParticipantChoiceFilter('inst_being', role='spkr',
                     choices=Character.CharacterBeing.choices)
-    spkr_anon = filters.BooleanFilter('spkr__anon', distinct=True)
+    spkr_anon = ParticipantBooleanFilter('inst_anon', role='spkr')
     
-    addr_id = filters.NumberFilter('addr__char__id')
-    addr_name = filters.CharFilter('addr__char__name')
-    addr_manto = filters.CharFilter('addr__char__manto')
-    addr_wd = filters.CharFilter('addr__char__wd')
-    addr_tt = filters.CharFilter('addr__char__tt')    
-    addr_gender = filters.ChoiceFilter('addr__char__gender', distinct=True,
+    addr_id = ParticipantNumberFilter('char_id', role='addr')
+    addr_name = ParticipantCharFilter('char_name', role='addr')
+    addr_manto = ParticipantCharFilter('char_manto', role='addr')
+    addr_wd = ParticipantCharFilter('char_wd', role='addr')
+    addr_tt = ParticipantCharFilter('char_tt', role='addr')
+    addr_gender = ParticipantChoiceFilter('char_gender', role='addr',
                     choices=Character.CharacterGender.choices)
-    addr_number = filters.ChoiceFilter('addr__char__number', distinct=True,
+    addr_number = ParticipantChoiceFilter('char_number', role='addr',
                     choices=Character.CharacterNumber.choices)
-    addr_being = filters.ChoiceFilter('addr__char__being', distinct=True,
+    addr_being = ParticipantChoiceFilter('char_being', role='addr',
                     choices=Character.CharacterBeing.choices)
-                    
-    addr_inst_id = filters.NumberFilter('addr__id')
-    addr_inst_name = filters.CharFilter('addr__name', distinct=True)
-    addr_inst_gender = filters.ChoiceFilter('addr__gender', distinct=True,
+
+    addr_inst_id = ParticipantNumberFilter('inst_id', role='addr')
+    addr_inst_name = ParticipantCharFilter('inst_name', role='addr')
+    addr_inst_gender = ParticipantChoiceFilter('inst_gender', role='addr',
                     choices=Character.CharacterGender.choices)
-    addr_inst_number = filters.ChoiceFilter('addr__number', distinct=True,
+    addr_inst_number = ParticipantChoiceFilter('inst_number', role='addr',
                     choices=Character.CharacterNumber.choices)
-    addr_inst_being = filters.ChoiceFilter('addr__being', distinct=True,
+    addr_inst_being = ParticipantChoiceFilter('inst_being', role='addr',
                     choices=Character.CharacterBeing.choices)
-    addr_anon = filters.BooleanFilter('addr__anon', distinct=True)
+    addr_anon = ParticipantBooleanFilter('inst_anon', role='addr')
     
     type = filters.ChoiceFilter('type', choices=Speech.SpeechType.choices)
     tags = filters.ChoiceFilter('tags__type', choices=SpeechTag.TagType.choices)
 
     cluster_id = filters.NumberFilter('cluster__id')
+    n_lines_min = filters.NumberFilter('n_lines', lookup_expr='gte')
+    n_lines_max = filters.NumberFilter('n_lines', lookup_expr='lte')
+    within_id = EmbeddingNumberFilter('within_id')
+    root_spkr_name = EmbeddingCharFilter('root_spkr_name')
     
     work_id = filters.NumberFilter('work__id')
     work_title = filters.CharFilter('work__title')
     work_urn = filters.CharFilter('work__urn')
     work_wd = filters.CharFilter('work__wd')
     work_lang = filters.ChoiceFilter('work__lang', choices=Work.Language.choices)
+    at = SurroundingFilter()
     
     author_id = filters.NumberFilter('work__author__id')
     author_name = filters.CharFilter('work__author__name')
@@ -236,7 +375,11 @@ class SpeechFilter(filters.FilterSet):
         
     class Meta:
         model = Speech
-        exclude = []
+        exclude = INTERNAL_FIELDS[Speech]
+
+# overlapping line range; "from" and "to" can't be declared in the class body
+SpeechFilter.base_filters['from'] = LocusFilter('la', lookup_expr='gte')
+SpeechFilter.base_filters['to'] = LocusFilter('fi', lookup_expr='lte')
 
 
 class SpeechClusterFilter(filters.FilterSet):
@@ -251,6 +394,28 @@ class SpeechClusterFilter(filters.FilterSet):
     author_wd = filters.CharFilter('speeches__work__author__wd', distinct=True)
     author_urn = filters.CharFilter('speeches__work__author__urn', distinct=True)
 
+    any_id = ParticipantNumberFilter('char_id', link='cluster')
+    any_name = ParticipantCharFilter('char_name', link='cluster')
+    any_manto = ParticipantCharFilter('char_manto', link='cluster')
+    any_wd = ParticipantCharFilter('char_wd', link='cluster')
+    any_tt = ParticipantCharFilter('char_tt', link='cluster')
+    any_gender = ParticipantChoiceFilter('char_gender', link='cluster',
+                    choices=Character.CharacterGender.choices)
+    any_number = ParticipantChoiceFilter('char_number', link='cluster',
+                    choices=Character.CharacterNumber.choices)
+    any_being = ParticipantChoiceFilter('char_being', link='cluster',
+                    choices=Character.CharacterBeing.choices)
+
+    any_inst_id = ParticipantNumberFilter('inst_id', link='cluster')
+    any_inst_name = ParticipantCharFilter('inst_name', link='cluster')
+    any_inst_gender = ParticipantChoiceFilter('inst_gender', link='cluster',
+                    choices=Character.CharacterGender.choices)
+    any_inst_number = ParticipantChoiceFilter('inst_number', link='cluster',
+                    choices=Character.CharacterNumber.choices)
+    any_inst_being = ParticipantChoiceFilter('inst_being', link='cluster',
+                    choices=Character.CharacterBeing.choices)
+    any_anon = ParticipantBooleanFilter('inst_anon', link='cluster')
+
     spkr_id = filters.NumberFilter('speeches__spkr__char__id', distinct=True)
     spkr_name = filters.CharFilter('speeches__spkr__char__name', distinct=True)
     spkr_manto = filters.CharFilter('speeches__spkr__char__manto', distinct=True)
@@ -304,83 +469,103 @@ class SpeechClusterFilter(filters.FilterSet):
 # API class-based views
 #
 
-class MetadataList(ListAPIView):
+class SerializerOptionsMixin:
+    '''per-request serializer options from the query string
+        - fields=id,work.title: only these fields, dotted paths reaching
+          into nested objects
+        - depth=n: nest related objects n levels deep
+        - expand=work.author: nest these relations whatever the depth
+        - min=1: ids only
+        - passed to each serializer instance, never stored on its class,
+          so concurrent requests can't see each other's choices
+    '''
+
+    max_depth = 10
+
+    def get_serializer(self, *args, **kwargs):
+        params = self.request.query_params if self.request else {}
+        if params.get('min'):
+            kwargs['fields'] = ['id']
+        elif params.get('fields'):
+            kwargs['fields'] = params['fields']
+        if re.fullmatch(r'\d+', params.get('depth', '')):
+            kwargs['depth'] = min(int(params['depth']), self.max_depth)
+        if params.get('expand'):
+            kwargs['expand'] = params['expand']
+        return super().get_serializer(*args, **kwargs)
+
+
+class MetadataList(SerializerOptionsMixin, PrefetchPlanMixin, ListAPIView):
     queryset = Metadata.objects.all()
     serializer_class = MetadataSerializer
     filterset_class = MetadataFilter
 
-class AuthorList(ListAPIView):
+class AuthorList(SerializerOptionsMixin, PrefetchPlanMixin, ListAPIView):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
     filterset_class = AuthorFilter
 
 
-class AuthorDetail(RetrieveAPIView):
+class AuthorDetail(SerializerOptionsMixin, PrefetchPlanMixin, RetrieveAPIView):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
 
 
-class WorkList(ListAPIView):
+class WorkList(SerializerOptionsMixin, PrefetchPlanMixin, ListAPIView):
     queryset = Work.objects.all()
     serializer_class = WorkSerializer
     filterset_class = WorkFilter
 
 
-class WorkDetail(RetrieveAPIView):
+class WorkDetail(SerializerOptionsMixin, PrefetchPlanMixin, RetrieveAPIView):
     queryset = Work.objects.all()
     serializer_class = WorkSerializer
 
 
-class CharacterList(ListAPIView):
+class CharacterList(SerializerOptionsMixin, PrefetchPlanMixin, ListAPIView):
     queryset = Character.objects.all()
     serializer_class = CharacterSerializer
     filterset_class = CharacterFilter
+    keyset = ('name', 'id')
 
 
-class CharacterDetail(RetrieveAPIView):
+class CharacterDetail(SerializerOptionsMixin, PrefetchPlanMixin, RetrieveAPIView):
     queryset = Character.objects.all()
     serializer_class = CharacterSerializer
 
 
-class CharacterInstanceList(ListAPIView):
+class CharacterInstanceList(SerializerOptionsMixin, PrefetchPlanMixin, ListAPIView):
     queryset = CharacterInstance.objects.all()
     serializer_class = CharacterInstanceSerializer
     filterset_class = CharacterInstanceFilter
+    keyset = ('name', 'id')
 
 
-class CharacterInstanceDetail(RetrieveAPIView):
+class CharacterInstanceDetail(SerializerOptionsMixin, PrefetchPlanMixin, RetrieveAPIView):
     queryset = CharacterInstance.objects.all()
     serializer_class = CharacterInstanceSerializer
 
 
-class SpeechList(ListAPIView):
+class SpeechList(SerializerOptionsMixin, PrefetchPlanMixin, ListAPIView):
     queryset = Speech.objects.all()
     serializer_class = SpeechSerializer
     filterset_class = SpeechFilter        
-    
-    def get_serializer(self, *args, **kwargs):
-        if self.request.query_params.get('min'):
-            kwargs['fields'] = ['id']
-        if 'depth' in self.request.query_params:
-            depth = self.request.query_params['depth']
-            m = re.fullmatch(r'\d+', depth)
-            if m:
-                kwargs['depth'] = int(depth)
-        return super().get_serializer(*args, **kwargs)
+    keyset = SPEECH_KEYSET
 
 
-class SpeechDetail(RetrieveAPIView):
+class SpeechDetail(SerializerOptionsMixin, PrefetchPlanMixin, RetrieveAPIView):
     queryset = Speech.objects.all()
-    serializer_class = SpeechSerializer
+    serializer_class = SpeechDetailSerializer
 
 
-class SpeechClusterList(ListAPIView):
+class SpeechClusterList(SerializerOptionsMixin, PrefetchPlanMixin, ListAPIView):
     queryset = SpeechCluster.objects.all()
     serializer_class = SpeechClusterSerializer
     filterset_class = SpeechClusterFilter    
+    keyset = ('seq', 'id')
 
 
-class SpeechClusterDetail(RetrieveAPIView):
+class SpeechClusterDetail(SerializerOptionsMixin, PrefetchPlanMixin, RetrieveAPIView):
     queryset = SpeechCluster.objects.all()
     serializer_class = SpeechClusterSerializer
     
@@ -388,6 +573,28 @@ class SpeechClusterDetail(RetrieveAPIView):
 # Web frontend class-based views
 #
 
+class AppAutocomplete(View):
+    '''name suggestions for the search form dropdowns, as select2 expects
+        them: ?term=<typed text>&page=<n>
+    '''
+
+    page_size = 30
+
+    def get(self, request, field):
+        if field not in AUTOCOMPLETE_SOURCES:
+            raise Http404(f"No suggestions for {field}")
+        try:
+            page = max(int(request.GET.get("page", 1)), 1)
+        except ValueError:
+            page = 1
+        values, more = suggest(field, request.GET.get("term", ""),
+                               offset=(page - 1) * self.page_size, limit=self.page_size)
+        return JsonResponse({
+            "results": [{"id": value, "text": value} for value in values],
+            "pagination": {"more": more},
+        })
+
+
 class AppMetadataList(ListView):
     model = Metadata
     template_name = 'speechdb/metadata_list.html'
@@ -454,7 +661,7 @@ class AppAuthorList(AuthorQueryMixin, ListView):
         return context
 
 
-class AppAuthorCSV(AuthorQueryMixin, View):
+class AppAuthorCSV(AuthorQueryMixin, CSVExportMixin, View):
     filename = "authors.csv"
 
     fields = [
@@ -463,21 +670,9 @@ class AppAuthorCSV(AuthorQueryMixin, View):
         ("works", lambda a: a.work_count),
     ]
 
-    def get(self, request):
-        qs = self.get_queryset()
-
-        response = HttpResponse(
-            content_type="text/csv",
-            headers={"Content-Disposition": f'attachment; filename="{self.filename}"'},
-        )
-
-        writer = csv.writer(response)
-        writer.writerow([label for label, _ in self.fields])
-
-        for author in qs:
-            writer.writerow([accessor(author) for _, accessor in self.fields])
-
-        return response
+    def get_export_objects(self):
+        # a handful of rows, with counts worked out by get_queryset()
+        return self.get_queryset()
 
 
 class WorkQueryMixin:
@@ -529,7 +724,7 @@ class WorkQueryMixin:
             query.append(Q(lang__in=params["work_lang"]))
 
         # perform query
-        qs = Work.objects.filter(*query).distinct().order_by('author', 'title')
+        qs = Work.objects.filter(*query).distinct().order_by('author', 'title').select_related('author')
 
         # annotate results
         qs = qs.annotate(
@@ -556,7 +751,7 @@ class AppWorkList(WorkQueryMixin, ListView):
         return context
 
 
-class AppWorkCSV(WorkQueryMixin, View):
+class AppWorkCSV(WorkQueryMixin, CSVExportMixin, View):
     filename = "works.csv"
 
     fields = [
@@ -567,27 +762,13 @@ class AppWorkCSV(WorkQueryMixin, View):
         ("speakers", lambda w: w.speech__spkr__count),
     ]
 
-    def get(self, request):
-        qs = self.get_queryset()
-
-        response = HttpResponse(
-            content_type="text/csv",
-            headers={"Content-Disposition": f'attachment; filename="{self.filename}"'},
-        )
-
-        writer = csv.writer(response)
-        writer.writerow([label for label, _ in self.fields])
-
-        for work in qs:
-            writer.writerow([accessor(work) for _, accessor in self.fields])
-
-        return response
 
-
-class CharacterQueryMixin:
+class CharacterQueryMixin(CachedResultsMixin):
     '''validate and assemble character query params
         - designed to be reused by HTML and CSV views
     '''
+    result_name = "characters"
+    keyset = ("name", "id")
         
     @property
     def params(self):
@@ -690,7 +871,7 @@ class CharacterQueryMixin:
         return qs
 
 
-class AppCharacterList(CharacterQueryMixin, ListView):
+class AppCharacterList(KeysetPaginationMixin, CharacterQueryMixin, ListView):
     model = Character
     template_name = 'speechdb/character_list.html'
 
@@ -707,7 +888,7 @@ class AppCharacterList(CharacterQueryMixin, ListView):
         return context
 
 
-class AppCharacterCSV(CharacterQueryMixin, View):
+class AppCharacterCSV(CharacterQueryMixin, CSVExportMixin, View):
     filename = "characters.csv"
 
     fields = [
@@ -722,27 +903,13 @@ class AppCharacterCSV(CharacterQueryMixin, View):
         ("topostext", lambda c: c.tt),
     ]
 
-    def get(self, request):
-        qs = self.get_queryset()
-
-        response = HttpResponse(
-            content_type="text/csv",
-            headers={"Content-Disposition": f'attachment; filename="{self.filename}"'},
-        )
-
-        writer = csv.writer(response)
-        writer.writerow([label for label, _ in self.fields])
 
-        for c in qs:
-            writer.writerow([accessor(c) for _, accessor in self.fields])
-
-        return response
-
-
-class CharacterInstanceQueryMixin:
+class CharacterInstanceQueryMixin(CachedResultsMixin):
     '''validate and assemble character query params
         - designed to be reused by HTML and CSV views
     '''
+    result_name = "instances"
+    keyset = ("name", "id")
         
     @property
     def params(self):
@@ -917,7 +1084,7 @@ class CharacterInstanceQueryMixin:
             query.append(q)
         
         # perform query
-        qs = CharacterInstance.objects.filter(*query).order_by('name')
+        qs = CharacterInstance.objects.filter(*query).order_by('name').select_related('char')
         
         # calculate some useful counts
         qs = qs.annotate(
@@ -928,7 +1095,7 @@ class CharacterInstanceQueryMixin:
         return qs
 
 
-class AppCharacterInstanceList(CharacterInstanceQueryMixin, ListView):
+class AppCharacterInstanceList(KeysetPaginationMixin, CharacterInstanceQueryMixin, ListView):
     model = CharacterInstance
     template_name = 'speechdb/characterinstance_list.html'
 
@@ -947,7 +1114,7 @@ class AppCharacterInstanceList(CharacterInstanceQueryMixin, ListView):
         return context
 
 
-class AppCharacterInstanceCSV(CharacterInstanceQueryMixin, View):
+class AppCharacterInstanceCSV(CharacterInstanceQueryMixin, CSVExportMixin, View):
     '''export character instance list as a CSV text file'''
 
     filename = "instances.csv"
@@ -960,28 +1127,14 @@ class AppCharacterInstanceCSV(CharacterInstanceQueryMixin, View):
         ("speeches", lambda inst: inst.speeches__count),
         ("addresses", lambda inst: inst.addresses__count),
     ]
-
-    def get(self, request):
-        qs = self.get_queryset()
-
-        response = HttpResponse(
-            content_type="text/csv",
-            headers={"Content-Disposition": f'attachment; filename="{self.filename}"'},
-        )
-
-        writer = csv.writer(response)
-        writer.writerow([label for label, _ in self.fields])
-
-        for inst in qs:
-            writer.writerow([accessor(inst) for _, accessor in self.fields])
-
-        return response
         
 
-class SpeechQueryMixin:
+class SpeechQueryMixin(CachedResultsMixin):
     '''validate and assemble speech query params
         - designed to be reused by HTML and CSV views
     '''
+    result_name = "speeches"
+    keyset = SPEECH_KEYSET
         
     @property
     def params(self):
@@ -1000,398 +1153,65 @@ class SpeechQueryMixin:
         if params is None:
             return Speech.objects.none()
                             
-        # initial set of objects plus annotations
-        qs = Speech.objects.annotate(cluster_size = Count('cluster__speeches'))
-        
-        # construct query
-        query = []
-        
-        #
-        # speaker properties
-        # 
-        
-        # speaker character primary key (old id)
-        if "spkr_char_id" in params:
-            q = Q()
-            for pk in params["spkr_char_id"]:
-                q |= Q(spkr__char__pk=pk)
-            query.append(q)
-
-        # speaker character public id
-        if "spkr_char_pubid" in params:
-            q = Q()
-            for pubid in params["spkr_char_pubid"]:
-                q |= Q(spkr__char__public_id=pubid)
-            query.append(q)
-
-        # speaker character name
-        if "spkr_char_name" in params:
-            q = Q()
-            for name in params["spkr_char_name"]:
-                q |= Q(spkr__char__name=name)
-            query.append(q)
-            
-        # speaker character being
-        if "spkr_char_being" in params:
-            q = Q()
-            for being in params["spkr_char_being"]:
-                q |= Q(spkr__char__being=being)
-            query.append(q)
-
-        # speaker character gender
-        if "spkr_char_gender" in params:
-            q = Q()
-            for gender in params["spkr_char_gender"]:
-                q |= Q(spkr__char__gender=gender)
-            query.append(q)
-            
-        # speaker character number
-        if "spkr_char_number" in params:
-            q = Q()
-            for number in params["spkr_char_number"]:
-                q |= Q(spkr__char__number=number)
-            query.append(q)
-            
-        # speaker manto
-        if "spkr_char_manto" in params:
-            q = Q()
-            for manto in params["spkr_char_manto"]:
-                q |= Q(spkr__char__manto=manto)
-            query.append(q)
-
-        # speaker wikidata
-        if "spkr_char_wd" in params:
-            q = Q()
-            for wd in params["spkr_char_wd"]:
-                q |= Q(spkr__char__wd=wd)
-            query.append(q)
-
-        # speaker topostext
-        if "spkr_char_tt" in params:
-            q = Q()
-            for tt in params["spkr_char_tt"]:
-                q |= Q(spkr__char__tt=tt)
-            query.append(q)
-            
-        # speaker instance primary key (old id)
-        if "spkr_inst_id" in params:
-            q = Q()
-            for pk in params["spkr_inst_id"]:
-                q |= Q(spkr__pk=pk)
-            query.append(q)
-
-        # speaker instance public id
-        if "spkr_inst_pubid" in params:
-            q = Q()
-            for pk in params["spkr_inst_pubid"]:
-                q |= Q(spkr__public_id=pubid)
-            query.append(q)
+        # initial set of objects
+        qs = Speech.objects.all()
         
-        # speaker instance name
-        if "spkr_inst_name" in params:
-            q = Q()
-            for name in params["spkr_inst_name"]:
-                q |= Q(spkr__name=name) | Q(spkr__display=name, spkr__anon=True)
-            query.append(q)
-            
-        # speaker instance being
-        if "spkr_inst_being" in params:
-            q = Q()
-            for being in params["spkr_inst_being"]:
-                q |= Q(spkr__being=being)
-            query.append(q)
-
-        # speaker instance gender
-        if "spkr_inst_gender" in params:
-            q = Q()
-            for gender in params["spkr_inst_gender"]:
-                q |= Q(spkr__gender=gender)
-            query.append(q)
-
-        # speaker instance number
-        if "spkr_inst_number" in params:
-            q = Q()
-            for number in params["spkr_inst_number"]:
-                q |= Q(spkr__number=number)
-            query.append(q)
-            
-        # speaker instance anonymous
-        if "spkr_inst_anon" in params:
-            q = Q()
-            for anon in params["spkr_inst_anon"]:
-                q |= Q(spkr__anon=anon)
-            query.append(q)
-        
-        # speaker instance changed state
-        if "spkr_inst_changed" in params:
-            q = Q()
-            for changed in params["spkr_inst_changed"]:
-                q |= Q(spkr__changed=changed)
-            query.append(q)
-
-
-        #
-        # addressee properties
-        #
-                    
-        # addressee character primary key (old id)
-        if "addr_char_id" in params:
-            q = Q()
-            for pk in params["addr_char_id"]:
-                q |= Q(addr__char__pk=pk)
-            query.append(q)
-
-        # addressee character public id
-        if "addr_char_pubid" in params:
-            q = Q()
-            for pubid in params["addr_char_pubid"]:
-                q |= Q(addr__char__public_id=pubid)
-            query.append(q)
-
-        # addressee character name
-        if "addr_char_name" in params:
-            q = Q()
-            for name in params["addr_char_name"]:
-                q |= Q(addr__char__name=name)
-            query.append(q)
-            
-        # addressee character being
-        if "addr_char_being" in params:
-            q = Q()
-            for being in params["addr_char_being"]:
-                q |= Q(addr__char__being=being)
-            query.append(q)
-
-        # addressee character gender
-        if "addr_char_gender" in params:
-            q = Q()
-            for gender in params["addr_char_gender"]:
-                q |= Q(addr__char__gender=gender)
-            query.append(q)
-            
-        # addressee character number
-        if "addr_char_number" in params:
-            q = Q()
-            for number in params["addr_char_number"]:
-                q |= Q(addr__char__number=number)
-            query.append(q)
-            
-        # addressee manto
-        if "addr_char_manto" in params:
-            q = Q()
-            for manto in params["addr_char_manto"]:
-                q |= Q(addr__char__manto=manto)
-            query.append(q)
-
-        # addressee wikidata
-        if "addr_char_wd" in params:
-            q = Q()
-            for wd in params["addr_char_wd"]:
-                q |= Q(addr__char__wd=wd)
-            query.append(q)
-
-        # addressee topostext
-        if "addr_char_tt" in params:
-            q = Q()
-            for tt in params["addr_char_tt"]:
-                q |= Q(addr__char__tt=tt)
-            query.append(q)
-            
-        # addressee instance primary key (old id)
-        if "addr_inst_id" in params:
-            q = Q()
-            for pk in params["addr_inst_id"]:
-                q |= Q(addr__pk=pk)
-            query.append(q)
-
-        # addressee instance public id
-        if "addr_inst_pubid" in params:
-            q = Q()
-            for pubid in params["addr_inst_pubid"]:
-                q |= Q(addr__public_id=pubid)
-            query.append(q)
-        
-        # addressee instance name
-        if "addr_inst_name" in params:
-            q = Q()
-            for name in params["addr_inst_name"]:
-                q |= Q(addr__name=name) | Q(addr__display=name, addr__anon=True)
-            query.append(q)
-
-        # addressee instance being
-        if "addr_inst_being" in params:
-            q = Q()
-            for being in params["addr_inst_being"]:
-                q |= Q(addr__being=being)
-            query.append(q)
-
-        # addressee instance gender
-        if "addr_inst_gender" in params:
-            q = Q()
-            for gender in params["addr_inst_gender"]:
-                q |= Q(addr__gender=gender)
-            query.append(q)
-
-        # addressee instance number
-        if "addr_inst_number" in params:
-            q = Q()
-            for number in params["addr_inst_number"]:
-                q |= Q(addr__number=number)
-            query.append(q)
-        
-        # addressee instance anonymous
-        if "addr_inst_anon" in params:
-            q = Q()
-            for anon in params["addr_inst_anon"]:
-                q |= Q(addr__anon=anon)
-            query.append(q)
-        
-        # addressee disguised
-        if "addr_inst_disguised" in params:
-            q = Q()
-            for disg in params["addr_inst_disguised"]:
-                if disg.lower() == "true":
-                    q |= ~Q(addr__disguise="")
-                elif disg.lower() == "false":
-                    q |= Q(addr__disguise="")
-            query.append(q)
-
-        # addressee instance changed state
-        if "addr_inst_changed" in params:
-            q = Q()
-            for changed in params["addr_inst_changed"]:
-                q |= Q(addr__changed=changed)
-            query.append(q)
-                     
-        #
-        # speech properties
-        # 
-
-        # cluster primary key (old id)
-        if "cluster_id" in params:
-            q = Q()
-            for pk in params["cluster_id"]:
-                q |= Q(cluster__pk=pk)
-            query.append(q)
-
-        # cluster public id
-        if "cluster_pubid" in params:
-            q = Q()
-            for pubid in params["cluster_pubid"]:
-                q |= Q(cluster__public_id=pubid)
-            query.append(q)
-        
-        # cluster type
-        if "type" in params:
-            q = Q()
-            for type_ in params["type"]:
-                q |= Q(type=type_)
-            query.append(q)
-        
-        # cluster part
-        if "part" in params:
-            q = Q()
-            for part in params["part"]:
-                q |= Q(part=part)
-            query.append(q)
-        
-        # total parts in cluster
-        if "n_parts" in params:
-            q = Q()
-            for n in params["n_parts"]:
-                q |= Q(cluster_size=n)
-            query.append(q)
-
-        # embedded level
-        if "level" in params:
-            q = Q()
-            for level in params["level"]:
-                q |= Q(level=level)
-            query.append(q)
-            
-        # speech tags
-        if "tags" in params:
-            q = Q()
-            for tag in params["tags"]:
-                q |= Q(tags__type=tag)
-            query.append(q)
-        
-        #
-        # work properties
-        #
-        
-        # work primary key (old id)
-        if "work_id" in params:
-            q = Q()
-            for pk in params["work_id"]:
-                q |= Q(work__pk=pk)
-            query.append(q)
-
-        # work public id
-        if "work_pubid" in params:
-            q = Q()
-            for pubid in params["work_pubid"]:
-                q |= Q(work__public_id=pubid)
-            query.append(q)
-        
-        # work title
-        if "work_title" in params:
-            q = Q()
-            for title in params["work_title"]:
-                q |= Q(work__title=title)
-            query.append(q)
-            
-        # author primary key (old id)
-        if "auth_id" in params:
-            q = Q()
-            for pk in params["auth_id"]:
-                q |= Q(work__author__pk=pk)
-            query.append(q)
-
-        # author public id
-        if "auth_pubid" in params:
-            q = Q()
-            for pubid in params["auth_pubic"]:
-                q |= Q(work__author__public_id=pubid)
-            query.append(q)
-            
-        # author name
-        if "author_name" in params:
-            q = Q()
-            for name in params["author_name"]:
-                q |= Q(work__author__name=name)
-            query.append(q)
-            
-        # language
-        if "work_lang" in params:
-            q = Q()
-            for lang in params["work_lang"]:
-                q |= Q(work__lang=lang)
-            query.append(q)
-
-        # execute query
-        qs = qs.filter(*query).distinct().order_by("work", "seq")
+        # execute query: each participant or tag group compiles to one
+        #   uncorrelated subquery of speech ids, participants from the
+        #   search table, so there are no fan-out joins and no need for
+        #   distinct() (bench_speech_query compares the plans)
+        qs = qs.filter(*compile_speech_filters(params)).order_by(*SPEECH_KEYSET)
         
         # prefetch related data to avoid unnecessary queries
         qs = qs.select_related(
             "work", "work__author", "cluster"
         ).prefetch_related(
-            "spkr", "addr", "tags",
+            Prefetch("spkr", queryset=CharacterInstance.objects.select_related("char")),
+            Prefetch("addr", queryset=CharacterInstance.objects.select_related("char")),
+            "tags",
         )
         
         return qs
             
 
-class AppSpeechList(SpeechQueryMixin, ListView):
+class AppSpeechList(KeysetPaginationMixin, SpeechQueryMixin, ListView):
     model = Speech
     template_name = 'speechdb/speech_list.html'
     
     def dispatch(self, request, *args, **kwargs):
         if not os.getenv("DEVEL"):
             if not request.GET:
-                return cache_page(60 * 15)(super().dispatch)(request, *args, **kwargs)
+                # versioned, so edits show up at once
+                key_prefix = f"gen{current_generation()}"
+                return cache_page(60 * 15, key_prefix=key_prefix)(super().dispatch)(request, *args, **kwargs)
         return super().dispatch(request, *args, **kwargs)
-        
+
+    def match_bitmap(self):
+        '''(index, bits) matching the search in the bitmap index, where
+            enabled and able to answer it; else None
+        '''
+        if not hasattr(self, "_bitmap"):
+            self._bitmap = None
+            if settings.SPEECH_BITMAP_INDEX and self.params is not None:
+                index = get_index()
+                bits = index.match(self.params)
+                if bits is not None:
+                    self._bitmap = (index, bits)
+        return self._bitmap
+
+    def paginate_ids(self, after, before, page_size):
+        '''page of matching ids from the bitmap index, where enabled'''
+        if self.match_bitmap() is None:
+            return super().paginate_ids(after, before, page_size)
+        index, bits = self.match_bitmap()
+        return index.page(bits, after, before, page_size)
+
+    def count_results(self):
+        if self.match_bitmap() is None:
+            return super().count_results()
+        index, bits = self.match_bitmap()
+        return index.count(bits)
+
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
         context = super().get_context_data(**kwargs)
@@ -1401,9 +1221,18 @@ class AppSpeechList(SpeechQueryMixin, ListView):
         context["spkr_instance_form"] = InstanceForm(self.request.GET, prefix="spkr")
         context["addr_character_form"] = CharacterForm(self.request.GET, prefix="addr")
         context["addr_instance_form"] = InstanceForm(self.request.GET, prefix="addr")
+        context["any_character_form"] = CharacterForm(self.request.GET)
+        context["any_instance_form"] = InstanceForm(self.request.GET)
         context["speech_form"] = SpeechForm(self.request.GET)      
         context["text_form"] = TextForm(self.request.GET)
         context["active"] = "speeches"
+
+        # result counts next to each filter option
+        if self.params is not None:
+            counts = facet_counts(self.params)
+            for form in ("spkr_character_form", "spkr_instance_form", "addr_character_form",
+                         "addr_instance_form", "speech_form", "text_form"):
+                show_facet_counts(context[form], counts)
         context["csv_url_name"] = "app:speeches_csv"
 
         # CTS reader
@@ -1412,7 +1241,7 @@ class AppSpeechList(SpeechQueryMixin, ListView):
         return context
     
 
-class AppSpeechCSV(SpeechQueryMixin, View):
+class AppSpeechCSV(SpeechQueryMixin, CSVExportMixin, View):
     '''export speech list as a CSV text file'''
 
     filename = "speeches.csv"
@@ -1434,29 +1263,17 @@ class AppSpeechCSV(SpeechQueryMixin, View):
         ("embedded_level", lambda s: s.level),
     ]
 
-    def get(self, request):
-        qs = self.get_queryset()
-
-        response = HttpResponse(
-            content_type="text/csv",
-            headers={"Content-Disposition": f'attachment; filename="{self.filename}"'},
-        )
+    # QUOTE_NONNUMERIC: quote every string field (e.g. "1.59" or "1,59")
+    # so Excel doesn't try to interpret book.line loci as numbers/dates
+    quoting = csv.QUOTE_NONNUMERIC
 
-        # QUOTE_NONNUMERIC: quote every string field (e.g. "1.59" or "1,59")
-        # so Excel doesn't try to interpret book.line loci as numbers/dates
-        writer = csv.writer(response, quoting=csv.QUOTE_NONNUMERIC)
-        writer.writerow([label for label, _ in self.fields])
 
-        for s in qs:
-            writer.writerow([accessor(s) for _, accessor in self.fields])
-
-        return response
-
-
-class SpeechClusterQueryMixin:
+class SpeechClusterQueryMixin(CachedResultsMixin):
     '''validate and assemble speech cluster query params
         - designed to be reused by HTML and CSV views
     '''
+    result_name = "clusters"
+    keyset = ("seq", "id")
     login_url = reverse_lazy("app:login")
 
     @property
@@ -1475,428 +1292,31 @@ class SpeechClusterQueryMixin:
         # short-circuit if search params are malformed
         if params is None:
             return SpeechCluster.objects.none()
-                            
-        # initial set of objects plus annotations
-        qs = SpeechCluster.objects.annotate(
-            speech_count = Count('speeches', distinct=True),
+
+        # a cluster matches when one of its speeches matches all the
+        #   speech search params: one subquery of cluster ids, so the
+        #   database picks the clusters and nothing fans out
+        qs = SpeechCluster.objects.all()
+        query = compile_speech_filters(params)
+        if query:
+            qs = qs.filter(pk__in=Speech.objects.filter(*query).values("cluster"))
+
+        # size from the denormalized column, rather than a GROUP BY;
+        #   prefetches run only for the rows actually fetched (one page,
+        #   or one export chunk)
+        sizes = Speech.objects.filter(cluster=OuterRef("pk")).values("cluster_size")[:1]
+        qs = qs.annotate(
+            speech_count = Coalesce(Subquery(sizes), 0),
         ).prefetch_related(
-            "speeches__spkr", "speeches__addr", "speeches__work",
+            Prefetch("speeches", queryset=Speech.objects.select_related("work__author")),
+            Prefetch("speeches__spkr", queryset=CharacterInstance.objects.select_related("char")),
+            Prefetch("speeches__addr", queryset=CharacterInstance.objects.select_related("char")),
         )
 
-        # construct query
-        query = []
-
-        #
-        # any participant
-        #
-        
-        # any participant by character primary key
-        if "char_id" in params:
-            q = Q()
-            for pk in params["char_id"]:
-                q |= Q(speeches__spkr__char__pk=pk)
-                q |= Q(speeches__addr__char__pk=pk)
-            query.append(q)
-
-        # any participant by character public id
-        if "char_pubid" in params:
-            q = Q()
-            for pubid in params["char_pubid"]:
-                q |= Q(speeches__spkr__char__public_id=pubid)
-                q |= Q(speeches__addr__char__public_id=pubid)
-            query.append(q)
-        
-        # any participant by character name
-        if "char_name" in params:
-            q = Q()
-            for name in params["char_name"]:
-                q |= Q(speeches__spkr__char__name=name)
-                q |= Q(speeches__addr__char__name=name)
-            query.append(q)
-
-        # any participant by character being
-        if "char_being" in params:
-            q = Q()
-            for being in params["char_being"]:
-                q |= Q(speeches__spkr__char__being=being)
-                q |= Q(speeches__addr__char__being=being)
-            query.append(q)
+        return qs.order_by(*self.keyset)
 
-        # any participant by character gender
-        if "char_gender" in params:
-            q = Q()
-            for gender in params["gender"]:
-                q |= Q(speeches__spkr__char__gender=gender) 
-                q |= Q(speeches__addr__char__gender=gender)
-            query.append(q)
-            
-        # any participant by instance primary key
-        if "inst_id" in params:
-            q = Q()
-            for pk in params["inst_id"]:
-                q |= Q(speeches__spkr__pk=pk)
-                q |= Q(speeches__addr__pk=pk)
-            query.append(q)
 
-        # any participant by instance public id
-        if "inst_pubid" in params:
-            q = Q()
-            for pubid in params["inst_pubid"]:
-                q |= Q(speeches__spkr__public_id=pubid)
-                q |= Q(speeches__addr__public_id=pubid)
-            query.append(q)
-        
-        # any participant by instance name
-        if "inst_name" in params:
-            q = Q()
-            for name in params["inst_name"]:
-                q |= Q(speeches__spkr__name=name) | Q(speeches__spkr__display=name, speeches__spkr__anon=True)
-                q |= Q(speeches__addr__name=name) | Q(speeches__addr__display=name, speeches__addr__anon=True)
-            query.append(q)
-
-        # any participant by instance being
-        if "inst_being" in params:
-            q = Q()
-            for being in params["char_being"]:
-                q |= Q(speeches__spkr__being=being)
-                q |= Q(speeches__addr__being=being)
-            query.append(q)
-
-        # any participant by instance gender
-        if "inst_gender" in params:
-            q = Q()
-            for gender in params["gender"]:
-                q |= Q(speeches__spkr__gender=gender)
-                q |= Q(speeches__addr__gender=gender)
-            query.append(q)
-                    
-        # any participant disguised
-        if "inst_disguised" in params:
-            q = Q()
-            for disg in params["inst_disguised"]:
-                q |= Q(speeches__spkr__disguise__isnull=not(disg))
-                q |= Q(speeches__addr__disguise__isnull=not(disg))                
-            query.append(q)   
-
-        # any participant anonymous
-        if "inst_anon" in params:
-            q = Q()
-            for anon in params["inst_anon"]:
-                q |= Q(speeches__spkr__anon=anon)
-                q |= Q(speeches__addr__anon=anon)
-            query.append(q)
-                    
-        #
-        # speaker
-        #
-                    
-        # speaker by character primary key (old id)
-        if "spkr_char_id" in params:
-            q = Q()
-            for pk in params["spkr_char_id"]:
-                q |= Q(speeches__spkr__char__pk=pk)
-            query.append(q)
-
-        # speaker by character public id
-        if "spkr_char_pubid" in params:
-            q = Q()
-            for pubid in params["spkr_char_pubid"]:
-                q |= Q(speeches__spkr__char__public_id=pubid)
-            query.append(q)
-                    
-        # speaker by character name
-        if "spkr_char_name" in params:
-            q = Q()
-            for name in params["spkr_char_name"]:
-                q |= Q(speeches__spkr__char__name=name)
-            query.append(q)
-
-        # speaker by character being
-        if "spkr_char_being" in params:
-            q = Q()
-            for being in params["spkr_char_being"]:
-                q |= Q(speeches__spkr__char__being=being)
-            query.append(q)
-
-        # speaker by character number
-        if "spkr_char_number" in params:
-            q = Q()
-            for number in params["spkr_char_number"]:
-                q |= Q(speeches__spkr__char__number=number)
-            query.append(q)
-
-        # speaker by character gender
-        if "spkr_gender" in params:
-            q = Q()
-            for gender in params["gender"]:
-                q |= Q(speeches__spkr__char__gender=gender)
-            query.append(q)
-        
-        # speaker by instance primary key
-        if "spkr_inst_id" in params:
-            q = Q()
-            for pk in params["spkr_inst_id"]:
-                q |= Q(speeches__spkr__pk=pk)
-            query.append(q)
-
-        # speaker by instance public id
-        if "spkr_inst_pubid" in params:
-            q = Q()
-            for pubid in params["spkr_inst_pubid"]:
-                q |= Q(speeches__spkr__public_id=pubid)
-            query.append(q)
-        
-        # speaker by instance name
-        if "spkr_inst_name" in params:
-            q = Q()
-            for name in params["spkr_inst_name"]:
-                q |= Q(speeches__spkr__name=name) | Q(speeches__spkr__display=name, speeches__spkr__anon=True)
-            query.append(q)
-            
-        # speaker instance being
-        if "spkr_inst_being" in params:
-            q = Q()
-            for being in params["spkr_inst_being"]:
-                q |= Q(speeches__spkr__being=being)
-            query.append(q)
-
-        # speaker instance gender
-        if "spkr_inst_gender" in params:
-            q = Q()
-            for gender in params["spkr_inst_gender"]:
-                q |= Q(speeches__spkr__gender=gender)
-            query.append(q)
-
-        # speaker instance number
-        if "spkr_inst_number" in params:
-            q = Q()
-            for number in params["spkr_inst_number"]:
-                q |= Q(speeches__spkr__number=number)
-            query.append(q)
-        
-        # speaker instance disguised
-        if "spkr_inst_disguised" in params:
-            q = Q()
-            for disg in params["spkr_inst_disguised"]:
-                q |= Q(speeches__spkr__disguise__isnull=not(disg))                
-            query.append(q)   
-
-        # speaker instance anonymous
-        if "spkr_inst_anon" in params:
-            q = Q()
-            for anon in params["spkr_inst_anon"]:
-                q |= Q(speeches__spkr__anon=anon)
-            query.append(q)
-        
-        #
-        # addressee
-        #
-        
-        # addressee by character primary key
-        if "addr_char_id" in params:
-            q = Q()
-            for pk in params["addr_char_id"]:
-                q |= Q(speeches__addr__char__pk=pk)
-            query.append(q)
-                    
-        # addressee by character public id
-        if "addr_char_pubid" in params:
-            q = Q()
-            for id in params["addr_char_pubid"]:
-                q |= Q(speeches__addr__char__public_id=pubid)
-            query.append(q)
-
-        # addressee by character name
-        if "addr_char_name" in params:
-            q = Q()
-            for name in params["addr_char_name"]:
-                q |= Q(speeches__addr__char__name=name)
-            query.append(q)
-
-        # addressee by character being
-        if "addr_char_being" in params:
-            q = Q()
-            for being in params["addr_char_being"]:
-                q |= Q(speeches__addr__char__being=being)
-            query.append(q)
-
-        # addressee by character number
-        if "addr_char_number" in params:
-            q = Q()
-            for number in params["addr_char_number"]:
-                q |= Q(speeches__addr__char__number=number)
-            query.append(q)
-
-        # addressee by character gender
-        if "addr_gender" in params:
-            q = Q()
-            for gender in params["gender"]:
-                q |= Q(speeches__addr__char__gender=gender)
-            query.append(q)
-        
-        # addressee by instance primary key
-        if "addr_inst_id" in params:
-            q = Q()
-            for pk in params["addr_inst_id"]:
-                q |= Q(speeches__addr__pk=pk)
-            query.append(q)
-
-        # addressee by instance public id
-        if "addr_inst_pubid" in params:
-            q = Q()
-            for pubid in params["addr_inst_pubid"]:
-                q |= Q(speeches__addr__public_id=pubid)
-            query.append(q)
-        
-        # addressee by instance name
-        if "addr_inst_name" in params:
-            q = Q()
-            for name in params["addr_inst_name"]:
-                q |= Q(speeches__addr__name=name) | Q(speeches__addr__display=name, speeches__addr__anon=True)
-            query.append(q)
-            
-        # addressee instance being
-        if "addr_inst_being" in params:
-            q = Q()
-            for being in params["addr_inst_being"]:
-                q |= Q(speeches__addr__being=being)
-            query.append(q)
-
-        # addressee instance gender
-        if "addr_inst_gender" in params:
-            q = Q()
-            for gender in params["addr_inst_gender"]:
-                q |= Q(speeches__addr__gender=gender)
-            query.append(q)
-
-        # addressee instance number
-        if "addr_inst_number" in params:
-            q = q()
-            for number in params["addr_inst_number"]:
-                q |= Q(speeches__addr__number=number)
-            query.append(q)
-        
-        # addressee instance disguised
-        if "addr_inst_disguised" in params:
-            q = Q()
-            for disg in params["addr_inst_disguised"]:
-                q |= Q(speeches__addr__disguise__isnull=not(disg))                
-            query.append(q)   
-
-        # addressee instance anonymous
-        if "addr_inst_anon" in params:
-            q = Q()
-            for anon in params["addr_inst_anon"]:
-                q |= Q(speeches__addr__anon=anon)
-            query.append(q)
-
-        #
-        # speech properties
-        #
-
-        # cluster primary key (old id)
-        if "cluster_id" in params:
-            q = Q()
-            for pk in params["cluster_id"]:
-                q |= Q(pk=pk)
-            query.append(q)
-
-        # cluster public id
-        if "cluster_pubid" in params:
-            q = Q()
-            for pubid in params["cluster_pubid"]:
-                q |= Q(public_id=pubid)
-            query.append(q)
-                        
-        # turns in cluster
-        if "n_parts" in params:
-            q = Q()
-            for n in params["n_parts"]:
-                q |= Q(speech_count=n)
-            query.append(q)
-
-        # turn type
-        if "type" in params:
-            q = Q()
-            for type_ in params["type"]:
-                q |= Q(speeches__type=type_)
-            query.append(q)
-            
-        # embedded level
-        if "level" in params:
-            q = Q()
-            for level in params["level"]:
-                q |= Q(speeches__level=level)
-            query.append(q)
-
-        # speech tags
-        if "tags" in params:
-            q = Q()
-            for tag in params["tags"]:
-                q |= Q(speeches__tags__type=tag)
-            query.append(q)
-        
-        #
-        # work properties
-        #
-        
-        # work primary key
-        if "work_id" in params:
-            q = Q()
-            for pk in params["work_id"]:
-                q |= Q(speeches__work__pk=pk)
-            query.append(q)
-
-        # work public id
-        if "work_pubid" in params:
-            q = Q()
-            for id in params["work_pubid"]:
-                q |= Q(speeches__work__public_id=pubid)
-            query.append(q)
-        
-        # work title
-        if "work_title" in params:
-            q = Q()
-            for title in params["work_title"]:
-                q |= Q(speeches__work__title=title)
-            query.append(q)
-            
-        # author primary key (old id)
-        if "author_id" in params:
-            q = Q()
-            for pk in params["author_id"]:
-                q |= Q(speeches__work__author__pk=pk)
-            query.append(q)
-        
-        # author public id
-        if "author_pubid" in params:
-            q = Q()
-            for pubid in params["author_pubid"]:
-                q |= Q(speeches__work__author__public_id=pubid)
-            query.append(q)
-        
-        # author name
-        if "author_name" in params:
-            q = Q()
-            for name in params["author_name"]:
-                q |= Q(speeches__work__author__name=name)
-            query.append(q)
-            
-        # language
-        if "work_lang" in params:
-            q = Q()
-            for lang in params["work_lang"]:
-                q |= Q(speeches__work__lang=lang)
-            query.append(q)        
-                
-        # execute query
-        qs = qs.filter(*query).distinct()
-        qs = qs.order_by('seq')
-         
-        return qs
-
-
-class AppSpeechClusterList(SpeechClusterQueryMixin, ListView):
+class AppSpeechClusterList(KeysetPaginationMixin, SpeechClusterQueryMixin, ListView):
     model = SpeechCluster
     template_name = 'speechdb/speechcluster_list.html'
     
@@ -1909,6 +1329,8 @@ class AppSpeechClusterList(SpeechClusterQueryMixin, ListView):
         context["spkr_instance_form"] = InstanceForm(self.request.GET, prefix="spkr")
         context["addr_character_form"] = CharacterForm(self.request.GET, prefix="addr")
         context["addr_instance_form"] = InstanceForm(self.request.GET, prefix="addr")  
+        context["any_character_form"] = CharacterForm(self.request.GET)
+        context["any_instance_form"] = InstanceForm(self.request.GET)
         context["speech_form"] = SpeechForm(self.request.GET)      
         context["text_form"] = TextForm(self.request.GET)
         context["csv_url_name"] = "app:clusters_csv"
@@ -1917,7 +1339,7 @@ class AppSpeechClusterList(SpeechClusterQueryMixin, ListView):
         return context
 
 
-class AppSpeechClusterCSV(SpeechClusterQueryMixin, View):
+class AppSpeechClusterCSV(SpeechClusterQueryMixin, CSVExportMixin, View):
     '''export speech cluster list as a CSV text file'''
 
     filename = "clusters.csv"
@@ -1927,22 +1349,6 @@ class AppSpeechClusterCSV(SpeechClusterQueryMixin, View):
         ("parts", lambda cl: cl.speech_count),
         ("participants", lambda cl: cl.get_chars_str()),
     ]
-
-    def get(self, request):
-        qs = self.get_queryset()
-
-        response = HttpResponse(
-            content_type="text/csv",
-            headers={"Content-Disposition": f'attachment; filename="{self.filename}"'},
-        )
-
-        writer = csv.writer(response)
-        writer.writerow([label for label, _ in self.fields])
-
-        for cl in qs:
-            writer.writerow([accessor(cl) for _, accessor in self.fields])
-
-        return response
         
 
 
@@ -1975,6 +1381,10 @@ class AppSpeechDetail(DetailView):
         context = super().get_context_data(**kwargs)
         # add useful info
         context['reader'] = CTS_READER
+
+        # ancestor path and subtree, one query each from the closure table
+        context['ancestors'] = self.object.get_ancestors().prefetch_related("spkr")
+        context['descendants'] = self.object.get_descendants().prefetch_related("spkr")
                 
         return context
 